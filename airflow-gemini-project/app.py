@@ -2,24 +2,35 @@ import streamlit as st
 import pandas as pd
 import glob
 import os
-import importlib.util
 import google.generativeai as genai
 import re
 import requests
 from requests.auth import HTTPBasicAuth
-import time
+import sys
+
+# Make the shared DAG helpers (dags/utils) importable, like Airflow does
+sys.path.append("dags")
+from utils.vectorized import to_arrow_table
+from utils.module_loader import load_module_from_file
+from utils.response_cache import cached_generate
+from utils.airflow_api import AirflowClient
+from utils.export import current_export
+from utils.dataset_info import dataset_stats, preview
+from utils.dashboard import monitor_dag_run, render_telemetry_panel
 
 # --- Configuration ---
 GENERATOR_FILE_PATH = "dags/utils/generator.py"
 DATA_DIR = "data/generated_users"
 CONSOLIDATED_FILE = "data/full_dataset.csv.gz"
 DAG_ID = "ai_data_generator_1M"
+GEMINI_MODEL_NAME = "gemini-2.5-pro"
 
 # --- Airflow API Configuration ---
 AIRFLOW_API_URL = os.environ.get("AIRFLOW_API_URL", "http://airflow-webserver:8080/api/v1")
 AIRFLOW_USER = os.environ.get("AIRFLOW_USER", "airflow")
 AIRFLOW_PASS = os.environ.get("AIRFLOW_PASS", "airflow")
 AIRFLOW_AUTH = HTTPBasicAuth(AIRFLOW_USER, AIRFLOW_PASS)
+BATCH_TASK_IDS = ["generate_and_save_batch"] # Mapped tasks counted by the progress bar (pool mode is followed through telemetry)
 
 st.set_page_config(layout="wide", page_title="AI Data Manager")
 st.title("🤖 AI Data Generator & Manager")
@@ -45,6 +56,10 @@ def generate_data():
 
 def save_generator_code(code_text):
     try:
+        # Leave an unchanged file untouched, so Airflow workers keep their
+        # loaded generator module and the batch manifest stays valid
+        if os.path.exists(GENERATOR_FILE_PATH) and load_generator_code() == code_text:
+            return True
         with open(GENERATOR_FILE_PATH, "w") as f:
             f.write(code_text)
         return True
@@ -57,10 +72,12 @@ def test_generator_function():
         st.error("Please save the generated code before testing.")
         return None
     try:
-        spec = importlib.util.spec_from_file_location("generator", GENERATOR_FILE_PATH)
-        generator_module = importlib.util.module_from_spec(spec)
-        importlib.invalidate_caches()
-        spec.loader.exec_module(generator_module)
+        # Re-executes the file only if it changed since the last test
+        generator_module = load_module_from_file(GENERATOR_FILE_PATH, "generator")
+        # Prefer the vectorized batch form, like the DAG does
+        generate_batch = getattr(generator_module, "generate_batch", None)
+        if generate_batch is not None:
+            return to_arrow_table(generate_batch(10, seed=0)).to_pandas()
         generate_func = getattr(generator_module, "generate_data")
         data = [generate_func() for _ in range(10)]
         return pd.DataFrame(data)
@@ -69,70 +86,58 @@ def test_generator_function():
         st.error("Did you save valid Python code? Does the function 'generate_data' exist?")
         return None
 
-def consolidate_data(parquet_files):
-    try:
-        df_list = [pd.read_parquet(f) for f in parquet_files]
-        full_df = pd.concat(df_list, ignore_index=True)
-        full_df.to_csv(CONSOLIDATED_FILE, index=False, compression="gzip")
-        return full_df.shape
-    except Exception as e:
-        st.error(f"Failed to consolidate files: {e}")
-        return None
-
 def clean_gemini_response(text):
     text = text.replace("```python", "").replace("```", "")
     return text.strip()
 
 # --- Airflow API Functions ---
 
-def trigger_airflow_dag():
-    url = f"{AIRFLOW_API_URL}/dags/{DAG_ID}/dagRuns"
-    headers = {"Content-Type": "application/json"}
-    body = {"conf": {}}
+def trigger_airflow_dag(seed=None, export_csv_gz=False):
+    # Every batch is seeded from this run seed, so the same seed reproduces the same data
+    conf = {"seed": seed} if seed is not None else {}
+    if export_csv_gz:
+        # The DAG builds the download file after the batches (export_dataset task)
+        conf["export_csv_gz"] = True
     
     try:
-        response = requests.post(url, auth=AIRFLOW_AUTH, headers=headers, json=body)
-        response.raise_for_status() 
-        data = response.json()
-        dag_run_id = data.get("dag_run_id")
+        dag_run_id = airflow_client().trigger(conf)
         st.session_state.dag_run_id = dag_run_id
         return dag_run_id
     except requests.exceptions.RequestException as e:
         st.error(f"Failed to trigger DAG. Is Airflow running? Error: {e}")
         return None
 
-def get_dag_run_status():
-    if "dag_run_id" not in st.session_state:
-        return None
-        
-    dag_run_id = st.session_state.dag_run_id
-    url = f"{AIRFLOW_API_URL}/dags/{DAG_ID}/dagRuns/{dag_run_id}"
-    
-    try:
-        response = requests.get(url, auth=AIRFLOW_AUTH)
-        response.raise_for_status()
-        data = response.json()
-        return data.get("state") 
-    except requests.exceptions.RequestException as e:
-        st.error(f"Failed to get DAG status: {e}")
-        return "failed" 
+@st.cache_resource
+def airflow_client():
+    """One pooled, retrying API client shared by all reruns and sessions."""
+    return AirflowClient(AIRFLOW_API_URL, DAG_ID, auth=AIRFLOW_AUTH)
 
 # --- Gemini Code Generation Function ---
 
-def call_gemini_api(user_prompt, api_key):
+def call_gemini_api(user_prompt, api_key, bypass_cache=False):
     try:
         genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.5-pro') 
+        model = genai.GenerativeModel(GEMINI_MODEL_NAME)
         
         full_prompt = f"""
         You are an expert Python code generator. Your task is to write a single Python script that uses the Faker library to generate synthetic data.
 
         RULES:
-        1.  The script MUST include all necessary imports: `from faker import Faker`, `from uuid import uuid4`, `from datetime import datetime`, `import random`.
-        2.  It MUST initialize Faker: `fake = Faker()`.
+        1.  The script MUST include all necessary imports: `from faker import Faker`, `from datetime import datetime, timedelta`, `import random`, `import numpy as np`, and `from utils.vectorized import faker_pool, sample_pool, sample_joined, unique_emails, random_ints, random_floats, random_datetimes, bulk_uuids`.
+        2.  It MUST initialize Faker: `fake = Faker()`, and define a fixed `REFERENCE_DATE = datetime(2025, 1, 1)`. NEVER use `datetime.now()`: all dates are relative to `REFERENCE_DATE` so seeded runs are reproducible.
         3.  It MUST define one function named `generate_data()`.
         4.  The `generate_data()` function MUST take no arguments and return a single Python dictionary.
-        5.  **CRITICAL RULE:** You MUST use only valid Faker provider methods. Do NOT make up method names.
+        5.  It MUST ALSO define a function named `generate_batch(n, seed, start=0)` that returns the SAME columns for rows `start` to `start + n` at once, as a dictionary mapping each column name to a NumPy array of length `n`.
+            * Start it with `rng = np.random.default_rng(seed)` and `fake.seed_instance(seed)`.
+            * Do NOT loop over rows. Build every column with ONE call to the helpers below:
+            * For any other Faker value (company, job, city, ...), use `sample_pool(rng, faker_pool(fake, 'company'), n)`.
+            * For a full name, use `sample_joined(rng, [faker_pool(fake, 'first_name'), faker_pool(fake, 'last_name')], n)`.
+            * For an email, use `unique_emails(rng, faker_pool(fake, 'email'), n, start)`, so every email is unique.
+            * For a UUID, use `bulk_uuids(rng, n)`.
+            * For a random integer, use `random_ints(rng, a, b, n)`.
+            * For a random float, use `random_floats(rng, a, b, n, decimals=2)`.
+            * For a date, use `random_datetimes(rng, start_datetime, end_datetime, n)` with `datetime` objects (e.g. `REFERENCE_DATE - timedelta(days=365)`).
+        6.  **CRITICAL RULE:** You MUST use only valid Faker provider methods. Do NOT make up method names.
             * For a **product name**, use `fake.catch_phrase()` or `fake.bs()`.
             * For a company name, use `fake.company()`.
             * For a job title, use `fake.job()`.
@@ -140,20 +145,23 @@ def call_gemini_api(user_prompt, api_key):
             * For text, use `fake.sentence()`.
             * For a full name, use `fake.name()`.
             * For an email, use `fake.email()`.
-            * For a UUID, use `str(uuid4())`.
+            * For a UUID, use `fake.uuid4()` (NOT `uuid4()`, which cannot be seeded).
             * For a random integer, use `random.randint(a, b)`.
             * For a random float, use `random.uniform(a, b)`.
-            * For a date, use `fake.date_time_between()`.
-        6.  The dictionary keys and value types should be based on the user's request, using ONLY the valid methods listed above.
-        7.  Respond ONLY with the complete, runnable Python code. Do not include markdown (```python) or any other explanation or text.
+            * For a date, use `fake.date_time_between(start_date=..., end_date=...)` with `datetime` bounds relative to `REFERENCE_DATE`.
+        7.  The dictionary keys and value types should be based on the user's request, using ONLY the valid methods listed above.
+        8.  Respond ONLY with the complete, runnable Python code. Do not include markdown (```python) or any other explanation or text.
 
         USER REQUEST:
         "Generate data for: {user_prompt}"
         """
         
-        response = model.generate_content(full_prompt)
-        cleaned_response = response.text.replace("```python", "").replace("```", "").strip()
-        return cleaned_response
+        def _generate():
+            response = model.generate_content(full_prompt)
+            return response.text.replace("```python", "").replace("```", "").strip()
+
+        # Identical prompts are answered from the response cache
+        return cached_generate(_generate, GEMINI_MODEL_NAME, full_prompt, bypass=bypass_cache)
     
     except Exception as e:
         st.error(f"Error calling Gemini API: {e}")
@@ -183,10 +191,11 @@ else:
                                height=100,
                                placeholder="e.g., 'A customer order with an order_id, product_name, quantity, price, and order_date.'")
     
+    fresh_response = st.checkbox("Skip the response cache (ask Gemini again)", value=False)
     if st.button("Generate Code", use_container_width=True):
         if user_prompt:
             with st.spinner("Calling Gemini API..."):
-                generated_code = call_gemini_api(user_prompt, API_KEY)
+                generated_code = call_gemini_api(user_prompt, API_KEY, bypass_cache=fresh_response)
             if generated_code:
                 # --- THIS IS THE FIX ---
                 # 1. Update the code in the state
@@ -239,12 +248,14 @@ if "test_data" in st.session_state and st.session_state.test_data is not None an
 st.markdown("---")
 # Only show the "Start" button if the code has been saved
 if st.session_state.code_is_saved:
+    run_seed = st.number_input("Random seed (the same seed reproduces the same dataset)", min_value=0, value=42, step=1)
+    build_export = st.checkbox("Also build full_dataset.csv.gz for download", value=True)
     if st.button("🚀 Start Data Generation (1 Million Rows)", type="primary", use_container_width=True):
         # Final check: make sure the code in the editor is what's saved
         if st.session_state[editor_key] != load_generator_code():
              st.warning("Your latest edits are not saved. Please click 'Save Code' first.")
         else:
-            dag_run_id = trigger_airflow_dag()
+            dag_run_id = trigger_airflow_dag(int(run_seed), export_csv_gz=build_export)
             if dag_run_id:
                 st.session_state.monitoring_dag = True
                 st.info(f"Successfully triggered Airflow DAG run: `{dag_run_id}`")
@@ -256,23 +267,14 @@ else:
 
 # Polling logic
 if st.session_state.get("monitoring_dag", False):
-    with st.spinner("Data generation in progress... This may take several minutes. Polling Airflow every 10 seconds."):
-        status = "running"
-        while status == "running":
-            time.sleep(10) 
-            status = get_dag_run_status()
-        
-        if status == "success":
-            st.success("Data generation complete! ✅")
-            st.balloons()
-            st.session_state.monitoring_dag = False
-            st.rerun() # Rerun the page to make the download section appear
-            
-        elif status == "failed":
-            st.error(f"DAG run {st.session_state.dag_run_id} failed. Please check the Airflow UI for logs.")
-            st.session_state.monitoring_dag = False
-        else:
-            st.info(f"DAG run status: {status}")
+    monitor_dag_run(airflow_client(), BATCH_TASK_IDS, "batches")
+
+run_result = st.session_state.pop("dag_run_result", None)
+if run_result == "success":
+    st.success("Data generation complete! ✅")
+    st.balloons()
+elif run_result == "failed":
+    st.error(f"DAG run {st.session_state.dag_run_id} failed. Please check the Airflow UI for logs.")
 
 # --- Validate & Download Section ---
 
@@ -288,36 +290,52 @@ else:
     st.success(f"Found {len(parquet_files)} data files (batches).")
     st.subheader("Data Validation (Sample from first batch)")
     try:
-        sample_df = pd.read_parquet( parquet_files[0] )
-        st.dataframe(sample_df.head(100), hide_index=True)
-        
-        total_rows_estimate = len(parquet_files) * (sample_df.shape[0] if not sample_df.empty else 10000)
-        col1, col2 = st.columns(2)
+        # Counts and types come from the Parquet footers; only the preview rows are read
+        stats = dataset_stats(parquet_files)
+        st.dataframe(preview(parquet_files[0]).to_pandas(), hide_index=True)
+
+        col1, col2, col3 = st.columns(3)
         col1.metric("Total Files Found", f"{len(parquet_files)}")
-        col2.metric("Estimated Total Rows", f"~{total_rows_estimate:,}")
+        col2.metric("Total Rows", f"{stats['rows']:,}")
+        col3.metric("Size on Disk", f"{stats['bytes'] / 1e6:.1f} MB")
+        with st.expander("Columns and per-file row counts"):
+            st.dataframe(pd.DataFrame(stats["columns"]), hide_index=True)
+            st.dataframe(
+                pd.DataFrame([{"file": os.path.basename(f["path"]), "rows": f["rows"], "row_groups": f["row_groups"],
+                               "MB": round(f["bytes"] / 1e6, 2)} for f in stats["files"]]),
+                hide_index=True
+            )
 
     except Exception as e:
         st.error(f"Failed to read sample file {parquet_files[0]}: {e}")
 
     st.subheader("Download Full 1M Row Dataset")
-    
-    if st.button("Combine all files into a single CSV.gz", type="primary"):
-        with st.spinner(f"Consolidating {len(parquet_files)} files... This may take a moment."):
-            shape = consolidate_data(parquet_files)
-        if shape:
-            st.session_state.consolidation_complete = True
-            st.session_state.consolidated_shape = shape
-            st.success(f"Successfully consolidated {shape[0]:,} rows and {shape[1]} columns.")
-    
-    if st.session_state.get("consolidation_complete", False):
-        try:
+
+    # The CSV.gz is built by the DAG's export task; only an export of
+    # exactly the current batch files is offered
+    export_entry = current_export(CONSOLIDATED_FILE, parquet_files)
+    if export_entry:
+        st.success(f"Export ready: {export_entry['rows']:,} rows, {export_entry['bytes'] / 1e6:.1f} MB.")
+        # A download button holds the whole file in memory for as long as it is shown,
+        # so it is only created on request and removed once it has been used
+        if st.session_state.get("csv_download") == export_entry["checksum"]:
             with open(CONSOLIDATED_FILE, "rb") as f:
                 st.download_button(
                     label="⬇️ Download full_dataset.csv.gz",
                     data=f,
                     file_name="full_dataset.csv.gz",
                     mime="application/gzip",
+                    on_click=lambda: st.session_state.pop("csv_download", None),
                     use_container_width=True
                 )
-        except FileNotFoundError:
-            st.error("Consolidated file not found. Please click 'Combine' again.")
\ No newline at end of file
+        elif st.button("🔗 Get download for full_dataset.csv.gz", use_container_width=True):
+            st.session_state.csv_download = export_entry["checksum"]
+            st.rerun()
+    else:
+        st.info("No up-to-date full_dataset.csv.gz yet. Start a generation run with "
+                "'Also build full_dataset.csv.gz for download' checked, or trigger the DAG "
+                "with {\"export_csv_gz\": true} in its conf.")
+
+st.markdown("---")
+st.subheader("📈 Run Telemetry")
+render_telemetry_panel(DAG_ID, "batches")
@@ -6,21 +6,35 @@ import google.generativeai as genai
 import re
 import requests
 from requests.auth import HTTPBasicAuth
-import time
 import json
-import zipfile  
-import io       
+import sys
+
+# Make the shared DAG helpers (dags/utils) importable, like Airflow does
+sys.path.append("dags")
+from utils.distributions import DISTRIBUTION_TYPES, MAX_EXPLICIT_WEIGHTS
+from utils.response_cache import cached_generate
+from utils.airflow_api import AirflowClient
+from utils.export import current_zip_export, export_zip
+from utils.dataset_info import dataset_stats, preview
+from utils.dashboard import monitor_dag_run, render_telemetry_panel
 
 # --- Configuration ---
 GENERATOR_FILE_PATH = "dags/utils/database_generator.py"
+SCHEMA_FILE_PATH = "dags/utils/database_schema.json" # Read by the DAG to plan its tasks
 DATA_DIR = "data/generated_users"
+ZIP_EXPORT_PATH = "data/exports/generated_database.zip" # Built on disk, reused until the tables change
 DAG_ID = "ai_database_generator" # Make sure this matches your DAG's dag_id
+GEMINI_MODEL_NAME = "gemini-2.5-pro"
+# Tables are streamed to Parquet one batch at a time, so memory no longer
+# limits the row count. This cap only guards against typos.
+MAX_ROWS_PER_TABLE = 50_000_000
 
 # --- Airflow API Configuration ---
 AIRFLOW_API_URL = os.environ.get("AIRFLOW_API_URL", "http://airflow-webserver:8080/api/v1")
 AIRFLOW_USER = os.environ.get("AIRFLOW_USER", "airflow")
 AIRFLOW_PASS = os.environ.get("AIRFLOW_PASS", "airflow")
 AIRFLOW_AUTH = HTTPBasicAuth(AIRFLOW_USER, AIRFLOW_PASS)
+BATCH_TASK_IDS = ["generate_dimension_partition", "generate_fact_partition"] # Mapped tasks counted by the progress bar
 
 st.set_page_config(layout="wide", page_title="AI Database Generator")
 st.title("🤖 AI Multi-Table Database Generator")
@@ -42,77 +56,74 @@ def save_generator_code(code_text):
         st.error(f"Failed to save file: {e}")
         return False
 
+def save_schema(tables):
+    """Saves the table definitions so the DAG can plan per-table tasks."""
+    try:
+        with open(SCHEMA_FILE_PATH, "w") as f:
+            json.dump(tables, f, indent=2)
+        return True
+    except Exception as e:
+        st.error(f"Failed to save schema: {e}")
+        return False
+
+def find_table_paths():
+    """
+    Returns one path per generated table: either a single .parquet file
+    or a table directory holding .parquet partitions.
+    """
+    files = glob.glob(f"{DATA_DIR}/*.parquet")
+    table_dirs = [d.rstrip(os.sep) for d in glob.glob(f"{DATA_DIR}/*/") if glob.glob(os.path.join(d, "*.parquet"))]
+    return sorted(files + table_dirs)
+
+def table_name_from_path(path):
+    return os.path.basename(path).replace('.parquet', '')
+
 def clean_gemini_response(text):
     text = text.replace("```python", "").replace("```", "")
     return text.strip()
 
 def create_zip_archive(parquet_files):
     """
-    Reads multiple .parquet files, converts each to CSV,
-    and returns an in-memory ZIP file.
+    Builds the ZIP of all tables (one CSV each) on disk and returns its
+    manifest entry. Tables are converted in parallel and streamed, so the
+    archive never sits in memory.
     """
     try:
-        zip_buffer = io.BytesIO()
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_f:
-            total_files = len(parquet_files)
-            progress_bar = st.progress(0, text="Zipping files...")
-            
-            for i, file_path in enumerate(parquet_files):
-                df = pd.read_parquet(file_path)
-                csv_data = df.to_csv(index=False)
-                base_name = os.path.basename(file_path)
-                csv_file_name = base_name.replace('.parquet', '.csv')
-                zip_f.writestr(csv_file_name, csv_data)
-                
-                progress_text = f"Zipping {csv_file_name}... ({i+1}/{total_files})"
-                progress_bar.progress((i + 1) / total_files, text=progress_text)
-        
-        progress_bar.empty()
-        zip_buffer.seek(0)
-        return zip_buffer
+        tables = {table_name_from_path(f): f for f in parquet_files}
+        with st.spinner(f"Zipping {len(tables)} tables..."):
+            return export_zip(tables, ZIP_EXPORT_PATH)
     except Exception as e:
         st.error(f"Failed to create zip file: {e}")
-        progress_bar.empty()
         return None
 
 # --- Airflow API Functions ---
 
-def trigger_airflow_dag():
-    url = f"{AIRFLOW_API_URL}/dags/{DAG_ID}/dagRuns"
-    headers = {"Content-Type": "application/json"}
-    body = {"conf": {}}
+def trigger_airflow_dag(schema, seed=None):
+    # The DAG derives its per-table task graph from the schema, and seeds
+    # every partition from the run seed so the same seed reproduces the data
+    conf = {"schema": schema}
+    if seed is not None:
+        conf["seed"] = seed
     try:
-        response = requests.post(url, auth=AIRFLOW_AUTH, headers=headers, json=body)
-        response.raise_for_status() 
-        data = response.json()
-        dag_run_id = data.get("dag_run_id")
+        dag_run_id = airflow_client().trigger(conf)
         st.session_state.dag_run_id = dag_run_id
         return dag_run_id
     except requests.exceptions.RequestException as e:
         st.error(f"Failed to trigger DAG. Is Airflow running? Error: {e}")
         return None
 
-def get_dag_run_status():
-    if "dag_run_id" not in st.session_state:
-        return None
-    dag_run_id = st.session_state.dag_run_id
-    url = f"{AIRFLOW_API_URL}/dags/{DAG_ID}/dagRuns/{dag_run_id}"
-    try:
-        response = requests.get(url, auth=AIRFLOW_AUTH)
-        response.raise_for_status()
-        data = response.json()
-        return data.get("state") 
-    except requests.exceptions.RequestException as e:
-        st.error(f"Failed to get DAG status: {e}")
-        return "failed" 
+@st.cache_resource
+def airflow_client():
+    """One pooled, retrying API client shared by all reruns and sessions."""
+    return AirflowClient(AIRFLOW_API_URL, DAG_ID, auth=AIRFLOW_AUTH)
 
 # --- Gemini Code Generation Function (UPDATED PROMPT) ---
 
-def call_gemini_api(schema, api_key):
+def call_gemini_api(schema, api_key, bypass_cache=False):
     try:
         genai.configure(api_key=api_key)
         # Using the model you specified
-        model = genai.GenerativeModel('gemini-2.5-pro') 
+        model = genai.GenerativeModel(GEMINI_MODEL_NAME)
         
         schema_str = json.dumps(schema, indent=2)
         
@@ -122,26 +133,32 @@ def call_gemini_api(schema, api_key):
 
         You will be given a JSON object describing the tables, their relationships, and the number of rows for each.
         
-        YOUR GOAL is to write a Python script with a single `main()` function. This script must:
-        1.  Import necessary libraries: `pandas as pd`, `faker`, `datetime`, `random`, `os`. **DO NOT import uuid.**
+        YOUR GOAL is to write a Python script with a `generate_table()` function and a `main()` function. This script must:
+        1.  Import necessary libraries: `pandas as pd`, `faker`, `datetime`, `random`, `os`, `numpy as np`, `from utils.table_writer import TableWriter`, `from utils.key_pool import KeyPool`, `from utils.seeding import batch_seed`, and `from utils.vectorized import random_ints, random_floats, random_datetimes`. **DO NOT import uuid.**
         2.  Define the output directory: `OUTPUT_DIR = "/opt/airflow/data/generated_users"` and ensure it exists.
         3.  Initialize Faker: `fake = Faker()`.
-        4.  **Generation Order:** Generate tables with fewer rows first ("Dimension").
+        4.  Define `TABLE_ROWS`, a dict mapping each table's exact "name" from the schema to its number of rows, ordered with fewer rows first ("Dimension") and many rows last ("Fact").
         5.  **PATTERNED PRIMARY KEYS:** For columns specified as a Primary Key (PK) in the schema (e.g., 'customer_id'), check the user's prompt for that table. 
             * If the prompt mentions a specific pattern (like 'CUST-XXXX' or 'ORD followed by digits'), generate IDs matching that pattern using Python f-strings (e.g., `f"CUST-{{i:04d}}"` where `i` is the sequence number starting from 1).
             * If no pattern is mentioned, generate **sequential integers starting from 1**.
-        6.  Store these generated PKs (whether patterned strings or integers) in a list in memory (e.g., `customer_id_list`).
-        7.  Generate tables with many rows last ("Fact").
-        8.  **FOREIGN KEYS:** When generating a Fact table's Foreign Key (FK) column (e.g., 'customer_id' in Sales), you MUST use `random.choice(customer_id_list)` to select a valid PK (string or integer) from the corresponding PK list. This ensures referential integrity.
+        6.  **KEY POOLS, NO PK LISTS:** Do NOT store generated PKs in lists. Instead define a module-level dict `KEY_POOLS` with one `KeyPool.sequential(TABLE_ROWS[name], pattern)` per table that has a PK, using the same pattern as a `str.format` string (e.g. `KeyPool.sequential(TABLE_ROWS['customers'], "CUST-{{:04d}}")`, or no pattern for plain integers). Render a table's own PK column for rows `start..stop` with `KEY_POOLS[name].render(np.arange(start, stop))`.
+        7.  **FOREIGN KEYS:** Generate every Foreign Key (FK) column of a batch in ONE call: `KEY_POOLS['customers'].sample_keys(rng, n)` where `rng` is the batch's seeded generator (see rule 10) and `n` is the batch row count. NEVER use `random.choice` for FKs and never loop over rows for FKs. Fact table batches with FKs MUST be returned as a dict of columns (use `random_ints(rng, a, b, n)`, `random_floats(rng, a, b, n, decimals=2)` and `random_datetimes(rng, start_datetime, end_datetime, n)` for their other columns). This ensures referential integrity.
+        8.  **SKEWED FOREIGN KEYS:** If a table has a `fk_distributions` entry for an FK (keyed by the referenced "Table.pk", e.g. "customers.customer_id") whose "type" is not "uniform", import `from utils.distributions import make_distribution` and build it ONCE at module level in a dict, e.g. `FK_DISTRIBUTIONS = {{"sales.customer_id": make_distribution({{"type": "zipf", "s": 1.2}}, len(KEY_POOLS['customers']))}}` (key it by "<this table>.<fk column>" and copy the spec dict exactly from the schema). Pass it as the third argument: `KEY_POOLS['customers'].sample_keys(rng, n, FK_DISTRIBUTIONS["sales.customer_id"])`. Uniform FKs take no third argument.
         9.  **Row Counts:** Generate the exact number of rows specified for each table.
-        10. **Batching:** For large tables (> 100,000 rows), generate data in batches.
-        11. Save each table as a separate `.parquet` file in the `OUTPUT_DIR`.
+        10. **`generate_table(table_name, start, stop, seed=None)`:** A generator function that yields batches (a `pd.DataFrame` or a dict of columns) for rows `start` (inclusive) to `stop` (exclusive) of ONE table, 0-based. Row `i` uses sequence number `i + 1` for its PK. Yield at most 100,000 rows per batch, with batch boundaries at multiples of 100,000. It MUST only depend on `table_name`, `start`, `stop` and `seed`, never on other tables' data.
+            * **Seeding (reproducibility):** At the start of EVERY batch, compute `shard_seed = batch_seed(seed, table_name, batch_start)`, then call `fake.seed_instance(shard_seed)`, `random.seed(shard_seed)` and create `rng = np.random.default_rng(shard_seed)`. Use only `fake`, `random` and `rng` for randomness.
+            * **Dates:** Use fixed date bounds relative to `datetime.datetime(2025, 1, 1)`. NEVER use `datetime.datetime.now()`.
+        11. **`main(seed=None)`:** Generates every table by iterating `generate_table(name, 0, TABLE_ROWS[name], seed=seed)` and streaming the batches into a `TableWriter`:
+            * Create it once per table: `writer = TableWriter(os.path.join(OUTPUT_DIR, name, 'part-00000.parquet'))`.
+            * Call `writer.write_batch(batch)` for each yielded batch.
+            * Call `writer.close()` after the last batch. Use `writer.rows_written` for the row count.
+            * **NEVER** keep a list of batch DataFrames and **NEVER** call `pd.concat` or `to_parquet` on a whole table.
         12. Include print statements for progress.
 
         **CRITICAL FAKER RULES (No UUIDs):**
         * For a **product name**: use `fake.catch_phrase()` or `fake.bs()`.
         * For **IDs NOT specified as PK/FK**: use `random.randint(1000, 9999)` or similar, but NOT patterned or sequential.
-        * For **dates**: use `fake.date_time_between()`.
+        * For **dates**: use `fake.date_time_between(start_date=..., end_date=...)` with fixed `datetime` bounds, or `random_datetimes(rng, start, end, n)`.
         
         Respond ONLY with the complete, runnable Python code. Do not include any markdown or explanation.
 
@@ -151,9 +168,12 @@ def call_gemini_api(schema, api_key):
         ---
         """
         
-        response = model.generate_content(full_prompt)
-        cleaned_response = response.text.replace("```python", "").replace("```", "").strip()
-        return cleaned_response
+        def _generate():
+            response = model.generate_content(full_prompt)
+            return response.text.replace("```python", "").replace("```", "").strip()
+
+        # Identical prompts are answered from the response cache
+        return cached_generate(_generate, GEMINI_MODEL_NAME, full_prompt, bypass=bypass_cache)
     
     except Exception as e:
         st.error(f"Error calling Gemini API: {e}")
@@ -181,7 +201,7 @@ if num_tables != st.session_state.num_tables:
     st.session_state.tables = {} 
 
 # --- Step 2: Define Each Table ---
-st.info("Define your small tables first. Large tables (like 1,000,000 rows) can link to them.")
+st.info("Define your small tables first. Large tables (millions of rows) can link to them.")
 
 table_definitions = {}
 pk_options = []
@@ -207,11 +227,11 @@ for i in range(st.session_state.num_tables):
         t_def['rows'] = st.number_input(
             f"Number of Rows for {t_def['name']}",
             min_value=1,
-            max_value=1_000_000,
+            max_value=MAX_ROWS_PER_TABLE,
             value=t_def.get('rows', 1000), # Use .get for safety
             key=f"rows_{i}"
         )
-        st.caption("Max: 1,000,000. Use < 50,000 for 'Dimension' tables, > 50,000 for 'Fact' tables.")
+        st.caption(f"Max: {MAX_ROWS_PER_TABLE:,}. Use < 50,000 for 'Dimension' tables, > 50,000 for 'Fact' tables.")
         
         t_def['prompt'] = st.text_area(f"Prompt for {t_def['name']}", value=t_def['prompt'], key=f"prompt_{i}", placeholder=f"e.g., A student with a student_id, name, and email")
         t_def['pk'] = st.text_input(f"Primary Key Column Name", value=t_def['pk'], key=f"pk_{i}", placeholder=f"e.g., student_id")
@@ -232,6 +252,47 @@ for i in range(st.session_state.num_tables):
                 default=t_def.get('fk', []),
                 key=f"fk_{i}"
             )
+            # Per-FK distribution: how often each referenced key is picked
+            fk_distributions = {}
+            rows_by_name = {t['name']: t['rows'] for t in st.session_state.tables.values()}
+            for fk in t_def['fk']:
+                spec = t_def.get('fk_distributions', {}).get(fk, {"type": "uniform"})
+                # One typed weight per referenced row only works for small tables
+                options = [
+                    d for d in DISTRIBUTION_TYPES
+                    if d != "weights" or rows_by_name.get(fk.split(".")[0], 0) <= MAX_EXPLICIT_WEIGHTS
+                ]
+                if spec.get("type", "uniform") not in options:
+                    spec = {"type": "uniform"}
+                dist_col, param_col = st.columns(2)
+                kind = dist_col.selectbox(
+                    f"Distribution of {fk}",
+                    options=options,
+                    index=options.index(spec.get("type", "uniform")),
+                    key=f"fk_dist_{i}_{fk}"
+                )
+                if kind == "zipf":
+                    s_value = param_col.number_input("Zipf exponent (s)", min_value=0.1, value=float(spec.get("s", 1.1)), key=f"fk_zipf_{i}_{fk}")
+                    spec = {"type": "zipf", "s": s_value}
+                elif kind == "pareto":
+                    alpha = param_col.number_input("Pareto alpha (1.16 = 80/20)", min_value=0.1, value=float(spec.get("alpha", 1.16)), key=f"fk_pareto_{i}_{fk}")
+                    spec = {"type": "pareto", "alpha": alpha}
+                elif kind == "weights":
+                    weights_text = param_col.text_input(
+                        "Weights (one per referenced row, comma-separated)",
+                        value=",".join(str(w) for w in spec.get("weights", [])),
+                        key=f"fk_weights_{i}_{fk}"
+                    )
+                    try:
+                        weights = [float(w) for w in weights_text.split(",") if w.strip()]
+                    except ValueError:
+                        st.error("Weights must be numbers.")
+                        weights = []
+                    spec = {"type": "weights", "weights": weights}
+                else:
+                    spec = {"type": "uniform"}
+                fk_distributions[fk] = spec
+            t_def['fk_distributions'] = fk_distributions
         else:
             st.caption("Define other tables' Primary Keys to link them here.")
 
@@ -239,9 +300,10 @@ for i in range(st.session_state.num_tables):
 st.markdown("---")
 st.header("2. 🤖 Generate & Save Code")
 
+fresh_response = st.checkbox("Skip the response cache (ask Gemini again)", value=False)
 if st.button("Generate Database Code", use_container_width=True, type="primary"):
     with st.spinner("Calling Gemini API..."):
-        generated_code = call_gemini_api(st.session_state.tables, API_KEY)
+        generated_code = call_gemini_api(st.session_state.tables, API_KEY, bypass_cache=fresh_response)
     if generated_code:
         st.session_state.current_code = generated_code
         st.session_state.key_counter += 1
@@ -262,6 +324,7 @@ code_in_editor = st.text_area(
 if st.button("💾 Save Code to Airflow", use_container_width=True):
     code_to_save = st.session_state[editor_key]
     save_generator_code(code_to_save)
+    save_schema(st.session_state.tables)
     st.session_state.current_code = code_to_save
     st.session_state.code_is_saved = True
     st.success("Code saved to file!")
@@ -273,11 +336,12 @@ st.header("3. 🚀 Run Pipeline & Download Data")
 if not st.session_state.get("code_is_saved", False):
     st.warning("Please **Save Code** before starting data generation.")
 else:
+    run_seed = st.number_input("Random seed (the same seed reproduces the same database)", min_value=0, value=42, step=1)
     if st.button("🚀 Start Database Generation", type="primary", use_container_width=True):
         if st.session_state[editor_key] != load_generator_code():
              st.warning("Your latest edits are not saved. Please click 'Save Code' first.")
         else:
-            dag_run_id = trigger_airflow_dag()
+            dag_run_id = trigger_airflow_dag(st.session_state.tables, int(run_seed))
             if dag_run_id:
                 st.session_state.monitoring_dag = True
                 st.info(f"Successfully triggered Airflow DAG run: `{dag_run_id}`")
@@ -286,58 +350,75 @@ else:
 
 # Polling logic
 if st.session_state.get("monitoring_dag", False):
-    with st.spinner("Data generation in progress... This may take several minutes. Polling Airflow every 10 seconds."):
-        status = "running"
-        while status == "running":
-            time.sleep(10) 
-            status = get_dag_run_status()
-        
-        if status == "success":
-            st.success("Data generation complete! ✅")
-            st.balloons()
-            st.session_state.monitoring_dag = False
-            st.rerun() # Rerun to show files
-            
-        elif status == "failed":
-            st.error(f"DAG run {st.session_state.dag_run_id} failed. Please check the Airflow UI for logs.")
-            st.session_state.monitoring_dag = False
+    monitor_dag_run(airflow_client(), BATCH_TASK_IDS, "partitions")
+
+run_result = st.session_state.pop("dag_run_result", None)
+if run_result == "success":
+    st.success("Data generation complete! ✅")
+    st.balloons()
+elif run_result == "failed":
+    st.error(f"DAG run {st.session_state.dag_run_id} failed. Please check the Airflow UI for logs.")
 
 # --- Step 5: Validate & Download (with .zip) ---
 st.subheader("Generated Database Files")
 st.info(f"Files are saved as Parquet in your project's `{DATA_DIR}` folder.")
 
-parquet_files = sorted(glob.glob(f"{DATA_DIR}/*.parquet"))
+parquet_files = find_table_paths()
 
 if not parquet_files:
     st.warning("No data files found. Please run your Airflow DAG first.")
 else:
     st.success(f"Found {len(parquet_files)} database tables!")
-    
-    for f in parquet_files:
-        st.markdown(f"- `{os.path.basename(f)}`")
-        
+
+    # Exact counts, types and sizes from the Parquet footers (no data is read)
+    try:
+        table_stats = {table_name_from_path(f): dataset_stats([f]) for f in parquet_files}
+        st.dataframe(
+            pd.DataFrame([
+                {"table": name, "rows": s["rows"], "files": len(s["files"]), "columns": len(s["columns"]),
+                 "MB": round(s["bytes"] / 1e6, 2)}
+                for name, s in table_stats.items()
+            ]),
+            hide_index=True
+        )
+    except Exception as e:
+        st.error(f"Failed to read table metadata: {e}")
+        for f in parquet_files:
+            st.markdown(f"- `{table_name_from_path(f)}`")
+
     st.subheader("Preview First Table")
     try:
-        sample_df = pd.read_parquet(parquet_files[0])
-        st.dataframe(sample_df.head(100), hide_index=True)
+        st.dataframe(preview(parquet_files[0]).to_pandas(), hide_index=True)
     except Exception as e:
         st.error(f"Failed to read sample file {parquet_files[0]}: {e}")
 
     st.subheader("Download All Tables (.zip)")
-    if st.button("📦 Prepare All Tables as .zip", type="primary", use_container_width=True):
-        zip_data = create_zip_archive(parquet_files)
-        if zip_data:
-            st.session_state.zip_data_ready = True
-            st.session_state.zip_data = zip_data
-            st.success("Zip file is ready to download!")
-    
-    if st.session_state.get("zip_data_ready", False):
-        st.download_button(
-            label="⬇️ Download database.zip",
-            data=st.session_state.zip_data,
-            file_name="generated_database.zip",
-            mime="application/zip",
-            use_container_width=True
-        )
+    # A ZIP built from the current table files is reused across reruns and sessions
+    zip_entry = current_zip_export(ZIP_EXPORT_PATH, {table_name_from_path(f): f for f in parquet_files})
+    if zip_entry is None:
+        if st.button("📦 Prepare All Tables as .zip", type="primary", use_container_width=True):
+            zip_entry = create_zip_archive(parquet_files)
+            if zip_entry:
+                st.success("Zip file is ready to download!")
+
+    if zip_entry:
+        st.caption(f"{zip_entry['rows']:,} rows, {zip_entry['bytes'] / 1e6:.1f} MB")
+        # A download button holds the whole file in memory for as long as it is shown,
+        # so it is only created on request and removed once it has been used
+        if st.session_state.get("zip_download") == zip_entry["checksum"]:
+            with open(ZIP_EXPORT_PATH, "rb") as f:
+                st.download_button(
+                    label="⬇️ Download database.zip",
+                    data=f,
+                    file_name="generated_database.zip",
+                    mime="application/zip",
+                    on_click=lambda: st.session_state.pop("zip_download", None),
+                    use_container_width=True
+                )
+        elif st.button("🔗 Get download for database.zip", use_container_width=True):
+            st.session_state.zip_download = zip_entry["checksum"]
+            st.rerun()
 
-    
\ No newline at end of file
+st.markdown("---")
+st.subheader("📈 Run Telemetry")
+render_telemetry_panel(DAG_ID, "partitions")
@@ -1,10 +1,62 @@
 from airflow.decorators import dag, task
+from airflow.exceptions import AirflowSkipException
 from airflow.utils.dates import days_ago
-import importlib
+from utils.table_writer import TableWriter
+from utils.seeding import resolve_run_seed
+from utils.manifest import Manifest, content_hash, module_source_hash
+from utils.module_loader import load_generator
+from utils.telemetry import record_plan, track
+from utils.dataset_info import dataset_stats
+import inspect
+import json
 import os
+import shutil
 
 GENERATOR_MODULE_NAME = "utils.database_generator"
 OUTPUT_DIR = "/opt/airflow/data/generated_users"
+# Written by app2.py next to the generator code; used when the DAG is
+# triggered without a schema in its conf (e.g. from the Airflow UI).
+SCHEMA_FILE_PATH = "/opt/airflow/dags/utils/database_schema.json"
+PARTITION_ROWS = 100_000
+
+def load_generator_module():
+    """Loads the AI-generated script, re-executing it only if the file changed."""
+    return load_generator(GENERATOR_MODULE_NAME)
+
+def load_schema(conf: dict) -> dict:
+    """Returns the table definitions from the run conf, or the saved schema file."""
+    if conf.get("schema"):
+        return conf["schema"]
+    if os.path.exists(SCHEMA_FILE_PATH):
+        with open(SCHEMA_FILE_PATH, "r") as f:
+            return json.load(f)
+    return {}
+
+def table_definition_hash(source_hash: str, table_def: dict, schema: dict) -> str:
+    """
+    Hash of everything one table's output depends on: the generator code,
+    its own definition and the definitions of the tables its FKs point to
+    (their row counts decide the valid key range).
+    """
+    tables_by_name = {t["name"]: t for t in schema.values()}
+    referenced = [tables_by_name.get(fk.split(".")[0]) for fk in sorted(table_def.get("fk", []))]
+    return content_hash(source_hash, table_def, referenced)
+
+def table_partitions(table_def: dict, code_hash: str) -> list[dict]:
+    """Splits one table into row ranges of at most PARTITION_ROWS rows."""
+    name = table_def["name"]
+    total_rows = int(table_def["rows"])
+    partitions = []
+    for partition_id, start in enumerate(range(0, total_rows, PARTITION_ROWS)):
+        partitions.append({
+            "table": name,
+            "partition": partition_id,
+            "start": start,
+            "stop": min(start + PARTITION_ROWS, total_rows),
+            "output_path": os.path.join(OUTPUT_DIR, name, f"part-{partition_id:05d}.parquet"),
+            "code_hash": code_hash,
+        })
+    return partitions
 
 @dag(
     dag_id="ai_database_generator",
@@ -15,54 +67,183 @@ OUTPUT_DIR = "/opt/airflow/data/generated_users"
 def generate_database_dag():
     """
     DAG to generate a full multi-table database.
-    
-    It imports and runs the `main()` function from the
-    AI-generated database_generator.py script.
+
+    The task graph is derived from the schema JSON built in app2.py:
+    dimension tables (no foreign keys) are generated first, then the
+    fact tables. Every table is split into row-range partitions that run
+    as mapped tasks, each writing its own Parquet file under a per-table
+    directory (e.g. `sales/part-00003.parquet`).
+
+    If the AI-generated script has no `generate_table()` function, or
+    no schema is available, the whole `main()` runs in a single task.
+
+    Each table has a definition hash (generator code + table definition
+    + referenced tables). Partitions recorded in the output manifest with
+    the same hash, seed and row count are skipped, so changing one
+    table's definition regenerates only that table (and the tables that
+    reference it).
+
+    Pass {"seed": <int>} in the run conf for reproducible output; each
+    partition derives its own stream from (seed, table, batch), so any
+    partition can be regenerated on its own with identical rows.
     """
 
     @task
-    def clear_previous_data():
-        """Deletes all .parquet files from the output directory."""
+    def clear_previous_data(tables: dict, legacy: bool):
+        """
+        Deletes outdated data from the output directory.
+
+        In legacy mode every .parquet file and table directory is removed.
+        Otherwise only tables that left the schema, or whose definition
+        hash changed, are removed; unchanged tables are kept so their
+        partitions can be skipped.
+        """
         print(f"Clearing old data from {OUTPUT_DIR}...")
+        manifest = Manifest(OUTPUT_DIR)
+        entries = manifest.load()
         try:
-            files = [f for f in os.listdir(OUTPUT_DIR) if f.endswith(".parquet")]
-            for f in files:
-                os.remove(os.path.join(OUTPUT_DIR, f))
+            removed = 0
+            for f in os.listdir(OUTPUT_DIR):
+                path = os.path.join(OUTPUT_DIR, f)
+                if f.endswith(".parquet"):
+                    # Single-file tables are from the old layout
+                    if not legacy and f[:-len(".parquet")] not in tables:
+                        continue
+                    os.remove(path)
+                elif os.path.isdir(path) and any(p.endswith(".parquet") for p in os.listdir(path)):
+                    table_hashes = {e.get("code_hash") for k, e in entries.items() if k.startswith(f"{f}/")}
+                    if not legacy and f in tables and table_hashes == {tables[f]}:
+                        print(f"Keeping {f} (definition unchanged)")
+                        continue
+                    shutil.rmtree(path)
+                    manifest.forget(f"{f}/")
+                else:
+                    continue
+                removed += 1
                 print(f"Removed {f}")
-            print(f"Cleared {len(files)} files.")
+            print(f"Cleared {removed} files.")
         except Exception as e:
             print(f"Error clearing directory: {e}")
             raise
 
+    @task(multiple_outputs=True)
+    def plan_partitions(**context) -> dict:
+        """
+        Builds the partition lists for the dimension and fact stages.
+        Falls back to the legacy single-task run when the generator
+        does not support per-table generation.
+        """
+        schema = load_schema(context["dag_run"].conf or {})
+        generator_module = load_generator_module()
+
+        if not schema or not hasattr(generator_module, "generate_table"):
+            print("No schema or no generate_table() found, running main() in a single task.")
+            return {"dimensions": [], "facts": [], "tables": {}, "legacy": True}
+
+        source_hash = module_source_hash(generator_module)
+        dimensions, facts, tables = [], [], {}
+        for table_def in schema.values():
+            code_hash = table_definition_hash(source_hash, table_def, schema)
+            tables[table_def["name"]] = code_hash
+            partitions = table_partitions(table_def, code_hash)
+            if table_def.get("fk"):
+                facts.extend(partitions)
+            else:
+                dimensions.extend(partitions)
+            print(f"Table '{table_def['name']}': {table_def['rows']} rows in {len(partitions)} partitions.")
+
+        # Both stages' sizes are known now, before Airflow expands the fact stage
+        record_plan(context["dag"].dag_id, context["run_id"],
+                    {"generate_dimension_partition": len(dimensions), "generate_fact_partition": len(facts)})
+        return {"dimensions": dimensions, "facts": facts, "tables": tables, "legacy": False}
+
     @task
-    def run_database_generation_script():
+    def generate_partition(spec: dict, **context) -> str:
+        """
+        Generates one row range of one table and streams it to its own
+        Parquet file, unless the manifest shows it is already up to date.
+        """
+        run_seed = resolve_run_seed(context["dag_run"].conf, context["run_id"])
+        rows = spec["stop"] - spec["start"]
+        batch_id = f"{spec['table']}:{spec['start']}-{spec['stop']}"
+        with track(context["dag"].dag_id, context["ti"].task_id, batch_id, run_id=context["run_id"],
+                   table=spec["table"]) as metrics:
+            manifest = Manifest(OUTPUT_DIR)
+            if manifest.is_current(spec["output_path"], spec["code_hash"], run_seed, rows):
+                print(f"--- {spec['output_path']} is up to date in the manifest, skipping ---")
+                metrics["status"] = "up_to_date"
+                return spec["output_path"]
+
+            generator_module = load_generator_module()
+            print(f"--- Generating {spec['table']} rows {spec['start']}-{spec['stop']} (run seed {run_seed}) ---")
+
+            kwargs = {}
+            # Older generated scripts do not take a seed
+            if "seed" in inspect.signature(generator_module.generate_table).parameters:
+                kwargs["seed"] = run_seed
+            else:
+                print("generate_table() takes no seed, output will not be reproducible.")
+
+            with TableWriter(spec["output_path"]) as writer:
+                for batch in generator_module.generate_table(spec["table"], spec["start"], spec["stop"], **kwargs):
+                    writer.write_batch(batch)
+
+            manifest.record(spec["output_path"], spec["code_hash"], run_seed, writer.rows_written, table=spec["table"])
+            metrics["rows"] = writer.rows_written
+            metrics["output_path"] = spec["output_path"]
+            print(f"--- Saved {writer.rows_written} rows to {spec['output_path']} ---")
+            return spec["output_path"]
+
+    @task
+    def run_database_generation_script(legacy: bool, **context):
         """
         Imports the AI-generated script and runs its main() function.
         """
+        if not legacy:
+            raise AirflowSkipException("Tables are generated as partitions.")
+
         print("Importing AI-generated script...")
         try:
-            # Dynamically import the module
-            generator_module = importlib.import_module(GENERATOR_MODULE_NAME)
-            # Reload it to get the latest changes
-            importlib.reload(generator_module)
-            
+            generator_module = load_generator_module()
             # Get the main generation function
             main_func = getattr(generator_module, "main")
-            
+
         except Exception as e:
             print(f"Error importing generator function: {e}")
             print("Did the AI generate the code correctly? Does 'main()' exist?")
             raise
 
         print("--- Starting Database Generation ---")
-        main_func()
+        # main() writes every table itself; rows and bytes are read back from its output.
+        # OUTPUT_DIR is shared with other DAGs, so only this schema's tables are counted.
+        table_names = [table_def["name"] for table_def in load_schema(context["dag_run"].conf or {}).values()]
+        with track(context["dag"].dag_id, context["ti"].task_id, "main", run_id=context["run_id"]) as metrics:
+            if "seed" in inspect.signature(main_func).parameters:
+                main_func(seed=resolve_run_seed(context["dag_run"].conf, context["run_id"]))
+            else:
+                main_func()
+            table_paths = [
+                path for name in table_names
+                for path in (os.path.join(OUTPUT_DIR, name), os.path.join(OUTPUT_DIR, f"{name}.parquet"))
+                if os.path.exists(path)
+            ]
+            stats = dataset_stats(table_paths)
+            metrics["rows"] = stats["rows"]
+            metrics["bytes_written"] = stats["bytes"]
         print("--- Database Generation Complete ---")
 
-    # Define DAG structure: Clear data, then run the script
-    clear_data_task = clear_previous_data()
-    run_script_task = run_database_generation_script()
-    
-    clear_data_task >> run_script_task
+    # Define DAG structure: Plan, clear outdated data, then dimensions before facts
+    plan = plan_partitions()
+    clear_data_task = clear_previous_data(plan["tables"], plan["legacy"])
+    dimension_tasks = generate_partition.override(task_id="generate_dimension_partition").expand(spec=plan["dimensions"])
+    # An empty stage is skipped, which must not skip the next one
+    fact_tasks = generate_partition.override(
+        task_id="generate_fact_partition", trigger_rule="none_failed"
+    ).expand(spec=plan["facts"])
+    run_script_task = run_database_generation_script(plan["legacy"])
+
+    clear_data_task >> [dimension_tasks, fact_tasks, run_script_task]
+    dimension_tasks >> fact_tasks
 
 # Instantiate the DAG
-generate_database_dag()
\ No newline at end of file
+generate_database_dag()
@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import os
+import random
+import time
+import httpx
+from google.api_core.exceptions import ResourceExhausted
+from datagenerate.your_utils_file import API_KEY, clean_response_text, mark_truncated
+from utils import telemetry
+
+# Asyncio Gemini client for keeping many generateContent requests in flight
+# from a single task. It talks to the REST API through one pooled
+# httpx.AsyncClient (so TLS connections are reused), caps in-flight requests
+# with a semaphore, and paces them with token buckets for the per-minute
+# request (RPM) and token (TPM) quotas. When the API answers
+# 429 / RESOURCE_EXHAUSTED, both rates are halved and then recovered
+# gradually as requests succeed.
+#
+# The base URL is configurable (argument or GEMINI_BASE_URL), so the client
+# can be pointed at a local mock server that implements
+# POST /v1beta/models/<model>:generateContent.
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = os.environ.get("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com")
+DEFAULT_MODEL = "gemini-1.5-flash-latest"
+DEFAULT_GENERATION_CONFIG = {"maxOutputTokens": 8192, "temperature": 0.1}
+# Per client, i.e. per batch task: divide the project quota by the number of parallel tasks
+DEFAULT_CONCURRENCY = int(os.environ.get("GEMINI_MAX_CONCURRENCY", 8))
+DEFAULT_RPM = float(os.environ.get("GEMINI_RPM", 60))
+DEFAULT_TPM = float(os.environ.get("GEMINI_TPM", 1_000_000))
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+CHARS_PER_TOKEN = 4  # rough estimate used before the real usage is known
+
+
+class TokenBucket:
+    """
+    Continuous-refill token bucket holding at most one minute of `rate`.
+    `acquire()` waits until `amount` tokens are available. `charge()`
+    takes tokens without waiting and may leave the bucket in debt, which
+    later acquires then wait out.
+
+    The check-and-take in `acquire()` contains no await, so it is atomic
+    on the event loop; waiters sleep concurrently instead of queueing
+    behind one lock holder.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.rate = float(rate_per_minute)
+        self.tokens = self.rate
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self._updated) * self.rate / 60)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1):
+        while True:
+            amount = min(amount, self.rate)  # a single oversized request must still pass
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) * 60 / self.rate)
+
+    def charge(self, amount: float):
+        self._refill()
+        self.tokens -= amount
+
+
+class AdaptiveRateLimiter:
+    """
+    RPM and TPM token buckets that back off on quota errors: `throttle()`
+    halves both rates (down to `min_fraction` of the configured quota),
+    and every successful request gives back a small step of the quota.
+    """
+
+    def __init__(self, rpm: float = DEFAULT_RPM, tpm: float = DEFAULT_TPM,
+                 min_fraction: float = 0.1, recovery_step: float = 0.05):
+        self.max_rpm, self.max_tpm = float(rpm), float(tpm)
+        self.min_fraction = min_fraction
+        self.recovery_step = recovery_step
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+
+    async def acquire(self, estimated_tokens: int):
+        await self.requests.acquire(1)
+        await self.tokens.acquire(estimated_tokens)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int):
+        """Corrects the TPM bucket once the real token count is known."""
+        self.tokens.charge(actual_tokens - estimated_tokens)
+
+    def _set_fraction(self, bucket: TokenBucket, maximum: float, factor: float, step: float):
+        bucket.rate = min(maximum, max(maximum * self.min_fraction, bucket.rate * factor + maximum * step))
+        bucket.tokens = min(bucket.tokens, bucket.rate)
+
+    def throttle(self):
+        self._set_fraction(self.requests, self.max_rpm, 0.5, 0)
+        self._set_fraction(self.tokens, self.max_tpm, 0.5, 0)
+        log.warning(f"Quota exhausted, slowing down to {self.requests.rate:.0f} RPM / {self.tokens.rate:.0f} TPM")
+
+    def recover(self):
+        self._set_fraction(self.requests, self.max_rpm, 1, self.recovery_step)
+        self._set_fraction(self.tokens, self.max_tpm, 1, self.recovery_step)
+
+
+class AsyncGeminiClient:
+    """
+    Concurrent, rate-limited Gemini client. Use as an async context
+    manager so the connection pool is closed afterwards:
+
+        async with AsyncGeminiClient(max_concurrency=8, rpm=300) as client:
+            texts = await client.generate_many(prompts)
+    """
+
+    def __init__(self, api_key: str | None = None, model: str = DEFAULT_MODEL, base_url: str = DEFAULT_BASE_URL,
+                 max_concurrency: int = DEFAULT_CONCURRENCY, rpm: float = DEFAULT_RPM, tpm: float = DEFAULT_TPM,
+                 max_retries: int = 5, timeout: float = 120.0, generation_config: dict | None = None,
+                 backoff_seconds: float = 1.0):
+        self.api_key = api_key if api_key is not None else API_KEY
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.generation_config = {**DEFAULT_GENERATION_CONFIG, **(generation_config or {})}
+        self.limiter = AdaptiveRateLimiter(rpm, tpm)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._http = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+        self.calls = 0
+        self.retries = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+        return False
+
+    async def close(self):
+        await self._http.aclose()
+
+    def _url(self) -> str:
+        return f"{self.base_url}/v1beta/models/{self.model}:generateContent"
+
+    async def _post(self, prompt: str, generation_config: dict) -> dict:
+        body = {"contents": [{"parts": [{"text": prompt}]}], "generationConfig": generation_config}
+        params = {"key": self.api_key} if self.api_key else None
+        response = await self._http.post(self._url(), json=body, params=params)
+        if response.status_code == 429:
+            raise ResourceExhausted(response.text)
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def _response_text(payload: dict) -> str:
+        """Cleaned text of the first candidate, marked if it stopped at the output limit."""
+        candidates = payload.get("candidates") or []
+        parts = candidates[0].get("content", {}).get("parts", []) if candidates else []
+        text = "".join(part.get("text", "") for part in parts)
+        if not text:
+            raise ValueError(f"Gemini API did not return valid content text: {payload}")
+        return mark_truncated(clean_response_text(text), candidates[0].get("finishReason"))
+
+    async def generate(self, prompt: str, generation_config: dict | None = None) -> str:
+        """
+        Sends one prompt, waiting for a concurrency slot and for rate
+        budget first. Quota and server errors are retried with
+        exponential backoff. Returns the cleaned response text.
+        """
+        config = {**self.generation_config, **(generation_config or {})}
+        estimated_tokens = len(prompt) // CHARS_PER_TOKEN + 1
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.limiter.acquire(estimated_tokens)
+                self.calls += 1
+                telemetry.count("api_calls")
+                try:
+                    payload = await self._post(prompt, config)
+                except (ResourceExhausted, httpx.HTTPStatusError, httpx.TransportError) as e:
+                    status = getattr(getattr(e, "response", None), "status_code", None)
+                    retryable = isinstance(e, (ResourceExhausted, httpx.TransportError)) or status in RETRYABLE_STATUS
+                    if isinstance(e, ResourceExhausted):
+                        self.limiter.throttle()
+                    if not retryable or attempt == self.max_retries:
+                        raise
+                    self.retries += 1
+                    telemetry.count("api_retries")
+                    delay = min(60, self.backoff_seconds * 2 ** (attempt + 1)) * (0.5 + random.random() / 2)
+                    log.warning(f"Gemini call failed ({e.__class__.__name__}), retry {attempt + 1} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+
+                usage = payload.get("usageMetadata", {}).get("totalTokenCount", estimated_tokens)
+                self.limiter.record_usage(estimated_tokens, usage)
+                self.limiter.recover()
+                return self._response_text(payload)
+
+    async def generate_many(self, prompts: list[str], generation_config: dict | None = None,
+                            return_exceptions: bool = False) -> list:
+        """Runs all prompts concurrently; results are in prompt order."""
+        return await asyncio.gather(
+            *(self.generate(prompt, generation_config) for prompt in prompts),
+            return_exceptions=return_exceptions,
+        )
+
+
+class GeminiSession:
+    """
+    Blocking front end for synchronous callers such as Airflow tasks. It
+    keeps one event loop and one AsyncGeminiClient until close(), so the
+    connection pool, the token buckets and any backoff learned from 429s
+    carry over from one round of requests to the next.
+    """
+
+    def __init__(self, **client_kwargs):
+        self._loop = asyncio.new_event_loop()
+        self.client = self._loop.run_until_complete(self._create_client(client_kwargs))
+
+    @staticmethod
+    async def _create_client(client_kwargs: dict) -> AsyncGeminiClient:
+        # Created on the session's loop, which its pool and semaphore belong to
+        return AsyncGeminiClient(**client_kwargs)
+
+    def generate_many(self, prompts: list[str], generation_config: dict | None = None) -> list:
+        """
+        Runs all prompts concurrently. Results are in prompt order; a
+        prompt that failed gives its exception, so one bad prompt does not
+        discard the other responses of the round.
+        """
+        results = self._loop.run_until_complete(
+            self.client.generate_many(prompts, generation_config, return_exceptions=True))
+        log.info(f"{len(prompts)} prompts, {self.client.calls} API calls, {self.client.retries} retries so far")
+        return results
+
+    def close(self):
+        if not self._loop.is_closed():
+            self._loop.run_until_complete(self.client.close())
+            self._loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def generate_many(prompts: list[str], **client_kwargs) -> list[str]:
+    """
+    One-off blocking call: runs all prompts through a short-lived session
+    and returns their texts, raising the first failure. Callers that send
+    several rounds should keep a GeminiSession instead.
+    """
+    with GeminiSession(**client_kwargs) as session:
+        results = session.generate_many(prompts)
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return results
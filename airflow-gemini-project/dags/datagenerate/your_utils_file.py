@@ -5,7 +5,14 @@ import io
 import csv 
 import re
 import logging
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from utils.column_spec import COLUMN_KINDS, normalize_column_spec
+from utils.response_cache import cached_generate
+from utils.typed_schema import cast_to_schema
+from utils import telemetry
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -13,6 +20,17 @@ log = logging.getLogger(__name__)
 
 # --- Hardened API Configuration ---
 API_KEY = os.environ.get("GEMINI_API_KEY")
+MODEL_NAME = 'gemini-1.5-flash-latest'
+# Set high token limit to prevent truncation (the EOF error)
+# Set low temperature for consistent, non-creative formatting
+GENERATION_CONFIG = {"max_output_tokens": 8192, "temperature": 0.1}
+# Share of max_output_tokens a batch is sized to fill, leaving room for variance
+TOKEN_SAFETY_MARGIN = 0.75
+CHARS_PER_TOKEN = 4  # fallback estimate when count_tokens is unavailable
+# Appended to a response that stopped at max_output_tokens, so the cut-off
+# last row is recognized even when the text is replayed from the cache
+MAX_TOKENS_MARKER = "[finish_reason: MAX_TOKENS]"
+MAX_EMPTY_RESPONSES = 3
 model = None
 RETRYABLE_ERRORS = ()
 
@@ -21,7 +39,7 @@ if not API_KEY:
 else:
     try:
         genai.configure(api_key=API_KEY)
-        model = genai.GenerativeModel('gemini-1.5-flash-latest')
+        model = genai.GenerativeModel(MODEL_NAME)
         # Define retryable errors (must be done after genai is configured)
         RETRYABLE_ERRORS = (
             genai.types.generation_types.InternalServerError,
@@ -32,15 +50,64 @@ else:
 # --- End Configuration ---
 
 
+def clean_response_text(text: str) -> str:
+    """
+    Strips markdown code fences from a model response.
+    """
+    # --- More robust markdown cleaning ---
+    cleaned_text = text.strip()
+    # Use regex to find content inside ```...```, optional 'csv'
+    match = re.search(r"```(?:csv)?\n(.*?)\n```", cleaned_text, re.DOTALL | re.IGNORECASE)
+    if match:
+        cleaned_text = match.group(1).strip()
+    # Fallback for simple ``` wrapper
+    elif cleaned_text.startswith("```") and cleaned_text.endswith("```"):
+        cleaned_text = cleaned_text[3:-3].strip()
+    return cleaned_text
+
+
+def mark_truncated(text: str, finish_reason) -> str:
+    """Appends MAX_TOKENS_MARKER to `text` if the model stopped at the output limit."""
+    if str(getattr(finish_reason, "name", finish_reason)).upper() == "MAX_TOKENS":
+        return f"{text}\n{MAX_TOKENS_MARKER}"
+    return text
+
+
+def split_cut_off_row(csv_text: str) -> tuple[str, str | None]:
+    """
+    Separates the last row of a response that was cut off: one that
+    ends inside an open quote (odd number of quote characters) or carries
+    MAX_TOKENS_MARKER. Returns (complete rows, cut-off row or None).
+    """
+    text = csv_text.strip()
+    truncated = text.endswith(MAX_TOKENS_MARKER)
+    if truncated:
+        text = text[:-len(MAX_TOKENS_MARKER)].rstrip()
+    if not truncated and text.count('"') % 2 == 0:
+        return text, None
+
+    # The last record starts at the last line break outside quotes
+    lines = text.split("\n")
+    in_quotes = False
+    last_start = 0
+    for i, line in enumerate(lines):
+        if not in_quotes:
+            last_start = i
+        if line.count('"') % 2:
+            in_quotes = not in_quotes
+    return "\n".join(lines[:last_start]), "\n".join(lines[last_start:]) or None
+
+
 # --- MODIFIED FUNCTION FOR RAW TEXT ---
 @retry(
     # Only retry on specific, intermittent API errors
     retry=retry_if_exception_type(RETRYABLE_ERRORS), 
     wait=wait_exponential(multiplier=1, min=2, max=60), # Exponential backoff
     stop=stop_after_attempt(5), # Max 5 attempts
-    reraise=True # Reraise the last exception if all retries fail
+    reraise=True, # Reraise the last exception if all retries fail
+    before_sleep=lambda retry_state: telemetry.count("api_retries"),
 )
-def call_gemini_text(prompt_text: str) -> str:
+def _call_gemini_text_uncached(prompt_text: str) -> str:
     """
     Calls the Gemini API with retries and returns the raw text response.
     Includes robust error checking and markdown cleaning.
@@ -50,14 +117,10 @@ def call_gemini_text(prompt_text: str) -> str:
         raise ValueError("Gemini model not initialized.")
 
     # --- CRITICAL FIX ---
-    # Set high token limit to prevent truncation (the EOF error)
-    # Set low temperature for consistent, non-creative formatting
-    generation_config = genai.types.GenerationConfig(
-        max_output_tokens=8192,
-        temperature=0.1
-    )
+    generation_config = genai.types.GenerationConfig(**GENERATION_CONFIG)
     
     response = None
+    telemetry.count("api_calls")
     try:
         response = model.generate_content(
             prompt_text,
@@ -69,17 +132,8 @@ def call_gemini_text(prompt_text: str) -> str:
             log.error(f"Response object received: {response}")
             raise ValueError("Gemini API did not return valid content text.")
 
-        # --- More robust markdown cleaning ---
-        cleaned_text = response.text.strip()
-        # Use regex to find content inside ```...```, optional 'csv'
-        match = re.search(r"```(?:csv)?\n(.*?)\n```", cleaned_text, re.DOTALL | re.IGNORECASE)
-        if match:
-            cleaned_text = match.group(1).strip()
-        # Fallback for simple ``` wrapper
-        elif cleaned_text.startswith("```") and cleaned_text.endswith("```"):
-            cleaned_text = cleaned_text[3:-3].strip()
-        
-        return cleaned_text
+        finish_reason = response.candidates[0].finish_reason if response.candidates else None
+        return mark_truncated(clean_response_text(response.text), finish_reason)
 
     except Exception as e:
         log.error(f"Error calling Gemini or processing response: {e}")
@@ -87,10 +141,80 @@ def call_gemini_text(prompt_text: str) -> str:
             log.error(f"Full Gemini response (if available): {response}")
         # Tenacity will handle the retry/raise
         raise
+
+
+def call_gemini_text(prompt_text: str, seed=None, bypass_cache: bool = False, validate=None) -> str:
+    """
+    Returns the cleaned Gemini response for a prompt, from the response
+    cache when the same (model, prompt, config, seed) was answered before.
+    Pass a `seed` to keep otherwise identical calls apart (e.g. batches),
+    and `validate(text)` so that only usable responses are cached.
+    """
+    return cached_generate(
+        lambda: _call_gemini_text_uncached(prompt_text),
+        MODEL_NAME, prompt_text, GENERATION_CONFIG, seed=seed, bypass=bypass_cache, validate=validate,
+    )
 # --- END MODIFIED FUNCTION ---
 
 
 # --- UPDATED VALIDATION FOR CSV (with Logging) ---
+# A quoted field (kept as is) or a delimiter followed by spaces
+_QUOTED_OR_PADDED_DELIMITER = re.compile(r'("(?:[^"]|"")*")|,[ \t]+')
+
+
+def strip_spaces_after_delimiters(csv_string: str) -> str:
+    """
+    Drops spaces after commas outside quoted fields, like the csv
+    module's skipinitialspace, so `"x", 1, "y"` parses as x, 1, y.
+    """
+    if not re.search(r",[ \t]", csv_string):
+        return csv_string
+    return _QUOTED_OR_PADDED_DELIMITER.sub(lambda m: m.group(1) or ",", csv_string)
+
+
+def parse_csv_table(csv_string: str, columns: list[str] | None = None, has_header: bool = True,
+                    as_strings: bool = False) -> tuple[pa.Table, list[dict]]:
+    """
+    Validates and parses CSV text in a single pass with pyarrow's reader.
+    With `columns` the names are fixed (a header row, if any, is skipped);
+    otherwise they come from the header. Rows with the wrong number of
+    fields are skipped and returned as errors:
+    [{"row": <1-based number among non-empty lines>, "reason": ..., "text": <raw row>}].
+    `as_strings` keeps every value as text instead of inferring types.
+    Spaces after delimiters are ignored (see strip_spaces_after_delimiters).
+    Raises pyarrow.ArrowInvalid if the text has no parseable rows at all.
+    """
+    errors = []
+
+    def _on_invalid_row(row):
+        errors.append({
+            "row": row.number,
+            "reason": f"{row.actual_columns} fields, expected {row.expected_columns}",
+            "text": row.text,
+        })
+        return "skip"
+
+    read_options = pa_csv.ReadOptions(
+        column_names=columns or None,
+        autogenerate_column_names=not columns and not has_header,
+        skip_rows=1 if columns and has_header else 0,
+        use_threads=False,  # row numbers are only known to the serial reader
+    )
+    parse_options = pa_csv.ParseOptions(quote_char='"', invalid_row_handler=_on_invalid_row)
+    convert_options = pa_csv.ConvertOptions()
+    if as_strings:
+        if columns:
+            convert_options = pa_csv.ConvertOptions(column_types={c: pa.string() for c in columns},
+                                                    strings_can_be_null=False)
+        else:
+            convert_options = pa_csv.ConvertOptions(auto_dict_encode=False, strings_can_be_null=False)
+    table = pa_csv.read_csv(
+        io.BytesIO(strip_spaces_after_delimiters(csv_string.strip()).encode("utf-8")),
+        read_options=read_options, parse_options=parse_options, convert_options=convert_options,
+    )
+    return table, errors
+
+
 def verify_csv_data(csv_string: str) -> tuple[bool, int]:
     """
     Validates if the string is valid CSV and has consistent columns.
@@ -99,41 +223,19 @@ def verify_csv_data(csv_string: str) -> tuple[bool, int]:
     if not csv_string or not csv_string.strip():
         log.warning("Validation Error: Received empty string.")
         return False, 0
-        
+
     try:
-        # Use StringIO to treat the string as a file
-        f = io.StringIO(csv_string.strip())
-        reader = csv.reader(f, delimiter=',', quotechar='"', skipinitialspace=True)
-        
-        first_row = next(reader)
-        num_columns = len(first_row)
-        if num_columns == 0:
-            log.warning("Validation Error: First row has 0 columns.")
-            return False, 0
-
-        # Check subsequent rows for consistent column count
-        for i, row in enumerate(reader):
-            if len(row) != num_columns:
-                log.warning(f"Validation Error: Row {i+2} has {len(row)} columns, expected {num_columns}.")
-                log.warning(f"Problematic row: {row}")
-                return False, num_columns
-        
-        # If all rows passed
-        return True, num_columns
-        
-    except csv.Error as csv_err:
+        table, errors = parse_csv_table(csv_string)
+    except pa.ArrowInvalid as csv_err:
         log.warning(f"CSV Parsing Error during validation: {csv_err}")
         return False, 0
-    except StopIteration: # Handle case with only a header row
-        if num_columns > 0:
-            log.info("CSV Validation: File contains only a header row. Valid.")
-            return True, num_columns # Valid, just a header
-        else:
-            log.warning("Validation Error: CSV contains no data or header.")
-            return False, 0
-    except Exception as e:
-        log.error(f"Unexpected Error during CSV validation: {e}")
-        return False, 0
+
+    num_columns = table.num_columns
+    for error in errors:
+        log.warning(f"Validation Error: Row {error['row']} has {error['reason']}. Problematic row: {error['text']}")
+    if table.num_rows == 0 and not errors:
+        log.info("CSV Validation: File contains only a header row. Valid.")
+    return not errors, num_columns
 # --- END UPDATED VALIDATION ---
 
 
@@ -143,6 +245,16 @@ def get_gemini_csv_sample(prompt: str, num_rows: int = 5) -> pd.DataFrame | None
     Gets a small CSV sample from Gemini and returns it as a Pandas DataFrame.
     Returns None if generation or parsing fails.
     """
+    csv_text = get_gemini_csv_sample_text(prompt, num_rows)
+    return parse_csv_sample(csv_text, num_rows) if csv_text else None
+
+
+def get_gemini_csv_sample_text(prompt: str, num_rows: int = 5) -> str | None:
+    """
+    Gets a small CSV sample (header + rows) from Gemini as raw text, which
+    keeps what parsing loses (quoting, leading zeros). Returns None if
+    generation fails or the sample does not parse.
+    """
     # First check if API key is configured
     if not API_KEY:
         log.error("ERROR: GEMINI_API_KEY environment variable is not set")
@@ -187,42 +299,291 @@ def get_gemini_csv_sample(prompt: str, num_rows: int = 5) -> pd.DataFrame | None
     """
     try:
         log.info(f"Attempting to generate CSV sample with prompt: {prompt}")
-        csv_text = call_gemini_text(sample_prompt)
+        csv_text = call_gemini_text(sample_prompt, validate=lambda text: parse_csv_sample(text, num_rows) is not None)
         log.info(f"Received response from Gemini. Length: {len(csv_text) if csv_text else 0}")
         
         if not csv_text:
             log.error("ERROR: Received empty response from Gemini API")
             return None
-            
-        # Validate the sample
-        is_valid, num_cols = verify_csv_data(csv_text)
-        if not is_valid:
-            log.error("ERROR: Generated sample failed CSV validation")
-            log.error(f"Sample received (first 500 chars):\n {csv_text[:500]}")
-            return None
 
-        # Use StringIO and pandas to parse the CSV string
-        csv_io = io.StringIO(csv_text)
-        df = pd.read_csv(csv_io, quotechar='"', skipinitialspace=True)
-        
-        # Validate row count (relaxed: warn instead of fail for samples)
-        actual_rows = len(df)
-        if actual_rows != num_rows:
-            log.warning(f"WARNING: Generated {actual_rows} rows, but {num_rows} were requested. Proceeding with sample.")
-            if actual_rows == 0:
-                log.error("ERROR: Sample contains 0 data rows.")
-                return None
-            
-        # Validate header names
-        if any(not isinstance(col, str) or not col.strip() for col in df.columns):
-            log.error("ERROR: Invalid or empty column names in header")
+        df = parse_csv_sample(csv_text, num_rows)
+        if df is None:
+            log.error(f"Sample received (first 500 chars):\n {csv_text[:500]}")
             return None
-            
         log.info(f"Successfully generated and parsed sample with {len(df.columns)} columns.")
-        return df
+        return csv_text
 
     except Exception as e:
         # This will catch errors from call_gemini_text (like auth or retry failures)
         log.error(f"Error getting or parsing CSV sample: {e}")
         return None
-# --- END UPDATED SAMPLE FUNCTION ---
\ No newline at end of file
+
+
+def parse_csv_sample(csv_text: str, num_rows: int) -> pd.DataFrame | None:
+    """
+    Parses a sample response (header + rows) into a DataFrame; malformed
+    rows are dropped. Returns None if the sample is unusable.
+    """
+    # Validate and parse the sample in one pass; malformed rows are dropped
+    csv_text, cut_off_row = split_cut_off_row(csv_text)
+    if cut_off_row:
+        log.warning(f"WARNING: Dropped sample row cut off at the end of the response: {cut_off_row}")
+    try:
+        table, errors = parse_csv_table(csv_text)
+    except pa.ArrowInvalid as e:
+        log.error(f"ERROR: Generated sample failed CSV validation: {e}")
+        return None
+    for error in errors:
+        log.warning(f"WARNING: Dropped sample row {error['row']} ({error['reason']}): {error['text']}")
+    df = table.to_pandas()
+
+    # Validate row count (relaxed: warn instead of fail for samples)
+    actual_rows = len(df)
+    if actual_rows != num_rows:
+        log.warning(f"WARNING: Generated {actual_rows} rows, but {num_rows} were requested. Proceeding with sample.")
+        if actual_rows == 0:
+            log.error("ERROR: Sample contains 0 data rows.")
+            return None
+
+    # Validate header names
+    if any(not isinstance(col, str) or not col.strip() for col in df.columns):
+        log.error("ERROR: Invalid or empty column names in header")
+        return None
+    return df
+# --- END UPDATED SAMPLE FUNCTION ---
+
+# --- COLUMN SPEC FOR THE HYBRID ENGINE ---
+def get_gemini_column_spec(prompt: str, sample_df: pd.DataFrame | None = None,
+                           columns: list[str] | None = None) -> list[dict] | None:
+    """
+    Asks Gemini once for a typed column spec (see utils/column_spec.py)
+    that a local generator can expand to any number of rows.
+    Returns the validated spec, or None if generation or validation fails.
+    """
+    if not API_KEY:
+        log.error("ERROR: GEMINI_API_KEY environment variable is not set")
+        return None
+
+    examples = sample_df.head(10).to_csv(index=False) if sample_df is not None else "(none)"
+    column_rule = f"Use EXACTLY these columns, in this order: {', '.join(columns)}" if columns else \
+        "Choose column names that fit the request (or match the example header)."
+
+    spec_prompt = f"""
+    Based on the user's request: "{prompt}"
+
+    Example rows (CSV):
+    {examples}
+
+    Describe how to generate this dataset with Python Faker and NumPy.
+    Return a JSON array with one object per column. Every object has "name" and "kind".
+
+    ---
+    ### KINDS (use ONLY these: {', '.join(COLUMN_KINDS)})
+    -   "uuid": random UUID4 strings.
+    -   "sequence": unique ids, with "pattern" (Python format string, e.g. "E{{:05d}}") and "start".
+    -   "faker": a Faker provider method, with "provider" (e.g. "first_name", "email", "city", "company") and optional "kwargs".
+    -   "int": integers, with "min" and "max" (inclusive).
+    -   "float": decimals, with "min", "max" and optional "decimals".
+    -   "choice": categories, with "values" and optional "weights" (same length as values).
+    -   "datetime" / "date": with "start" and "end" as YYYY-MM-DD.
+    -   "bool": with "p", the probability of true.
+    Any column may add "null_fraction" (0-1) if the data should have missing values.
+
+    ---
+    ### RULES
+    1.  {column_rule}
+    2.  Ranges, categories and weights MUST be realistic for the request and consistent with the example rows.
+    3.  **CRITICAL: Return ONLY the JSON array. Do NOT include any other text or markdown formatting.**
+    """
+    try:
+        log.info(f"Requesting column spec for prompt: {prompt}")
+        # A spec that does not validate is not cached, so a retry asks again
+        spec_text = call_gemini_text(spec_prompt, validate=lambda text: parse_column_spec(text, columns))
+        spec = parse_column_spec(spec_text, columns)
+        log.info(f"Received column spec with {len(spec)} columns.")
+        return spec
+    except Exception as e:
+        log.error(f"Error getting or validating column spec: {e}")
+        return None
+
+
+def parse_column_spec(spec_text: str, columns: list[str] | None = None) -> list[dict]:
+    """Validated spec from a response; raises ValueError if it is not usable."""
+    # call_gemini_text only strips ```csv fences
+    spec_text = re.sub(r"^(?:```)?json\s*|```$", "", spec_text.strip()).strip()
+    return normalize_column_spec(spec_text, columns)
+# --- END COLUMN SPEC ---
+
+
+# --- TOKEN-BUDGET BATCH SIZING ---
+def count_tokens(text: str) -> int:
+    """
+    Counts tokens with the model's tokenizer, falling back to a
+    characters-per-token estimate if the API is not available.
+    """
+    if model:
+        try:
+            return model.count_tokens(text).total_tokens
+        except Exception as e:
+            log.warning(f"count_tokens failed, estimating instead: {e}")
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def measure_tokens_per_row(sample_df: pd.DataFrame) -> float:
+    """
+    Average output tokens per data row of a probe sample, rendered the
+    way the model is asked to write rows (non-numeric fields quoted).
+    """
+    rows_text = sample_df.to_csv(index=False, header=False, quoting=csv.QUOTE_NONNUMERIC)
+    return count_tokens(rows_text) / max(len(sample_df), 1)
+
+
+def rows_for_token_budget(tokens_per_row: float, max_output_tokens: int = GENERATION_CONFIG["max_output_tokens"],
+                          safety_margin: float = TOKEN_SAFETY_MARGIN) -> int:
+    """Rows per request that fill the output budget, minus the safety margin."""
+    return max(1, int(max_output_tokens * safety_margin // max(tokens_per_row, 1e-9)))
+
+
+def build_rows_prompt(user_prompt: str, columns: list[str], num_rows: int) -> str:
+    """Prompt for `num_rows` header-less CSV data rows with fixed columns."""
+    return f"""
+    Based on the user's request: "{user_prompt}"
+
+    Generate EXACTLY {num_rows} CSV data rows with these columns, in this order:
+    {", ".join(columns)}
+
+    ### RULES (MUST Follow)
+    1.  Do NOT include a header row.
+    2.  Use a comma (,) as the ONLY delimiter between fields.
+    3.  Enclose all **non-numeric** fields in double quotes ("); numeric fields are NOT quoted.
+    4.  Every row MUST have exactly {len(columns)} fields.
+    5.  The data MUST be realistic, varied, and relevant to the request.
+    6.  **CRITICAL: Return ONLY the raw CSV rows. Do NOT include any other text or markdown formatting.**
+    """
+
+
+def validate_csv_rows(csv_text: str, columns: list[str], expected_rows: int | None = None,
+                      schema: pa.Schema | None = None) -> dict:
+    """
+    Validates a header-less model response in one pyarrow parse, keeping
+    every well-formed row instead of failing the whole response. Returns
+    {"table": <Arrow table>, "rejects": [{"row", "reason", "text"}],
+    "missing": n, "returned": n}, where `missing` is how many rows still
+    have to be requested and `returned` how many complete rows the model
+    sent. A last row cut off at the output limit is rejected, so it is
+    requested again. The table is all strings, or cast to `schema` with
+    rows that do not fit it rejected.
+    """
+    csv_text, cut_off_row = split_cut_off_row(csv_text or "")
+    cut_off = [{"row": None, "reason": "cut off at the end of the response", "text": cut_off_row}] if cut_off_row else []
+    if not csv_text:
+        return {"table": _empty_table(columns, schema), "rejects": cut_off, "missing": expected_rows or 0, "returned": 0}
+    try:
+        table, rejects = parse_csv_table(csv_text, columns, has_header=False, as_strings=True)
+    except pa.ArrowInvalid as e:
+        table, rejects = _empty_table(columns), [{"row": None, "reason": f"unparseable: {e}", "text": None}]
+    returned = sum(1 for reject in rejects if reject["row"] is not None)
+    rejects.extend(cut_off)
+
+    # A header the model added anyway is a row equal to the column names
+    is_header = None
+    for name in columns:
+        matches = pc.equal(table[name], name)
+        is_header = matches if is_header is None else pc.and_(is_header, matches)
+    if table.num_rows and pc.any(is_header).as_py():
+        rejects.append({"row": None, "reason": "repeated header", "text": ",".join(columns)})
+        table = table.filter(pc.invert(is_header))
+    returned += table.num_rows
+
+    if expected_rows is not None and table.num_rows > expected_rows:
+        rejects.append({"row": None, "reason": f"{table.num_rows - expected_rows} more rows than requested", "text": None})
+        table = table.slice(0, expected_rows)
+    if schema is not None:
+        table = cast_to_schema(table, schema, rejects)
+
+    missing = max(expected_rows - table.num_rows, 0) if expected_rows is not None else 0
+    return {"table": table, "rejects": rejects, "missing": missing, "returned": returned}
+
+
+def _empty_table(columns: list[str], schema: pa.Schema | None = None) -> pa.Table:
+    if schema is not None:
+        return schema.empty_table()
+    return pa.table({name: pa.array([], pa.string()) for name in columns})
+
+
+def generate_csv_rows(user_prompt: str, columns: list[str], row_count: int, rows_per_request: int | None = None,
+                      seed=None, rejects: list | None = None, call_text=None, call_many=None,
+                      schema: pa.Schema | None = None) -> pa.Table:
+    """
+    Requests `row_count` rows in chunks of `rows_per_request` and returns
+    them as one Arrow table (all strings, or cast to `schema`). Every
+    well-formed row of a response is kept; malformed rows and rows that do
+    not fit the schema are appended to `rejects` (with their reason and
+    request number) and only the missing remainder is requested
+    again. After a short (truncated) response the chunk size is lowered to
+    what actually fit.
+
+    `call_text(prompt, seed, validate)` sends one request (default:
+    call_gemini_text), one chunk at a time. With `call_many(prompts,
+    seeds, validate)` (e.g. the async client) all chunks of the remainder
+    are sent together in each round, so a batch keeps many requests in
+    flight. `validate` accepts a response with at least one usable row;
+    responses it rejects are not cached.
+    """
+    call_text = call_text or call_gemini_text
+
+    def has_rows(text: str) -> bool:
+        # Checked against the run schema, so a response whose rows all fail it is not cached
+        return validate_csv_rows(text, columns, schema=schema)["table"].num_rows > 0
+
+    tables = []
+    received_rows = 0
+    request_size = rows_per_request or row_count
+    request_no = 0
+    empty_rounds = 0
+    while received_rows < row_count:
+        remaining = row_count - received_rows
+        if call_many is None:
+            sizes = [min(request_size, remaining)]
+        else:
+            sizes = [min(request_size, remaining - start) for start in range(0, remaining, request_size)]
+        prompts = [build_rows_prompt(user_prompt, columns, size) for size in sizes]
+        # The request number keeps repeated prompts apart in the response cache
+        seeds = [[seed, request_no + i] for i in range(len(sizes))]
+        if call_many is None:
+            texts = [call_text(prompts[0], seed=seeds[0], validate=has_rows)]
+        else:
+            texts = call_many(prompts, seeds, validate=has_rows)
+
+        round_kept = 0
+        short_returns = []
+        for wanted, text in zip(sizes, texts):
+            result = validate_csv_rows(text, columns, wanted, schema)
+            kept = result["table"].num_rows
+            tables.append(result["table"])
+            round_kept += kept
+            if rejects is not None:
+                rejects.extend({**reject, "request": request_no} for reject in result["rejects"])
+            if result["rejects"]:
+                log.warning(f"Request {request_no}: kept {kept} rows, rejected {len(result['rejects'])} "
+                            f"(first: {result['rejects'][0]['reason']})")
+            if result["missing"]:
+                returned = result["returned"]
+                if returned < wanted:
+                    # Short response: truncated at the output budget, so ask for less at once
+                    short_returns.append(returned or wanted // 2)
+            request_no += 1
+        received_rows += round_kept
+
+        if received_rows < row_count:
+            # Only consecutive rounds without a usable row count towards the limit
+            empty_rounds = 0 if round_kept else empty_rounds + 1
+            if empty_rounds >= MAX_EMPTY_RESPONSES:
+                raise ValueError(f"No usable rows after {empty_rounds} attempts ({received_rows}/{row_count} rows)")
+            if short_returns:
+                request_size = max(1, min(short_returns))
+            log.warning(f"Received {received_rows}/{row_count} rows, requesting the remaining "
+                        f"{row_count - received_rows} in chunks of {request_size}")
+    log.info(f"Generated {received_rows} rows in {request_no} requests")
+    return pa.concat_tables(tables) if tables else _empty_table(columns, schema)
+# --- END TOKEN-BUDGET BATCH SIZING ---
@@ -5,7 +5,6 @@ import json
 from datetime import datetime
 from typing import Dict, List
 from pathlib import Path
-import re
 
 from airflow.decorators import dag, task
 from airflow.models.param import Param
@@ -16,12 +15,31 @@ from airflow.models.xcom_arg import XComArg
 import sys
 sys.path.append('/opt/airflow/scripts')
 from gemini_worker import GeminiWorker
+from utils.combine import (
+    COMPRESSION_TYPES, TYPED_FORMATS, combine_feather, combine_parquet, finalize_dataset,
+    stream_combine_csv, stream_combine_json, write_table_batch,
+)
+from utils.column_spec import generate_from_spec, spec_from_sample
+from utils.typed_schema import (
+    cast_to_schema, parse_columns_from_prompt, schema_from_column_spec, schema_from_csv_sample, schema_from_json, string_schema,
+)
+from utils.seeding import batch_seed, resolve_run_seed
+from utils.telemetry import track
+from datagenerate.your_utils_file import (
+    get_gemini_column_spec, get_gemini_csv_sample, get_gemini_csv_sample_text, measure_tokens_per_row,
+    parse_csv_sample, rows_for_token_budget,
+)
 
 # Constants
 OUTPUT_DIR = "/opt/airflow/data/pipeline_runs"
 TEMP_DIR = "/opt/airflow/data/temp"
-DEFAULT_BATCH_SIZE = 100  # Reduced batch size for better parallelization
+DEFAULT_BATCH_SIZE = 100  # Used when the token probe fails
+PROBE_ROWS = 10  # Sample rows used to measure tokens per row
 MAX_ACTIVE_TASKS = 5  # Control parallel execution
+# Hybrid batches are generated locally, so they are not bound by API limits
+HYBRID_MIN_BATCH_SIZE = 50_000
+COLUMN_SPEC_FILE_NAME = "column_spec.json"
+SEED_STREAM = "synthetic"
 
 @dag(
     dag_id="synthetic_data_generator",
@@ -39,18 +57,37 @@ MAX_ACTIVE_TASKS = 5  # Control parallel execution
         "output_format": Param(
             default="csv",
             type="string",
-            enum=["csv", "json"],
+            enum=["csv", "json", "parquet", "feather"],
             description="Output format for the generated data"
         ),
+        "compression": Param(
+            default="snappy",
+            type="string",
+            enum=COMPRESSION_TYPES,
+            description="Compression codec for parquet/feather output (feather supports lz4 and zstd only)"
+        ),
+        "layout": Param(
+            default="single_file",
+            type="string",
+            enum=["single_file", "dataset"],
+            description="parquet/feather only: one combined file, or a directory of part files written directly by the batches"
+        ),
         "total_rows": Param(
             default=1000000,
             type="integer",
             description="Total number of rows to generate"
         ),
         "batch_size": Param(
-            default=DEFAULT_BATCH_SIZE,
+            default=0,
             type="integer",
-            description="Number of rows per batch"
+            minimum=0,
+            description="Number of rows per batch (0 = as many as fit in one response's output token budget)"
+        ),
+        "engine": Param(
+            default="llm",
+            type="string",
+            enum=["llm", "hybrid"],
+            description="llm: Gemini writes every batch. hybrid: one Gemini call infers a column spec, batches are generated locally with Faker/NumPy"
         )
     }
 )
@@ -58,180 +95,224 @@ def synthetic_data_generator():
     """
     DAG to generate large-scale synthetic datasets using the Gemini API.
     Uses dynamic task mapping for parallel generation of data batches.
+
+    With engine="hybrid", prepare_batches asks Gemini for a few example
+    rows and a typed column spec, and every batch is then generated
+    locally from that spec (no further API calls). Pass {"seed": <int>}
+    in the run conf for reproducible hybrid output.
     """
 
     # Start node
     start = EmptyOperator(task_id="start")
 
-    @task
-    def prepare_batches(**context) -> List[Dict]:
+    @task(multiple_outputs=True)
+    def prepare_batches(**context) -> Dict:
         """
-        Calculate the number of batches needed and prepare batch configurations
+        Calculate the number of batches needed and prepare batch configurations.
+        Also resolves the run's typed schema ([{"name", "type"}], or None if
+        the columns are unknown), which every batch is cast to.
         """
         params = context["params"]
         total_rows = params["total_rows"]
         batch_size = params["batch_size"]
         run_id = context["run_id"]
+        hybrid = params["engine"] == "hybrid"
 
-        # Calculate number of batches
-        num_batches = (total_rows + batch_size - 1) // batch_size
-        
         # Create output directory
         run_output_dir = os.path.join(OUTPUT_DIR, run_id)
         temp_dir = os.path.join(TEMP_DIR, run_id)
         os.makedirs(run_output_dir, exist_ok=True)
         os.makedirs(temp_dir, exist_ok=True)
 
+        # Try to extract explicit column names from the user prompt so we can enforce the same schema across batches
+        parsed_columns = parse_columns_from_prompt(params.get("user_prompt", ""))
+        schema = string_schema(parsed_columns) if parsed_columns else None
+
+        # --- Hybrid engine: one Gemini call for the column spec ---
+        spec_path = None
+        if hybrid:
+            sample_df = get_gemini_csv_sample(params["user_prompt"])
+            column_spec = get_gemini_column_spec(params["user_prompt"], sample_df, parsed_columns or None)
+            if column_spec is None and sample_df is not None:
+                print("No usable column spec from Gemini, inferring one from the sample rows")
+                column_spec = spec_from_sample(sample_df)
+            if column_spec is None:
+                raise ValueError("Could not build a column spec for the hybrid engine")
+            parsed_columns = [column["name"] for column in column_spec]
+            schema = schema_from_column_spec(column_spec)
+            spec_path = os.path.join(run_output_dir, COLUMN_SPEC_FILE_NAME)
+            with open(spec_path, "w") as f:
+                json.dump(column_spec, f, indent=2)
+            print(f"Column spec saved to {spec_path}: {parsed_columns}")
+            if batch_size < HYBRID_MIN_BATCH_SIZE:
+                print(f"Hybrid engine: raising batch size from {batch_size} to {HYBRID_MIN_BATCH_SIZE}")
+                batch_size = HYBRID_MIN_BATCH_SIZE
+
+        # --- LLM engine: size requests from the output token budget ---
+        rows_per_request = None
+        if not hybrid:
+            probe_text = get_gemini_csv_sample_text(params["user_prompt"], num_rows=PROBE_ROWS)
+            if probe_text is not None:
+                tokens_per_row = measure_tokens_per_row(parse_csv_sample(probe_text, PROBE_ROWS))
+                rows_per_request = rows_for_token_budget(tokens_per_row)
+                print(f"Probe: {tokens_per_row:.1f} tokens per row, {rows_per_request} rows per request")
+                # The probe's types become the run's schema; quoted, zero-padded and id columns stay text
+                schema = schema_from_csv_sample(probe_text, parsed_columns or None)
+                parsed_columns = [column["name"] for column in schema]
+            if batch_size <= 0:
+                batch_size = rows_per_request or DEFAULT_BATCH_SIZE
+
+        # Calculate number of batches
+        num_batches = (total_rows + batch_size - 1) // batch_size
+
         print(f"Starting Run: {run_id}")
         print(f"Total Rows: {total_rows}")
         print(f"Batch Size: {batch_size}")
         print(f"Number of Batches: {num_batches}")
+        print(f"Schema: {schema}")
 
         # Prepare batch configurations
         batch_configs = []
         remaining_rows = total_rows
+        run_seed = resolve_run_seed(context["dag_run"].conf or {}, run_id)
 
-        # Try to extract explicit column names from the user prompt so we can enforce the same schema across batches
-        def _parse_columns_from_prompt(p: str) -> List[str]:
-            m = re.search(r"columns?\s*:\s*(.+)", p, flags=re.IGNORECASE)
-            if not m:
-                return []
-            cols_raw = m.group(1)
-            cols = []
-            for part in cols_raw.split(','):
-                name = re.sub(r"\(.*?\)", "", part).strip()
-                name = re.sub(r"\s+", "_", name)
-                name = name.strip(' "\'')
-                if name:
-                    cols.append(name)
-            return cols
-
-        parsed_columns = _parse_columns_from_prompt(params.get("user_prompt", ""))
+        output_format = params["output_format"]
+        typed = output_format in TYPED_FORMATS
+        # Dataset layout: batches write their part files straight into the final directory
+        dataset_dir = os.path.join(run_output_dir, "final_output") if typed and params["layout"] == "dataset" else None
+        if dataset_dir:
+            os.makedirs(dataset_dir, exist_ok=True)
 
         for i in range(num_batches):
             # Handle the last batch which might be smaller
             current_batch_size = min(batch_size, remaining_rows)
             
+            if dataset_dir:
+                output_path = os.path.join(dataset_dir, f"part-{i:05d}.{output_format}")
+            else:
+                output_path = os.path.join(temp_dir, f"batch_{i:04d}.{output_format}")
+
             batch_configs.append({
                 "batch_id": i,
                 "rows": current_batch_size,
+                "engine": params["engine"],
+                "rows_per_request": rows_per_request,
+                "column_spec_path": spec_path,
+                "start_row": i * batch_size,
+                "seed": batch_seed(run_seed, SEED_STREAM, i),
                 "prompt": params["user_prompt"],
-                "format": params["output_format"],
-                "output_path": os.path.join(temp_dir, f"batch_{i:04d}.{params['output_format']}"),
+                "format": output_format,
+                "rejects_path": os.path.join(temp_dir, f"batch_{i:04d}.rejects.jsonl"),
+                "output_path": output_path,
+                "compression": params["compression"],
                 "columns": parsed_columns,
+                "schema": schema,
                 "run_id": run_id
             })
             
             remaining_rows -= current_batch_size
 
-        return batch_configs
+        return {"batches": batch_configs, "schema": schema}
 
     @task(max_active_tis_per_dag=MAX_ACTIVE_TASKS)
-    def generate_batch(batch_config: dict) -> str:
+    def generate_batch(batch_config: dict, **context) -> str:
         """
         Generate a batch of synthetic data using the Gemini worker
         """
-        worker = GeminiWorker()
-        
-        # Optimize prompt for batch generation
-        batch_prompt = f"""
-        Generate exactly {batch_config['rows']} rows of data.
-        Structure: {batch_config['prompt']}
-        Format: Keep it concise, focus on essential data only.
-        """
-        
-        try:
-            # Use parsed columns (if any) to ensure consistent schema
-            columns = batch_config.get("columns", None)
-            worker.generate_and_save(
-                user_prompt=batch_config["prompt"],
-                output_format=batch_config["format"],
-                row_count=batch_config["rows"],
-                output_path=batch_config["output_path"],
-                columns=columns
-            )
-            
-            return batch_config["output_path"]
-            
-        except Exception as e:
-            print(f"Error in batch {batch_config['batch_id']}: {e}")
-            raise
+        schema = schema_from_json(batch_config["schema"]) if batch_config.get("schema") else None
+
+        with track(context["dag"].dag_id, "generate_batch", batch_config["batch_id"], run_id=batch_config["run_id"],
+                   engine=batch_config.get("engine", "llm")) as metrics:
+            if batch_config.get("engine") == "hybrid":
+                # Local generation from the column spec, no API calls
+                with open(batch_config["column_spec_path"], "r") as f:
+                    column_spec = json.load(f)
+                table = generate_from_spec(column_spec, batch_config["rows"], batch_config["seed"], batch_config["start_row"])
+                table = cast_to_schema(table, schema)
+                write_table_batch(table, batch_config["output_path"], batch_config["format"], batch_config["compression"])
+                print(f"Batch {batch_config['batch_id']}: generated {table.num_rows} rows locally")
+                metrics["rows"] = table.num_rows
+                metrics["output_path"] = batch_config["output_path"]
+                return batch_config["output_path"]
+
+            worker = GeminiWorker()
+
+            try:
+                # Use parsed columns (if any) to ensure consistent schema
+                columns = batch_config.get("columns", None)
+                # Rows are cast to the run's schema before they are written
+                metrics["rows"] = worker.generate_and_save(
+                    user_prompt=batch_config["prompt"],
+                    output_format=batch_config["format"],
+                    row_count=batch_config["rows"],
+                    output_path=batch_config["output_path"],
+                    columns=columns,
+                    rows_per_request=batch_config["rows_per_request"],
+                    seed=batch_config["seed"],
+                    schema=schema,
+                    compression=batch_config["compression"],
+                    rejects_path=batch_config["rejects_path"],
+                )
+                # Requests to the backend, including ones answered from the response cache
+                metrics["requests"] = worker.calls
+                metrics["output_path"] = batch_config["output_path"]
+
+                return batch_config["output_path"]
+
+            except Exception as e:
+                print(f"Error in batch {batch_config['batch_id']}: {e}")
+                raise
+            finally:
+                # One client per task: its connections and rate state span all request rounds
+                worker.close()
 
     @task
-    def combine_files(batch_files: List[str], **context) -> str:
+    def combine_files(batch_files: List[str], schema: List[Dict] | None, **context) -> str:
         """
         Combine all generated batch files into a single output file
+        (for the dataset layout, the part directory itself is the output)
         """
         params = context["params"]
         run_id = context["run_id"]
         output_format = params["output_format"].lower()
+        compression = params["compression"]
+        dataset = output_format in TYPED_FORMATS and params["layout"] == "dataset"
         
         # Define output paths
         run_output_dir = os.path.join(OUTPUT_DIR, run_id)
-        final_path = os.path.join(run_output_dir, f"final_output.{output_format}")
+        if dataset:
+            final_path = os.path.join(run_output_dir, "final_output")
+        else:
+            final_path = os.path.join(run_output_dir, f"final_output.{output_format}")
         
+        typed_schema = schema_from_json(schema) if schema else None
         print(f"Combining {len(batch_files)} batch files into {final_path}")
         
         try:
             if output_format == 'csv':
-                # For CSV, we need to handle headers and concatenation carefully
-                import pandas as pd
-                
-                # Determine expected columns from the user prompt
-                def _parse_columns_from_prompt(p: str) -> List[str]:
-                    m = re.search(r"columns?\s*:\s*(.+)", p, flags=re.IGNORECASE)
-                    if not m:
-                        return []
-                    cols_raw = m.group(1)
-                    cols = []
-                    for part in cols_raw.split(','):
-                        name = re.sub(r"\(.*?\)", "", part).strip()
-                        name = re.sub(r"\s+", "_", name)
-                        name = name.strip(' "\'')
-                        if name:
-                            cols.append(name)
-                    return cols
-
-                expected_columns = _parse_columns_from_prompt(params.get("user_prompt", ""))
-
-                # Read and combine all CSV files (worker produces data rows only, no header)
-                dfs = []
-                for file in sorted(batch_files):
-                    if os.path.exists(file):
-                        if expected_columns:
-                            # read rows without header, assign expected column names
-                            df = pd.read_csv(file, header=None, names=expected_columns)
-                        else:
-                            # Fallback: try to read and let pandas infer columns (risky)
-                            df = pd.read_csv(file)
-                        dfs.append(df)
-                        os.remove(file)  # Clean up batch file
-                
-                if dfs:
-                    combined_df = pd.concat(dfs, ignore_index=True)
-                    combined_df.to_csv(final_path, index=False)
-                else:
-                    raise ValueError("No valid batch files found to combine")
-                    
+                # Append batches under a single header, cast to the run's schema
+                # (worker produces data rows only, no header)
+                rows = stream_combine_csv(batch_files, final_path, schema=typed_schema)
+                print(f"Wrote {rows} rows")
+
+            elif dataset:
+                # Part files are already in place; only mismatched schemas get rewritten
+                rows = finalize_dataset(batch_files, compression, schema=typed_schema)
+                print(f"Dataset has {rows} rows in {len(batch_files)} parts")
+
+            elif output_format == 'parquet':
+                # One row group per batch, no text re-parsing
+                rows = combine_parquet(batch_files, final_path, compression, schema=typed_schema)
+                print(f"Wrote {rows} rows")
+
+            elif output_format == 'feather':
+                rows = combine_feather(batch_files, final_path, compression, schema=typed_schema)
+                print(f"Wrote {rows} rows")
+
             else:  # JSON format
-                combined_data = []
-                
-                # Read and combine all JSON files
-                for file in sorted(batch_files):
-                    if os.path.exists(file):
-                        with open(file, 'r', encoding='utf-8') as f:
-                            batch_data = json.load(f)
-                            if isinstance(batch_data, list):
-                                combined_data.extend(batch_data)
-                            else:
-                                combined_data.append(batch_data)
-                        os.remove(file)  # Clean up batch file
-                
-                if combined_data:
-                    with open(final_path, 'w', encoding='utf-8') as f:
-                        json.dump(combined_data, f, indent=2)
-                else:
-                    raise ValueError("No valid batch files found to combine")
+                # Stream records into one JSON array, one batch at a time
+                records = stream_combine_json(batch_files, final_path)
+                print(f"Wrote {records} records")
             
             # Clean up temp directory
             temp_dir = os.path.join(TEMP_DIR, run_id)
@@ -253,12 +334,12 @@ def synthetic_data_generator():
     end = EmptyOperator(task_id="end")
 
     # Define the DAG flow
-    batch_configs = prepare_batches()
-    generated_files = generate_batch.expand(batch_config=batch_configs)
-    final_output = combine_files(generated_files)
+    plan = prepare_batches()
+    generated_files = generate_batch.expand(batch_config=plan["batches"])
+    final_output = combine_files(generated_files, plan["schema"])
 
     # Set up the task dependencies
-    start >> batch_configs >> generated_files >> final_output >> end
+    start >> plan >> generated_files >> final_output >> end
 
 # Instantiate the DAG
 synthetic_data_generator()
\ No newline at end of file
@@ -1,73 +1,210 @@
-import pandas as pd
+import glob
+import os
+import time
 from airflow.decorators import dag, task
+from airflow.exceptions import AirflowSkipException
+from airflow.models.param import Param
 from airflow.utils.dates import days_ago
 from datetime import datetime
-import importlib
+from utils.seeding import resolve_run_seed
+from utils.manifest import Manifest
+from utils.module_loader import load_generator
+from utils.batch_runner import METRICS_DAG_ID, batch_file_path, build_batch, run_batch, run_batches_in_pool
+from utils.export import export_csv_gz
+from utils.telemetry import record_plan
 
 # --- Configuration ---
-ROWS_PER_BATCH = 10_000
-TOTAL_BATCHES = 100
+DEFAULT_TOTAL_ROWS = 1_000_000
+DEFAULT_ROWS_PER_BATCH = 10_000
+DEFAULT_TARGET_BATCH_SECONDS = 60
+# Auto-sizing bounds and probe sizes (two sizes separate fixed and per-row cost)
+MIN_ROWS_PER_BATCH = 1_000
+MAX_ROWS_PER_BATCH = 1_000_000
+PROBE_ROWS = (500, 2_500)
+# Task concurrency is fixed when the DAG is parsed, so it is set through
+# the environment rather than the run conf.
+MAX_ACTIVE_TIS = int(os.environ.get("AI_DATA_GENERATOR_MAX_ACTIVE_TIS", os.cpu_count() or 4))
 OUTPUT_PATH = "/opt/airflow/data/generated_users"
+EXPORT_PATH = "/opt/airflow/data/full_dataset.csv.gz" # Offered for download by app.py
 GENERATOR_MODULE_PATH = "utils.generator"
+SEED_STREAM = "users" # Name of this DAG's seed stream (see utils.seeding)
+
+def auto_rows_per_batch(generator_module, target_seconds: float) -> int:
+    """
+    Picks a batch size so one mapped task takes about `target_seconds`,
+    from a short probe run at two sizes (fixed cost + per-row cost).
+    """
+    small, large = PROBE_ROWS
+    timings = []
+    for rows in PROBE_ROWS:
+        start = time.perf_counter()
+        build_batch(generator_module, rows, seed=0)
+        timings.append(time.perf_counter() - start)
+
+    # Timing noise can make the difference tiny or negative; floor it
+    per_row = max((timings[1] - timings[0]) / (large - small), timings[1] / large / 10, 1e-9)
+    fixed = max(timings[0] - per_row * small, 0.0)
+    rows = int((target_seconds - fixed) / per_row)
+    rows = min(max(rows // 1_000 * 1_000, MIN_ROWS_PER_BATCH), MAX_ROWS_PER_BATCH)
+    print(f"Probe: {per_row * 1e6:.1f} us/row, {fixed * 1000:.0f} ms fixed -> {rows} rows per batch")
+    return rows
 
 @dag(
     dag_id="ai_data_generator_1M",
     start_date=days_ago(1),
     schedule_interval=None,
+    max_active_tasks=MAX_ACTIVE_TIS,
     tags=["gemini", "data-generation", "batch"],
+    params={
+        "total_rows": Param(
+            default=DEFAULT_TOTAL_ROWS,
+            type="integer",
+            minimum=1,
+            description="Total number of rows to generate"
+        ),
+        "rows_per_batch": Param(
+            default=DEFAULT_ROWS_PER_BATCH,
+            type="integer",
+            minimum=0,
+            description="Rows per mapped task. 0 = auto-size from a probe run of the generator"
+        ),
+        "target_batch_seconds": Param(
+            default=DEFAULT_TARGET_BATCH_SECONDS,
+            type="integer",
+            minimum=1,
+            description="Target duration of one mapped task when rows_per_batch is 0"
+        ),
+        "execution_mode": Param(
+            default="mapped",
+            type="string",
+            enum=["mapped", "pool"],
+            description="mapped: one Airflow task per batch. pool: one task runs all batches on a local process pool"
+        ),
+        "pool_workers": Param(
+            default=0,
+            type="integer",
+            minimum=0,
+            description="Worker processes in pool mode. 0 = one per CPU core"
+        ),
+        "export_csv_gz": Param(
+            default=False,
+            type="boolean",
+            description="Also build full_dataset.csv.gz from the batches for download"
+        ),
+    },
 )
 def generate_1m_users_dag():
     """
-    DAG to generate 1 million user records in parallel batches.
+    DAG to generate user records (1 million by default) in parallel batches.
     It uses a generator function (created by Gemini and saved
     in Streamlit) to define the schema.
+
+    `total_rows` and `rows_per_batch` can be set as params or conf;
+    `rows_per_batch=0` sizes batches from a probe run so each mapped
+    task lands near `target_batch_seconds`. The number of concurrent
+    batch tasks comes from AI_DATA_GENERATOR_MAX_ACTIVE_TIS.
+
+    With `execution_mode="pool"` a single task generates every batch on
+    a ProcessPoolExecutor across all local cores, avoiding per-task
+    scheduling overhead. Batch files and their order are the same in
+    both modes.
+
+    Pass {"seed": <int>} in the run conf for reproducible output:
+    every batch is seeded from (seed, batch_id), so reruns and
+    retries write exactly the same rows. Batches already recorded in
+    the output manifest with the same generator code, seed and row
+    count are skipped.
+
+    With `export_csv_gz` set, a last task streams the batches into
+    `full_dataset.csv.gz` for the download in app.py.
     """
 
-    @task
-    def define_batches() -> list[int]:
-        return list(range(TOTAL_BATCHES))
+    @task(multiple_outputs=True)
+    def define_batches(**context) -> dict:
+        """
+        Splits `total_rows` into batches and removes batch files left
+        over from earlier runs with a different batch layout. The
+        batches go to the stage of the selected execution mode.
+        """
+        params = context["params"]
+        total_rows = params["total_rows"]
+        rows_per_batch = params["rows_per_batch"]
 
-    @task
-    def generate_and_save_batch(batch_id: int):
+        if rows_per_batch == 0:
+            generator_module = load_generator(GENERATOR_MODULE_PATH)
+            rows_per_batch = auto_rows_per_batch(generator_module, params["target_batch_seconds"])
+
+        batches = []
+        for batch_id, start in enumerate(range(0, total_rows, rows_per_batch)):
+            batches.append({"batch_id": batch_id, "start": start, "rows": min(rows_per_batch, total_rows - start)})
+        print(f"Total Rows: {total_rows}, Rows per Batch: {rows_per_batch}, Batches: {len(batches)}")
+
+        # --- Remove stale batches so the output only holds this layout ---
+        manifest = Manifest(OUTPUT_PATH)
+        planned = {batch_file_path(OUTPUT_PATH, b["batch_id"]) for b in batches}
+        for path in glob.glob(f"{OUTPUT_PATH}/user_batch_*.parquet"):
+            if path not in planned:
+                os.remove(path)
+                manifest.forget(os.path.basename(path))
+                print(f"Removed stale batch {os.path.basename(path)}")
+
+        # The apps follow pool mode, which is a single task, through the batch records
+        batch_task = "generate_batches_in_pool" if params["execution_mode"] == "pool" else "generate_and_save_batch"
+        record_plan(METRICS_DAG_ID, context["run_id"], {batch_task: len(batches)})
+        if params["execution_mode"] == "pool":
+            return {"mapped": [], "pool": batches}
+        return {"mapped": batches, "pool": []}
+
+    @task(max_active_tis_per_dag=MAX_ACTIVE_TIS)
+    def generate_and_save_batch(batch: dict, **context):
         """
         A single mapped task that imports the LATEST generator
-        code, runs it 10k times, and saves to Parquet.
+        code, generates one batch of rows, and saves to Parquet.
+
+        If the generator exposes `generate_batch(n, seed, start)`, the whole
+        batch is built in one vectorized call. Otherwise we fall back
+        to calling `generate_data()` once per row.
         """
-        
-        # --- Reload the module ---
-        # This is critical. It forces Airflow to re-import the
-        # generator.py file that you saved from Streamlit,
-        # rather than using a cached version.
-        try:
-            # Dynamically import the module
-            generator_module = importlib.import_module(GENERATOR_MODULE_PATH)
-            # Reload it to get the latest changes
-            importlib.reload(generator_module)
-            
-            # Get the generation function
-            generate_data = getattr(generator_module, "generate_data")
-            
-        except Exception as e:
-            print(f"Error importing generator function: {e}")
-            raise
-
-        print(f"--- Starting batch {batch_id} ---")
-        data = [generate_data() for _ in range(ROWS_PER_BATCH)]
-        
-        df = pd.DataFrame(data)
-        file_path = f"{OUTPUT_PATH}/user_batch_{batch_id:03d}.parquet"
-        df.to_parquet(file_path, index=False)
-        
-        print(f"--- Finished batch {batch_id}, saved to {file_path} ---")
-        return file_path
+        run_seed = resolve_run_seed(context["dag_run"].conf, context["run_id"])
+        return run_batch(batch, run_seed, OUTPUT_PATH, GENERATOR_MODULE_PATH, SEED_STREAM, run_id=context["run_id"])
 
     @task
-    def consolidate_results(file_paths: list[str]):
+    def generate_batches_in_pool(batches: list[dict], **context) -> list[str]:
+        """
+        Pool mode: generates all batches in this one task, one worker
+        process per core, each writing its own batch files.
+        """
+        if not batches:
+            raise AirflowSkipException("Batches run as mapped tasks.")
+        run_seed = resolve_run_seed(context["dag_run"].conf, context["run_id"])
+        max_workers = context["params"]["pool_workers"] or None
+        return run_batches_in_pool(batches, run_seed, OUTPUT_PATH, GENERATOR_MODULE_PATH, SEED_STREAM, max_workers,
+                                   run_id=context["run_id"])
+
+    # Only one of the two generation stages runs; the other is skipped
+    @task(trigger_rule="none_failed_min_one_success")
+    def consolidate_results(mapped_files: list[str] | None, pool_files: list[str] | None) -> list[str]:
+        file_paths = sorted(list(mapped_files or []) + list(pool_files or []))
         print(f"Successfully generated {len(file_paths)} batches.")
+        return file_paths
+
+    @task
+    def export_dataset(file_paths: list[str], **context):
+        """
+        Optional export stage: streams all batches into one CSV.gz
+        (one record batch in memory at a time) and records it in the
+        manifest, so the UI can offer it without building it.
+        """
+        if not context["params"]["export_csv_gz"]:
+            raise AirflowSkipException("CSV.gz export not requested.")
+        entry = export_csv_gz(file_paths, EXPORT_PATH)
+        print(f"Export: {entry['rows']} rows, {entry['bytes'] / 1e6:.1f} MB")
 
     # --- Define the DAG structure ---
-    batch_list = define_batches()
-    generated_files = generate_and_save_batch.expand(batch_id=batch_list)
-    consolidate_results(generated_files)
+    batch_plan = define_batches()
+    mapped_files = generate_and_save_batch.expand(batch=batch_plan["mapped"])
+    pool_files = generate_batches_in_pool(batch_plan["pool"])
+    batch_files = consolidate_results(mapped_files, pool_files)
+    export_dataset(batch_files)
 
-generate_1m_users_dag()
\ No newline at end of file
+generate_1m_users_dag()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Import the DAG helpers the way Airflow does (dags/ on sys.path)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
@@ -0,0 +1,72 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# A local stand-in for POST /v1beta/models/<model>:generateContent. The
+# first `quota_errors` requests get 429 RESOURCE_EXHAUSTED; the others
+# answer with `respond(prompt)` after `delay(prompt)` seconds.
+
+
+class MockGemini:
+    def __init__(self, respond, quota_errors: int = 0, delay=None):
+        self.respond = respond
+        self.quota_errors = quota_errors
+        self.delay = delay or (lambda prompt: 0)
+        self.requests = 0
+        self.client_ports = set()  # One per connection the client opened
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.base_url = f"http://127.0.0.1:{self._server.server_port}"
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                prompt = body["contents"][0]["parts"][0]["text"]
+                with mock._lock:
+                    mock.requests += 1
+                    mock.client_ports.add(self.client_address[1])
+                    quota_error = mock.requests <= mock.quota_errors
+                if quota_error:
+                    self._send(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}})
+                    return
+                time.sleep(mock.delay(prompt))
+                self._send(200, {
+                    "candidates": [{"content": {"parts": [{"text": mock.respond(prompt)}]}}],
+                    "usageMetadata": {"totalTokenCount": len(prompt) // 4},
+                })
+
+            def _send(self, status, payload):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+        return False
+
+
+def rows_response(prompt: str) -> str:
+    """Answers a build_rows_prompt prompt with the requested number of rows."""
+    count = int(re.search(r"EXACTLY (\d+)", prompt).group(1))
+    names = [n.strip() for n in re.search(r"these columns, in this order:\s*\n\s*(.+)", prompt).group(1).split(",")]
+    return "\n".join(",".join(f'"{name}_{i}"' for name in names) for i in range(count))
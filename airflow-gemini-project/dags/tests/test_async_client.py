@@ -0,0 +1,134 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+from datagenerate.async_client import AsyncGeminiClient, GeminiSession, TokenBucket, generate_many
+from datagenerate.your_utils_file import generate_csv_rows
+from mock_gemini import MockGemini, rows_response
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "scripts"))
+from gemini_worker import AsyncGeminiBackend, GeminiWorker  # noqa: E402
+
+CLIENT = {"api_key": "test", "rpm": 6000, "tpm": 10_000_000, "backoff_seconds": 0.01}
+
+
+def test_results_keep_prompt_order_when_responses_finish_out_of_order():
+    prompts = [f"prompt {i}" for i in range(8)]
+    # Earlier prompts answer later
+    delay = lambda prompt: (8 - int(prompt.split()[-1])) * 0.02
+    with MockGemini(respond=lambda prompt: f"answer to {prompt}", delay=delay) as mock:
+        texts = generate_many(prompts, base_url=mock.base_url, max_concurrency=8, **CLIENT)
+
+    assert texts == [f"answer to {prompt}" for prompt in prompts]
+
+
+def test_quota_errors_are_retried_with_backoff_and_slow_the_client_down():
+    async def run(base_url):
+        async with AsyncGeminiClient(base_url=base_url, max_concurrency=2, **CLIENT) as client:
+            texts = await client.generate_many(["a", "b", "c"])
+            return texts, client
+
+    with MockGemini(respond=str.upper, quota_errors=2) as mock:
+        texts, client = asyncio.run(run(mock.base_url))
+
+    assert texts == ["A", "B", "C"]
+    assert client.retries == 2
+    assert mock.requests == 5
+    assert client.limiter.requests.rate < CLIENT["rpm"]
+
+
+def test_waiters_do_not_queue_behind_one_sleeper():
+    async def run():
+        bucket = TokenBucket(60 * 20)  # 20 tokens per second
+        bucket.tokens = 0
+        start = time.monotonic()
+        await asyncio.gather(*(bucket.acquire(1) for _ in range(4)))
+        return time.monotonic() - start
+
+    # Four tokens at 20 per second refill in about 200 ms
+    assert asyncio.run(run()) < 0.5
+
+
+def test_generate_csv_rows_sends_all_chunks_of_a_round_together(tmp_path, monkeypatch):
+    monkeypatch.setenv("GEMINI_CACHE_DISABLED", "1")
+    in_flight, peak = [0], [0]
+
+    def delay(prompt):
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.05)
+        in_flight[0] -= 1
+        return 0
+
+    with MockGemini(respond=rows_response, delay=delay) as mock:
+        worker = GeminiWorker(AsyncGeminiBackend(base_url=mock.base_url, max_concurrency=5, **CLIENT))
+        rows = worker.generate_and_save("users", "csv", 100, str(tmp_path / "batch.csv"),
+                                        columns=["name", "email"], rows_per_request=20, seed=1)
+
+    assert rows == 100
+    assert worker.calls == 5
+    assert peak[0] > 1
+
+
+def test_call_many_results_are_matched_to_their_chunks():
+    seen = []
+
+    def call_many(prompts, seeds, validate=None):
+        seen.append(seeds)
+        return [rows_response(prompt) for prompt in prompts]
+
+    table = generate_csv_rows("users", ["id"], 45, rows_per_request=20, seed=3, call_many=call_many)
+
+    assert table.num_rows == 45
+    assert seen == [[[3, 0], [3, 1], [3, 2]]]
+    assert table.column("id").to_pylist()[40:] == [f"id_{i}" for i in range(5)]
+
+
+def test_non_retryable_errors_are_raised():
+    with MockGemini(respond=lambda prompt: "") as mock:
+        with pytest.raises(ValueError):
+            generate_many(["x"], base_url=mock.base_url, **CLIENT)
+
+
+def test_a_session_keeps_connections_and_backoff_across_rounds():
+    with MockGemini(respond=str.upper, quota_errors=1) as mock:
+        with GeminiSession(base_url=mock.base_url, max_concurrency=2, **CLIENT) as session:
+            first = session.generate_many(["a", "b"])
+            throttled_rpm = session.client.limiter.requests.rate
+            second = session.generate_many(["c", "d"])
+
+    assert (first, second) == (["A", "B"], ["C", "D"])
+    assert throttled_rpm < CLIENT["rpm"]
+    assert session.client.limiter.requests.rate < CLIENT["rpm"]  # Recovering, not reset
+    assert len(mock.client_ports) <= 2
+
+
+def test_a_failed_prompt_does_not_discard_the_rest_of_the_round():
+    respond = lambda prompt: "" if prompt == "blocked" else prompt.upper()
+    with MockGemini(respond=respond) as mock:
+        with GeminiSession(base_url=mock.base_url, **CLIENT) as session:
+            results = session.generate_many(["a", "blocked", "c"])
+
+    assert results[0] == "A" and results[2] == "C"
+    assert isinstance(results[1], ValueError)
+
+
+def test_failed_chunks_are_requested_again_by_the_worker(tmp_path, monkeypatch):
+    monkeypatch.setenv("GEMINI_CACHE_DISABLED", "1")
+    answered = set()
+
+    def respond(prompt):
+        # Every distinct chunk prompt fails the first time it is sent
+        if prompt not in answered:
+            answered.add(prompt)
+            return "" if "EXACTLY 10 " in prompt else rows_response(prompt)
+        return rows_response(prompt)
+
+    with MockGemini(respond=respond) as mock:
+        with GeminiWorker(AsyncGeminiBackend(base_url=mock.base_url, **CLIENT)) as worker:
+            rows = worker.generate_and_save("users", "csv", 30, str(tmp_path / "batch.csv"),
+                                            columns=["name"], rows_per_request=20, seed=1)
+
+    assert rows == 30
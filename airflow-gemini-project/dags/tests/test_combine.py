@@ -0,0 +1,42 @@
+import csv
+
+import pyarrow as pa
+from utils.combine import stream_combine_csv, write_table_batch
+
+SCHEMA = pa.schema([("name", pa.string()), ("zip", pa.string()), ("salary", pa.float64()), ("active", pa.bool_())])
+
+
+def combine(tmp_path, batches):
+    paths = []
+    for i, rows in enumerate(batches):
+        path = str(tmp_path / f"batch_{i}.csv")
+        write_table_batch(pa.table(rows, schema=SCHEMA), path, "csv")
+        paths.append(path)
+    final_path = str(tmp_path / "final.csv")
+    rows = stream_combine_csv(paths, final_path, schema=SCHEMA)
+    with open(final_path, encoding="utf-8", newline="") as f:
+        return rows, f.read()
+
+
+def test_typed_csv_is_written_in_arrow_format(tmp_path):
+    rows, text = combine(tmp_path, [
+        {"name": ["Jane Doe", 'John "JD", Jr.'], "zip": ["01234", "94105"], "salary": [85000.5, 25.0],
+         "active": [True, None]},
+        {"name": ["Ann"], "zip": [None], "salary": [None], "active": [False]},
+    ])
+
+    assert rows == 3
+    assert text.splitlines() == [
+        '"name","zip","salary","active"',
+        '"Jane Doe","01234",85000.5,true',
+        '"John ""JD"", Jr.","94105",25,',
+        '"Ann",,,false',
+    ]
+
+
+def test_typed_csv_reads_back_with_the_csv_module(tmp_path):
+    _, text = combine(tmp_path, [{"name": ['a, "b"'], "zip": ["01234"], "salary": [25.0], "active": [True]}])
+
+    header, row = list(csv.reader(text.splitlines()))
+    assert header == ["name", "zip", "salary", "active"]
+    assert row == ['a, "b"', "01234", "25", "true"]
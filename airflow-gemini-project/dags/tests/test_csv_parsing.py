@@ -0,0 +1,105 @@
+import pyarrow as pa
+from datagenerate.your_utils_file import (MAX_TOKENS_MARKER, generate_csv_rows, mark_truncated, parse_csv_table,
+                                       validate_csv_rows)
+
+COLUMNS = ["name", "n", "flag"]
+
+
+def test_complete_rows_are_kept():
+    result = validate_csv_rows('"x1",1,"true"\n"x2",2,"false"', COLUMNS, 2)
+
+    assert result["table"].to_pylist() == [
+        {"name": "x1", "n": "1", "flag": "true"},
+        {"name": "x2", "n": "2", "flag": "false"},
+    ]
+    assert result["rejects"] == []
+    assert result["missing"] == 0
+
+
+def test_row_cut_off_inside_a_quote_is_rejected_and_requested_again():
+    result = validate_csv_rows('"x1",1,"true"\n"x2",2,"false"\n"x3",3,"tru', COLUMNS, 3)
+
+    assert result["table"].column("name").to_pylist() == ["x1", "x2"]
+    assert result["rejects"] == [{"row": None, "reason": "cut off at the end of the response", "text": '"x3",3,"tru'}]
+    assert result["missing"] == 1
+
+
+def test_quoted_newlines_do_not_hide_the_cut_off_row():
+    result = validate_csv_rows('"a\nb",1,"true"\n"x2",2,"fal', COLUMNS, 2)
+
+    assert result["table"].column("name").to_pylist() == ["a\nb"]
+    assert result["rejects"][0]["text"] == '"x2",2,"fal'
+
+
+def test_max_tokens_finish_drops_the_last_row_even_if_it_parses():
+    text = mark_truncated('"x1",1,"true"\n"x2",2,"tr"', "MAX_TOKENS")
+    assert text.endswith(MAX_TOKENS_MARKER)
+
+    result = validate_csv_rows(text, COLUMNS, 2)
+
+    assert result["table"].column("name").to_pylist() == ["x1"]
+    assert result["rejects"][0]["text"] == '"x2",2,"tr"'
+    assert result["missing"] == 1
+
+
+def test_other_finish_reasons_are_not_marked():
+    assert mark_truncated("a", "STOP") == "a"
+    assert mark_truncated("a", None) == "a"
+
+
+def test_rows_with_the_wrong_field_count_are_rejected():
+    result = validate_csv_rows('"x1",1,"true"\n"x2",2\n"x3",3,"false"', COLUMNS, 3)
+
+    assert result["table"].column("name").to_pylist() == ["x1", "x3"]
+    assert [r["row"] for r in result["rejects"]] == [2]
+    assert result["missing"] == 1
+
+
+def test_repeated_header_is_dropped():
+    result = validate_csv_rows('name,n,flag\n"x1",1,"true"', COLUMNS, 1)
+
+    assert result["table"].num_rows == 1
+    assert result["rejects"][0]["reason"] == "repeated header"
+
+
+def test_spaces_after_delimiters_are_ignored():
+    result = validate_csv_rows('"x", 1, "y"\n"a, b",  2,\t"c ""d"", e"', COLUMNS, 2)
+
+    assert result["table"].to_pylist() == [
+        {"name": "x", "n": "1", "flag": "y"},
+        {"name": "a, b", "n": "2", "flag": 'c "d", e'},
+    ]
+    assert result["rejects"] == []
+
+
+def test_sample_header_and_types_survive_space_padding():
+    table, errors = parse_csv_table('"id", "name", "salary"\n1, "Jane Doe", 85000.50\n2, "John, Jr.", 72000')
+
+    assert errors == []
+    assert table.column_names == ["id", "name", "salary"]
+    assert table.column("name").to_pylist() == ["Jane Doe", "John, Jr."]
+    assert table.column("salary").to_pylist() == [85000.5, 72000.0]
+
+
+def test_responses_are_cached_only_if_rows_fit_the_schema():
+    validators = []
+
+    def call_text(prompt, seed, validate):
+        validators.append(validate)
+        return '"x1",1,"true"'
+
+    schema = pa.schema([("name", pa.string()), ("n", pa.int64()), ("flag", pa.bool_())])
+    generate_csv_rows("users", COLUMNS, 1, seed=0, call_text=call_text, schema=schema)
+
+    assert validators[0]('"x1",1,"true"')
+    assert not validators[0]('"x1","one","true"')
+
+
+def test_only_consecutive_empty_responses_abort():
+    # Two empty responses before every usable row: 4 empty in total, never 3 in a row
+    responses = iter(["", "", '"x1",1,"true"', "", "", '"x2",2,"false"'])
+
+    table = generate_csv_rows("users", COLUMNS, 2, rows_per_request=1, seed=0,
+                              call_text=lambda prompt, seed, validate: next(responses))
+
+    assert table.column("name").to_pylist() == ["x1", "x2"]
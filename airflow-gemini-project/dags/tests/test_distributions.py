@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+from utils.distributions import MAX_EXPLICIT_WEIGHTS, WeightedSampler, make_distribution
+from utils.key_pool import KeyPool
+
+
+def test_draws_follow_the_weights():
+    sampler = WeightedSampler([1, 0, 3])
+    draws = sampler.sample(np.random.default_rng(0), 100_000)
+
+    counts = np.bincount(draws, minlength=3) / len(draws)
+    assert counts[1] == 0
+    assert counts[2] == pytest.approx(0.75, abs=0.01)
+
+
+def test_zipf_over_a_large_pool_is_skewed_and_in_range():
+    pool = KeyPool.sequential(1_000_000, "CUST-{:04d}")
+    distribution = make_distribution({"type": "zipf", "s": 1.1}, len(pool))
+    positions = pool.sample(np.random.default_rng(1), 50_000, distribution)
+
+    assert positions.min() >= 0 and positions.max() < len(pool)
+    # The first key is by far the most popular one
+    assert np.bincount(positions).argmax() == 0
+
+
+def test_same_seed_same_draws():
+    distribution = make_distribution({"type": "pareto", "alpha": 1.16}, 10_000)
+    first = distribution.sample(np.random.default_rng(7), 1_000)
+    second = distribution.sample(np.random.default_rng(7), 1_000)
+    assert np.array_equal(first, second)
+
+
+def test_explicit_weights_are_limited_to_small_tables():
+    assert make_distribution({"type": "weights", "weights": [2, 1]}, 2).size == 2
+    with pytest.raises(ValueError):
+        make_distribution({"type": "weights", "weights": [1] * 3}, MAX_EXPLICIT_WEIGHTS + 1)
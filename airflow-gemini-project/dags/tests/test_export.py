@@ -0,0 +1,62 @@
+import gzip
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from utils.export import current_export, export_csv_gz, export_zip
+from utils.manifest import Manifest
+
+
+def write_parts(directory, count=2):
+    paths = []
+    for i in range(count):
+        path = str(directory / f"part-{i}.parquet")
+        pq.write_table(pa.table({"id": [i * 10 + j for j in range(3)], "name": ["a", "b", "c"]}), path)
+        paths.append(path)
+    return paths
+
+
+def test_export_records_its_source_fingerprint(tmp_path):
+    parts = write_parts(tmp_path)
+    output_path = str(tmp_path / "exports" / "users.csv.gz")
+
+    entry = export_csv_gz(parts, output_path)
+
+    assert entry["rows"] == 6
+    assert entry["source_fingerprint"]
+    assert "code_hash" not in entry and "seed" not in entry
+    with gzip.open(output_path, "rt") as f:
+        assert f.read().splitlines()[0] == '"id","name"'
+    assert current_export(output_path, parts) == Manifest(str(tmp_path / "exports")).get(output_path)
+
+
+def test_export_is_outdated_when_a_source_file_changes(tmp_path):
+    parts = write_parts(tmp_path)
+    output_path = str(tmp_path / "users.csv.gz")
+    export_csv_gz(parts, output_path)
+
+    pq.write_table(pa.table({"id": [1], "name": ["z"]}), parts[1])
+    stat = os.stat(parts[1])
+    os.utime(parts[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+    assert current_export(output_path, parts) is None
+
+
+def test_concurrent_zip_exports_do_not_share_a_temporary_file(tmp_path):
+    users, orders = tmp_path / "users", tmp_path / "orders"
+    users.mkdir()
+    orders.mkdir()
+    tables = {"users": str(users), "orders": str(orders)}
+    write_parts(users)
+    write_parts(orders, count=1)
+    output_path = str(tmp_path / "exports" / "database.zip")
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        entries = list(executor.map(lambda _: export_zip(tables, output_path), range(2)))
+
+    assert all(entry["tables"] == {"orders": 3, "users": 6} for entry in entries)
+    with zipfile.ZipFile(output_path) as zip_f:
+        assert sorted(zip_f.namelist()) == ["orders.csv", "users.csv"]
+    assert sorted(os.listdir(tmp_path / "exports")) == ["_manifest.json", "_manifest.json.lock", "database.zip"]
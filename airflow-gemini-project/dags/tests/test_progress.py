@@ -0,0 +1,76 @@
+from utils.airflow_api import AirflowClient
+from utils.telemetry import batch_progress, load_records, record_plan, track
+
+
+class FakeSession:
+    """Answers the two GETs AirflowClient.progress makes."""
+
+    def __init__(self, task_instances):
+        self.task_instances = task_instances
+
+    def get(self, url, params=None, timeout=None):
+        if url.endswith("/taskInstances"):
+            payload = {"task_instances": self.task_instances, "total_entries": len(self.task_instances)}
+        else:
+            payload = {"state": "running"}
+        return FakeResponse(payload)
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+def test_progress_ignores_unexpanded_placeholders_and_skipped_branches():
+    instances = [
+        {"task_id": "generate_dimension_partition", "map_index": 0, "state": "success"},
+        {"task_id": "generate_dimension_partition", "map_index": 1, "state": "running"},
+        {"task_id": "generate_fact_partition", "map_index": -1, "state": None},
+        {"task_id": "generate_and_save_batch", "map_index": -1, "state": "skipped"},
+        {"task_id": "generate_and_save_batch", "map_index": 0, "state": "skipped"},
+    ]
+    client = AirflowClient("http://airflow/api/v1", "dag", session=FakeSession(instances))
+
+    progress = client.progress("run", ["generate_dimension_partition", "generate_fact_partition",
+                                       "generate_and_save_batch"])
+
+    assert (progress["total"], progress["done"], progress["failed"]) == (2, 1, 0)
+
+
+def test_batch_progress_counts_pool_batches_against_the_plan(tmp_path):
+    metrics_dir = str(tmp_path)
+    record_plan("dag", "run", {"generate_batches_in_pool": 3}, metrics_dir)
+    with track("dag", "generate_batches_in_pool", 0, run_id="run", metrics_dir=metrics_dir) as metrics:
+        metrics["status"] = "up_to_date"
+    with track("dag", "generate_batches_in_pool", 1, run_id="run", metrics_dir=metrics_dir):
+        pass
+    with track("dag", "generate_batches_in_pool", 1, run_id="other", metrics_dir=metrics_dir):
+        pass
+
+    assert batch_progress(load_records("dag", "run", metrics_dir)) == {"planned": 3, "done": 2, "failed": 0}
+
+
+def test_retried_failures_are_not_counted(tmp_path):
+    metrics_dir = str(tmp_path)
+    record_plan("dag", "run", {"generate_and_save_batch": 2}, metrics_dir)
+    for status in ("failed", "success"):
+        try:
+            with track("dag", "generate_and_save_batch", 0, run_id="run", metrics_dir=metrics_dir):
+                if status == "failed":
+                    raise RuntimeError("boom")
+        except RuntimeError:
+            pass
+    try:
+        with track("dag", "generate_and_save_batch", 1, run_id="run", metrics_dir=metrics_dir):
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+
+    assert batch_progress(load_records("dag", "run", metrics_dir)) == {"planned": 2, "done": 1, "failed": 1}
+
@@ -0,0 +1,99 @@
+import json
+import os
+import time
+
+from utils.response_cache import ResponseCache, cached_generate, cached_generate_many
+
+
+def make_cache(tmp_path, **kwargs):
+    ResponseCache._written_since_evict.clear()
+    return ResponseCache(str(tmp_path / "cache"), **kwargs)
+
+
+def age(cache, key, seconds):
+    """Backdates an entry's creation and last use."""
+    path = cache._path(key)
+    with open(path, "r", encoding="utf-8") as f:
+        entry = json.load(f)
+    entry["created"] -= seconds
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(entry, f)
+    past = time.time() - seconds
+    os.utime(path, (past, past))
+
+
+def test_expired_entries_are_misses_and_removed(tmp_path):
+    cache = make_cache(tmp_path, ttl_seconds=60)
+    cache.put("aa01", "old")
+    cache.put("aa02", "new")
+    age(cache, "aa01", 120)
+
+    assert cache.get("aa01") is None
+    assert not os.path.exists(cache._path("aa01"))
+    assert cache.get("aa02") == "new"
+
+
+def test_evict_drops_least_recently_used_entries_over_max_bytes(tmp_path):
+    cache = make_cache(tmp_path, max_bytes=10_000_000)
+    for i, key in enumerate(["aa01", "aa02", "aa03"]):
+        cache.put(key, "x" * 1000)
+        age(cache, key, 100 - i * 10)  # aa01 least recently used
+    cache.get("aa01")  # ... until it is read again
+
+    cache.max_bytes = 2500
+    cache.evict()
+
+    assert cache.get("aa02") is None
+    assert cache.get("aa01") is not None
+    assert cache.get("aa03") is not None
+
+
+def test_put_does_not_walk_the_cache_every_time(tmp_path, monkeypatch):
+    cache = make_cache(tmp_path, max_bytes=10_000_000, evict_interval=600)
+    evictions = []
+    original = ResponseCache.evict
+    monkeypatch.setattr(ResponseCache, "evict", lambda self: evictions.append(1) or original(self))
+
+    for i in range(50):
+        cache.put(f"aa{i:02d}", "text")
+    assert len(evictions) == 1  # Only the first put, when no eviction was recorded yet
+
+    cache.put("bb00", "x" * 600_000)  # More than 5% of max_bytes written since
+    assert len(evictions) == 2
+
+
+def test_rejected_responses_are_not_cached(tmp_path):
+    cache = make_cache(tmp_path)
+    calls = []
+
+    def call():
+        calls.append(1)
+        return "not json"
+
+    for _ in range(2):
+        cached_generate(call, "m", "prompt", cache=cache, validate=json.loads)
+    assert len(calls) == 2
+
+
+def test_cached_entry_failing_validation_is_deleted_and_fetched_again(tmp_path):
+    cache = make_cache(tmp_path)
+    key = cache.key("m", "prompt")
+    cache.put(key, "broken")
+
+    text = cached_generate(lambda: "[1]", "m", "prompt", cache=cache, validate=json.loads)
+
+    assert text == "[1]"
+    assert cache.get(key) == "[1]"
+
+
+def test_cached_generate_many_sends_only_misses_in_order(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put(cache.key("m", "b"), "B")
+    sent = []
+
+    def call_many(prompts):
+        sent.append(prompts)
+        return [prompt.upper() for prompt in prompts]
+
+    assert cached_generate_many(call_many, "m", ["a", "b", "c"], cache=cache) == ["A", "B", "C"]
+    assert sent == [["a", "c"]]
@@ -0,0 +1,45 @@
+import pyarrow.parquet as pq
+import pytest
+from utils.table_writer import TableWriter
+
+
+def test_batches_become_row_groups(tmp_path):
+    path = str(tmp_path / "sales.parquet")
+    with TableWriter(path) as writer:
+        writer.write_batch({"id": [1, 2], "amount": [1.5, 2.5]})
+        writer.write_batch({"id": [3], "amount": [3.5]})
+
+    assert pq.read_metadata(path).num_row_groups == 2
+    assert pq.read_table(path).column("id").to_pylist() == [1, 2, 3]
+
+
+def test_explicit_close_inside_with_keeps_the_data(tmp_path):
+    path = str(tmp_path / "sales.parquet")
+    with TableWriter(path) as writer:
+        writer.write_batch({"id": [1, 2, 3]})
+        writer.close()
+
+    assert pq.read_table(path).num_rows == 3
+
+
+def test_close_twice_is_a_no_op(tmp_path):
+    path = str(tmp_path / "sales.parquet")
+    writer = TableWriter(path)
+    writer.write_batch({"id": [1, 2, 3]})
+    writer.close()
+    writer.close()
+
+    assert pq.read_table(path).num_rows == 3
+    with pytest.raises(ValueError):
+        writer.write_batch({"id": [4]})
+
+
+def test_abort_discards_the_partial_file(tmp_path):
+    path = tmp_path / "sales.parquet"
+    with pytest.raises(RuntimeError):
+        with TableWriter(str(path)) as writer:
+            writer.write_batch({"id": [1]})
+            raise RuntimeError("generator failed")
+
+    assert not path.exists()
+    assert not (tmp_path / "sales.parquet.tmp").exists()
@@ -0,0 +1,29 @@
+import pytest
+from utils.telemetry import load_records, reset_peak_rss, summarize, track
+
+
+def test_peak_rss_is_per_batch_and_the_process_peak_is_kept(tmp_path):
+    if not reset_peak_rss():
+        pytest.skip("Peak RSS cannot be reset on this platform")
+    metrics_dir = str(tmp_path)
+    with track("dag", "task", 0, run_id="run", metrics_dir=metrics_dir):
+        block = bytearray(200 * 1024 * 1024)
+        block[::4096] = b"x" * len(block[::4096])  # Touch every page
+        del block
+    with track("dag", "task", 1, run_id="run", metrics_dir=metrics_dir):
+        pass
+
+    first, second = load_records("dag", "run", metrics_dir)
+    assert first["peak_rss_bytes"] - second["peak_rss_bytes"] > 150 * 1024 * 1024
+    assert second["process_peak_rss_bytes"] >= first["peak_rss_bytes"]
+    assert summarize([first, second])["peak_rss_bytes"] == first["peak_rss_bytes"]
+
+
+def test_without_per_batch_peaks_only_the_process_peak_is_reported():
+    record = {"status": "success", "rows": 1, "wall_seconds": 1.0, "started_at": 0.0, "peak_rss_bytes": None,
+              "process_peak_rss_bytes": 500, "bytes_written": 0, "api_calls": 0, "api_retries": 0}
+
+    summary = summarize([record])
+
+    assert summary["peak_rss_bytes"] is None
+    assert summary["process_peak_rss_bytes"] == 500
@@ -0,0 +1,73 @@
+import pyarrow as pa
+import pytest
+from datagenerate.your_utils_file import validate_csv_rows
+from utils.typed_schema import cast_to_schema, schema_from_csv_sample, schema_from_json
+
+SAMPLE = '''"employee_id","zip","full_name","salary","age","active","hired"
+"E1001","01234","John Smith",120000,34,true,2021-03-01
+"E1002","94105","Jane ""JD"" Doe",85000.50,41,false,2019-11-15
+'''
+
+
+def types(columns):
+    return {column["name"]: column["type"] for column in columns}
+
+
+def test_sample_types_keep_quoted_and_identifier_columns_as_text():
+    assert types(schema_from_csv_sample(SAMPLE)) == {
+        "employee_id": "string",
+        "zip": "string",
+        "full_name": "string",
+        "salary": "float64",
+        "age": "float64",
+        "active": "bool",
+        "hired": "date32",
+    }
+
+
+def test_leading_zeros_and_id_names_stay_text_when_unquoted():
+    sample = "order_id,zip,qty\n1001,01234,3\n1002,94105,4\n"
+
+    assert types(schema_from_csv_sample(sample)) == {"order_id": "string", "zip": "string", "qty": "float64"}
+
+
+def test_sample_columns_are_renamed_to_requested_names():
+    columns = schema_from_csv_sample("a, b\n1, \"x\"\n", ["count", "label"])
+
+    assert columns == [{"name": "count", "type": "float64"}, {"name": "label", "type": "string"}]
+
+
+def test_integers_widened_to_float_keep_decimal_values():
+    schema = schema_from_json(schema_from_csv_sample("salary\n120000\n72000\n"))
+    table = pa.table({"salary": ["85000.50", "90000"]})
+
+    assert cast_to_schema(table, schema).column("salary").to_pylist() == [85000.5, 90000.0]
+
+
+def test_values_that_do_not_fit_become_rejects_not_nulls():
+    schema = pa.schema([("name", pa.string()), ("salary", pa.float64())])
+    table = pa.table({"name": ["a", "b", "c"], "salary": ["1.5", "N/A", ""]})
+    rejects = []
+
+    result = cast_to_schema(table, schema, rejects)
+
+    assert result.to_pylist() == [{"name": "a", "salary": 1.5}, {"name": "c", "salary": None}]
+    assert len(rejects) == 1
+    assert "'N/A' is not double" in rejects[0]["reason"]
+
+
+def test_values_that_do_not_fit_fail_without_a_rejects_list():
+    schema = pa.schema([("salary", pa.int64())])
+
+    with pytest.raises(ValueError, match="do not fit the schema"):
+        cast_to_schema(pa.table({"salary": ["1", "2.5"]}), schema)
+
+
+def test_rows_that_do_not_fit_are_requested_again():
+    schema = pa.schema([("name", pa.string()), ("age", pa.float64())])
+
+    result = validate_csv_rows('"a",30\n"b","unknown"\n"c",41', ["name", "age"], 3, schema)
+
+    assert result["table"].to_pylist() == [{"name": "a", "age": 30.0}, {"name": "c", "age": 41.0}]
+    assert result["missing"] == 1
+    assert result["returned"] == 3
@@ -0,0 +1,36 @@
+import types
+
+import numpy as np
+from utils.batch_runner import build_batch
+from utils.vectorized import sample_joined, unique_emails
+
+
+def test_unique_emails_are_unique_across_batches():
+    pool = np.array(["jsmith@example.org", "ann1@example.com"], dtype=object)
+    rng = np.random.default_rng(0)
+
+    first = unique_emails(rng, pool, 1000, start=0)
+    second = unique_emails(rng, pool, 1000, start=1000)
+
+    assert len(set(first) | set(second)) == 2000
+    assert {e.split("@")[1] for e in first} <= {"example.org", "example.com"}
+    assert second[0].split("@")[0] in ("jsmith.1000", "ann1.1000")
+
+
+def test_sample_joined_combines_pools():
+    rng = np.random.default_rng(0)
+    first_names = np.array([f"F{i}" for i in range(100)], dtype=object)
+    last_names = np.array([f"L{i}" for i in range(100)], dtype=object)
+
+    names = sample_joined(rng, [first_names, last_names], 5000)
+
+    assert all(len(name.split(" ")) == 2 for name in names)
+    assert len(set(names)) > 100
+
+
+def test_build_batch_passes_start_only_to_generators_that_take_it():
+    with_start = types.SimpleNamespace(generate_batch=lambda n, seed, start=0: {"row": np.arange(start, start + n)})
+    without_start = types.SimpleNamespace(generate_batch=lambda n, seed: {"row": np.arange(n)})
+
+    assert build_batch(with_start, 3, seed=0, start=10).column("row").to_pylist() == [10, 11, 12]
+    assert build_batch(without_start, 3, seed=0, start=10).column("row").to_pylist() == [0, 1, 2]
@@ -0,0 +1,106 @@
+from collections import Counter
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Client for the Airflow REST API used by the Streamlit apps to trigger
+# runs and follow their progress. All calls share one pooled Session whose
+# adapter retries idempotent requests on connection errors, 429 and 5xx
+# with exponential backoff, so a webserver restart during a long run shows
+# up as a slower poll instead of a failed one.
+
+PAGE_SIZE = 100  # Airflow's default maximum_page_limit
+RETRY_TOTAL = 5
+RETRY_BACKOFF_SECONDS = 0.5
+REQUEST_TIMEOUT_SECONDS = 10
+
+FINISHED_STATES = {"success", "failed", "skipped", "upstream_failed", "removed"}
+FAILED_STATES = {"failed", "upstream_failed"}
+
+
+def make_session(auth=None, retries: int = RETRY_TOTAL, backoff: float = RETRY_BACKOFF_SECONDS) -> requests.Session:
+    """
+    A Session with connection pooling and retry/backoff. Only idempotent
+    methods (GET etc.) are retried, so a trigger POST never creates two runs.
+    """
+    session = requests.Session()
+    session.auth = auth
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=[429, 500, 502, 503, 504],
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=1, pool_maxsize=4)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class AirflowClient:
+    """Triggers and inspects runs of one DAG through the stable REST API (v1)."""
+
+    def __init__(self, api_url: str, dag_id: str, auth=None, session: requests.Session | None = None):
+        self.api_url = api_url.rstrip("/")
+        self.dag_id = dag_id
+        self.session = session or make_session(auth)
+
+    def _get(self, path: str, **params) -> dict:
+        response = self.session.get(f"{self.api_url}{path}", params=params or None, timeout=REQUEST_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        return response.json()
+
+    def trigger(self, conf: dict | None = None) -> str:
+        """Starts a DAG run and returns its dag_run_id."""
+        response = self.session.post(
+            f"{self.api_url}/dags/{self.dag_id}/dagRuns",
+            json={"conf": conf or {}},
+            timeout=REQUEST_TIMEOUT_SECONDS,
+        )
+        response.raise_for_status()
+        return response.json().get("dag_run_id")
+
+    def dag_run_state(self, dag_run_id: str) -> str | None:
+        return self._get(f"/dags/{self.dag_id}/dagRuns/{dag_run_id}").get("state")
+
+    def task_instances(self, dag_run_id: str, page_size: int = PAGE_SIZE) -> list[dict]:
+        """
+        All task instances of a run, one entry per mapped index, fetched
+        `page_size` at a time.
+        """
+        instances = []
+        offset = 0
+        while True:
+            page = self._get(
+                f"/dags/{self.dag_id}/dagRuns/{dag_run_id}/taskInstances",
+                limit=page_size,
+                offset=offset,
+            )
+            batch = page.get("task_instances", [])
+            instances.extend(batch)
+            offset += len(batch)
+            if not batch or offset >= page.get("total_entries", 0):
+                return instances
+
+    def progress(self, dag_run_id: str, task_ids: list[str] | None = None) -> dict:
+        """
+        Run state plus counts of the given mapped tasks' instances (all
+        tasks if `task_ids` is None): total, finished, failed and
+        per-state counts. Only expanded instances are counted: the
+        map_index -1 placeholder of a task that is not expanded yet (or
+        that expanded to nothing) and skipped instances of a branch that
+        is not taken would make the total jump around.
+        """
+        instances = [
+            ti for ti in self.task_instances(dag_run_id)
+            if (task_ids is None or ti.get("task_id") in task_ids)
+            and ti.get("map_index", -1) != -1 and ti.get("state") != "skipped"
+        ]
+        states = Counter(ti.get("state") or "none" for ti in instances)
+        return {
+            "state": self.dag_run_state(dag_run_id),
+            "total": len(instances),
+            "done": sum(count for state, count in states.items() if state in FINISHED_STATES),
+            "failed": sum(count for state, count in states.items() if state in FAILED_STATES),
+            "states": dict(states),
+        }
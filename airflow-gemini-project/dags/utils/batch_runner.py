@@ -0,0 +1,97 @@
+import inspect
+import os
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor
+from utils.vectorized import to_arrow_table
+from utils.seeding import batch_seed, seed_module
+from utils.manifest import Manifest, content_hash, module_source_hash
+from utils.module_loader import load_generator
+from utils.telemetry import track
+
+# The batch step of ai_data_generator_1M, shared by the mapped task and by
+# the in-task process pool. It lives here (not in the DAG file) so pool
+# workers can import it by name.
+
+METRICS_DAG_ID = "ai_data_generator_1M"
+
+
+def batch_file_path(output_path: str, batch_id: int) -> str:
+    """File name of one batch; the same in every execution mode."""
+    return f"{output_path}/user_batch_{batch_id:05d}.parquet"
+
+
+def build_batch(generator_module, rows: int, seed: int, start: int = 0):
+    """
+    Generates one batch (rows `start` to `start + rows` of the dataset)
+    as an Arrow table. Uses the vectorized `generate_batch(n, seed, start)`
+    when the generator exposes it, and falls back to calling
+    `generate_data()` once per row.
+    """
+    generate_batch = getattr(generator_module, "generate_batch", None)
+    if generate_batch is not None:
+        # Generators written before `start` existed take only (n, seed)
+        if "start" in inspect.signature(generate_batch).parameters:
+            return to_arrow_table(generate_batch(rows, seed=seed, start=start))
+        return to_arrow_table(generate_batch(rows, seed=seed))
+    generate_data = getattr(generator_module, "generate_data")
+    seed_module(generator_module, seed)
+    return to_arrow_table([generate_data() for _ in range(rows)])
+
+
+def run_batch(batch: dict, run_seed: int, output_path: str, module_name: str, seed_stream: str,
+              run_id: str | None = None, task: str = "generate_and_save_batch") -> str:
+    """
+    Generates and saves one batch ({"batch_id", "start", "rows"}), unless the
+    manifest shows the file is already up to date. Returns the file path.
+    Its metrics are appended to the run's telemetry (utils.telemetry).
+    """
+    batch_id = batch["batch_id"]
+    with track(METRICS_DAG_ID, task, batch_id, run_id=run_id) as metrics:
+        file_path = _run_batch(batch, run_seed, output_path, module_name, seed_stream, metrics)
+    return file_path
+
+
+def _run_batch(batch: dict, run_seed: int, output_path: str, module_name: str, seed_stream: str,
+               metrics: dict) -> str:
+    batch_id, rows, start = batch["batch_id"], batch["rows"], batch.get("start", 0)
+    generator_module = load_generator(module_name)
+
+    seed = batch_seed(run_seed, seed_stream, batch_id)
+    print(f"--- Starting batch {batch_id}: {rows} rows (run seed {run_seed}, batch seed {seed}) ---")
+    file_path = batch_file_path(output_path, batch_id)
+
+    # --- Skip unchanged batches ---
+    manifest = Manifest(output_path)
+    # The first row number is an input too: unique fields are numbered from it
+    code_hash = content_hash(module_source_hash(generator_module), seed_stream, start)
+    if manifest.is_current(file_path, code_hash, seed, rows):
+        print(f"--- Batch {batch_id} is up to date in the manifest, skipping ---")
+        metrics["status"] = "up_to_date"
+        return file_path
+
+    table = build_batch(generator_module, rows, seed, start)
+    pq.write_table(table, file_path)
+    metrics["rows"] = table.num_rows
+    metrics["output_path"] = file_path
+
+    manifest.record(file_path, code_hash, seed, rows)
+    print(f"--- Finished batch {batch_id}, saved to {file_path} ---")
+    return file_path
+
+
+def run_batches_in_pool(batches: list[dict], run_seed: int, output_path: str, module_name: str,
+                        seed_stream: str, max_workers: int | None = None, run_id: str | None = None) -> list[str]:
+    """
+    Runs many batches inside one task with a process per core. Each worker
+    loads the generator once and seeds every batch on its own, so the
+    files are identical to the mapped mode. Paths are returned in batch order.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    print(f"Generating {len(batches)} batches with {max_workers} worker processes")
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(run_batch, batch, run_seed, output_path, module_name, seed_stream,
+                            run_id, "generate_batches_in_pool")
+            for batch in batches
+        ]
+        return [future.result() for future in futures]
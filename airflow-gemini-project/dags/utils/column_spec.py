@@ -0,0 +1,159 @@
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from datetime import datetime
+from faker import Faker
+from utils.vectorized import faker_pool, sample_pool, random_ints, random_floats, random_datetimes, bulk_uuids
+
+# A column spec describes how to produce every column of a dataset locally,
+# so synthetic_data_generator's hybrid engine needs Gemini only once (to
+# write the spec) instead of once per batch. A spec is a list of columns:
+#
+#   [{"name": "user_id", "kind": "uuid"},
+#    {"name": "email", "kind": "faker", "provider": "email"},
+#    {"name": "age", "kind": "int", "min": 18, "max": 90},
+#    {"name": "plan", "kind": "choice", "values": ["free", "pro"], "weights": [0.8, 0.2]}]
+#
+# Any column may also set "null_fraction" (0-1) to blank out that share of rows.
+
+COLUMN_KINDS = ["uuid", "sequence", "faker", "int", "float", "choice", "datetime", "date", "bool"]
+# Dates the spec falls back to when it has no bounds (never use datetime.now())
+DEFAULT_START_DATE = "2020-01-01"
+DEFAULT_END_DATE = "2025-01-01"
+MAX_SAMPLE_CHOICES = 50
+
+
+def _check_column(column: dict, fake: Faker) -> dict:
+    """Validates one column entry and fills in defaults. Raises ValueError."""
+    name = str(column.get("name", "")).strip()
+    kind = column.get("kind")
+    if not name:
+        raise ValueError(f"Column without a name: {column}")
+    if kind not in COLUMN_KINDS:
+        raise ValueError(f"Column '{name}' has unknown kind '{kind}'")
+
+    column = {**column, "name": name}
+    if kind == "faker":
+        provider = column.get("provider")
+        if not provider or not callable(getattr(fake, provider, None)):
+            raise ValueError(f"Column '{name}' uses unknown Faker provider '{provider}'")
+        column.setdefault("kwargs", {})
+        try:
+            getattr(fake, provider)(**column["kwargs"])
+        except Exception as e:
+            raise ValueError(f"Column '{name}': Faker provider '{provider}' rejects {column['kwargs']}: {e}")
+    elif kind in ("int", "float"):
+        column["min"] = float(column.get("min", 0)) if kind == "float" else int(column.get("min", 0))
+        column["max"] = float(column.get("max", 100)) if kind == "float" else int(column.get("max", 100))
+        if column["min"] > column["max"]:
+            column["min"], column["max"] = column["max"], column["min"]
+    elif kind == "choice":
+        values = column.get("values") or []
+        if not values:
+            raise ValueError(f"Column '{name}' is a choice without values")
+        weights = column.get("weights")
+        if weights is not None and (len(weights) != len(values) or sum(weights) <= 0):
+            raise ValueError(f"Column '{name}' has {len(weights)} weights for {len(values)} values")
+    elif kind in ("datetime", "date"):
+        column["start"] = str(pd.Timestamp(column.get("start", DEFAULT_START_DATE)).date())
+        column["end"] = str(pd.Timestamp(column.get("end", DEFAULT_END_DATE)).date())
+    elif kind == "sequence":
+        pattern = column.get("pattern", "{}")
+        pattern.format(0)  # raises on a broken pattern
+        column["pattern"] = pattern
+        column["start"] = int(column.get("start", 1))
+    elif kind == "bool":
+        column["p"] = float(column.get("p", 0.5))
+    return column
+
+
+def normalize_column_spec(spec, columns: list[str] | None = None) -> list[dict]:
+    """
+    Parses (if given as JSON text) and validates a column spec. When
+    `columns` is given, the spec is reordered to match it and must
+    cover every name. Raises ValueError if the spec cannot be used.
+    """
+    if isinstance(spec, str):
+        spec = json.loads(spec)
+    if isinstance(spec, dict):
+        spec = spec.get("columns", [])
+    if not isinstance(spec, list) or not spec:
+        raise ValueError("Column spec must be a non-empty list of columns")
+
+    fake = Faker()
+    checked = [_check_column(column, fake) for column in spec]
+    if not columns:
+        return checked
+
+    by_name = {column["name"]: column for column in checked}
+    missing = [name for name in columns if name not in by_name]
+    if missing:
+        raise ValueError(f"Column spec is missing columns: {missing}")
+    return [by_name[name] for name in columns]
+
+
+def spec_from_sample(sample: pd.DataFrame) -> list[dict]:
+    """
+    A basic spec inferred from example rows alone: numeric ranges for
+    number columns and sampled values for everything else. Used when
+    Gemini could not produce a usable spec.
+    """
+    spec = []
+    for name in sample.columns:
+        values = sample[name].dropna()
+        if pd.api.types.is_integer_dtype(values) and len(values):
+            spec.append({"name": name, "kind": "int", "min": int(values.min()), "max": int(values.max())})
+        elif pd.api.types.is_float_dtype(values) and len(values):
+            spec.append({"name": name, "kind": "float", "min": float(values.min()), "max": float(values.max()), "decimals": 2})
+        elif len(values):
+            spec.append({"name": name, "kind": "choice", "values": [str(v) for v in values.unique()[:MAX_SAMPLE_CHOICES]]})
+        else:
+            spec.append({"name": name, "kind": "faker", "provider": "word"})
+    return normalize_column_spec(spec)
+
+
+def _column_values(column: dict, rng: np.random.Generator, fake: Faker, n: int, start_row: int):
+    kind = column["kind"]
+    if kind == "uuid":
+        return bulk_uuids(rng, n)
+    if kind == "sequence":
+        first = column["start"] + start_row
+        return [column["pattern"].format(i) for i in range(first, first + n)]
+    if kind == "faker":
+        return sample_pool(rng, faker_pool(fake, column["provider"], **column["kwargs"]), n)
+    if kind == "int":
+        return random_ints(rng, column["min"], column["max"], n)
+    if kind == "float":
+        return random_floats(rng, column["min"], column["max"], n, column.get("decimals"))
+    if kind == "choice":
+        weights = column.get("weights")
+        p = np.asarray(weights, dtype=float) / np.sum(weights) if weights else None
+        values = np.array(column["values"], dtype=object)
+        return values[rng.choice(len(values), size=n, p=p)]
+    if kind in ("datetime", "date"):
+        values = random_datetimes(rng, datetime.fromisoformat(column["start"]), datetime.fromisoformat(column["end"]), n)
+        return values.astype("datetime64[D]") if kind == "date" else values
+    return rng.random(n) < column["p"]  # bool
+
+
+def generate_from_spec(spec: list[dict], n: int, seed: int, start_row: int = 0) -> pa.Table:
+    """
+    Generates `n` rows from a normalized spec as an Arrow table. The
+    same (spec, seed, start_row) always gives the same rows; `start_row`
+    offsets sequence columns so batches continue each other's keys.
+    """
+    rng = np.random.default_rng(seed)
+    fake = Faker()
+    fake.seed_instance(seed)
+
+    arrays = {}
+    for column in spec:
+        array = pa.array(_column_values(column, rng, fake, n, start_row))
+        null_fraction = float(column.get("null_fraction", 0))
+        if null_fraction > 0:
+            mask = pa.array(rng.random(n) < null_fraction)
+            array = pc.if_else(mask, pa.nulls(n, array.type), array)
+        arrays[column["name"]] = array
+    return pa.table(arrays)
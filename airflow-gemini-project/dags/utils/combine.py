@@ -0,0 +1,299 @@
+import json
+import os
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+from utils.table_writer import TableWriter
+from utils.typed_schema import cast_to_schema
+
+# Streaming combiners for synthetic_data_generator's batch files. Each
+# batch is read and written on its own (CSV in chunks), so memory stays
+# O(batch) instead of holding the whole dataset several times over.
+#
+# For the typed formats (parquet, feather) every batch is parsed to Arrow
+# once, right after the worker produced it, so the combine step only moves
+# columnar data around and never re-parses text.
+
+CSV_CHUNK_ROWS = 50_000
+TYPED_FORMATS = ["parquet", "feather"]
+COMPRESSION_TYPES = ["snappy", "zstd", "lz4", "gzip", "none"]
+# Arrow IPC/Feather only supports these two codecs
+FEATHER_COMPRESSION_TYPES = ["lz4", "zstd"]
+
+
+def stream_combine_csv(batch_files: list[str], final_path: str, expected_columns: list[str] | None = None,
+                       remove_batches: bool = True, schema: pa.Schema | None = None) -> int:
+    """
+    Appends batch CSVs chunk by chunk into `final_path` with a single
+    header. Batches are data rows only when `expected_columns` (or
+    `schema`) is given; otherwise each batch has its own header row.
+    With a typed `schema`, batches are read and written by pyarrow and
+    cast to it. Returns the rows written.
+
+    The typed output is Arrow's CSV, not pandas': the header and every
+    string field are quoted, floats without a fractional part are written
+    without ".0" (25.0 -> 25), booleans as true/false and nulls as empty
+    fields. Any CSV reader reads it back to the same values; only tools
+    that compare the text byte for byte see a difference.
+    """
+    if schema is not None:
+        return _stream_combine_csv_typed(batch_files, final_path, schema, remove_batches)
+    rows_written = 0
+    header_columns = None
+    with open(final_path, "w", encoding="utf-8", newline="") as out:
+        for file in sorted(batch_files):
+            if not os.path.exists(file):
+                continue
+            if expected_columns:
+                # read rows without header, assign expected column names
+                chunks = pd.read_csv(file, header=None, names=expected_columns, chunksize=CSV_CHUNK_ROWS)
+            else:
+                # Fallback: let pandas read each batch's own header (risky)
+                chunks = pd.read_csv(file, chunksize=CSV_CHUNK_ROWS)
+            for chunk in chunks:
+                if header_columns is None:
+                    header_columns = list(chunk.columns)
+                    chunk.to_csv(out, index=False)
+                else:
+                    chunk.reindex(columns=header_columns).to_csv(out, index=False, header=False)
+                rows_written += len(chunk)
+            if remove_batches:
+                os.remove(file)  # Clean up batch file
+
+    if header_columns is None:
+        os.remove(final_path)
+        raise ValueError("No valid batch files found to combine")
+    return rows_written
+
+
+def _stream_combine_csv_typed(batch_files: list[str], final_path: str, schema: pa.Schema,
+                              remove_batches: bool = True) -> int:
+    rows_written = 0
+    files = _existing(batch_files)
+    tmp_path = f"{final_path}.tmp"
+    with pa_csv.CSVWriter(tmp_path, schema) as writer:
+        for file in files:
+            table = read_csv_batch(file, schema=schema)
+            writer.write_table(table)
+            rows_written += table.num_rows
+            if remove_batches:
+                os.remove(file)  # Clean up batch file
+    os.replace(tmp_path, final_path)
+    return rows_written
+
+
+def stream_combine_json(batch_files: list[str], final_path: str, remove_batches: bool = True) -> int:
+    """
+    Writes all batch JSON records as one array, item by item. The output
+    is byte-identical to `json.dump(all_records, f, indent=2)`, but only
+    one batch is in memory at a time. Returns the records written.
+    """
+    records_written = 0
+    with open(final_path, "w", encoding="utf-8") as out:
+        out.write("[")
+        for file in sorted(batch_files):
+            if not os.path.exists(file):
+                continue
+            with open(file, "r", encoding="utf-8") as f:
+                batch_data = json.load(f)
+            if not isinstance(batch_data, list):
+                batch_data = [batch_data]
+            for record in batch_data:
+                out.write(",\n  " if records_written else "\n  ")
+                out.write(json.dumps(record, indent=2).replace("\n", "\n  "))
+                records_written += 1
+            if remove_batches:
+                os.remove(file)  # Clean up batch file
+        out.write("\n]" if records_written else "]")
+
+    if records_written == 0:
+        os.remove(final_path)
+        raise ValueError("No valid batch files found to combine")
+    return records_written
+
+
+# --- Typed formats (Parquet / Arrow IPC) ---
+
+def parquet_compression(compression: str) -> str | None:
+    return None if compression == "none" else compression
+
+
+def feather_compression(compression: str) -> str:
+    """Maps the DAG's compression param to a codec Feather supports."""
+    if compression == "none":
+        return "uncompressed"
+    if compression not in FEATHER_COMPRESSION_TYPES:
+        print(f"Feather does not support '{compression}', using lz4 instead")
+        return "lz4"
+    return compression
+
+
+def read_csv_batch(path: str, columns: list[str] | None = None, schema: pa.Schema | None = None) -> pa.Table:
+    """
+    Parses one batch CSV into an Arrow table. Batches are data rows only
+    when `columns` or `schema` is given; otherwise the first row is the
+    header. With a `schema` the values are read as text and cast to it,
+    otherwise the types are inferred.
+    """
+    if schema is None:
+        read_options = pa_csv.ReadOptions(column_names=columns) if columns else pa_csv.ReadOptions()
+        return pa_csv.read_csv(path, read_options=read_options)
+    convert_options = pa_csv.ConvertOptions(column_types={name: pa.string() for name in schema.names},
+                                            strings_can_be_null=True)
+    table = pa_csv.read_csv(path, read_options=pa_csv.ReadOptions(column_names=schema.names),
+                            convert_options=convert_options)
+    return cast_to_schema(table, schema)
+
+
+def write_table_batch(table: pa.Table, output_path: str, output_format: str, compression: str = "snappy") -> int:
+    """
+    Writes an Arrow table as one batch file in any of the DAG's formats.
+    CSV batches are data rows only (like the worker's), JSON batches are
+    a list of records. Returns the number of rows written.
+    """
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = f"{output_path}.tmp"
+    if output_format == "parquet":
+        pq.write_table(table, tmp_path, compression=parquet_compression(compression))
+    elif output_format == "feather":
+        feather.write_feather(table, tmp_path, compression=feather_compression(compression))
+    elif output_format == "csv":
+        pa_csv.write_csv(table, tmp_path, write_options=pa_csv.WriteOptions(include_header=False))
+    else:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(table.to_pylist(), f, default=str)
+    os.replace(tmp_path, output_path)
+    return table.num_rows
+
+
+def read_batch_schema(path: str) -> pa.Schema:
+    """Reads only the schema (Parquet footer or IPC header) of a batch file."""
+    if path.endswith(".parquet"):
+        return pq.read_schema(path).remove_metadata()
+    with pa.memory_map(path) as source:
+        return pa.ipc.open_file(source).schema.remove_metadata()
+
+
+def read_batch_table(path: str) -> pa.Table:
+    if path.endswith(".parquet"):
+        return pq.read_table(path)
+    return feather.read_table(path, memory_map=True)
+
+
+def _common_type(types: list[pa.DataType]) -> pa.DataType:
+    """
+    One type for a column whose inferred type differs between batches:
+    integers widen to int64, mixed numbers to float64, anything else
+    falls back to string.
+    """
+    if all(t == types[0] for t in types):
+        return types[0]
+    if all(pa.types.is_integer(t) or pa.types.is_null(t) for t in types):
+        return pa.int64()
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) or pa.types.is_null(t) for t in types):
+        return pa.float64()
+    non_null = [t for t in types if not pa.types.is_null(t)]
+    if non_null and all(t == non_null[0] for t in non_null):
+        return non_null[0]
+    return pa.string()
+
+
+def unify_batch_schemas(schemas: list[pa.Schema]) -> pa.Schema:
+    """
+    Merges the per-batch inferred schemas into one. Column order follows
+    the first batch; a column's type is widened when batches disagree.
+    """
+    names = []
+    for schema in schemas:
+        names.extend(name for name in schema.names if name not in names)
+    fields = []
+    for name in names:
+        types = [schema.field(name).type for schema in schemas if name in schema.names]
+        fields.append(pa.field(name, _common_type(types)))
+    return pa.schema(fields)
+
+
+def _conform(table: pa.Table, schema: pa.Schema) -> pa.Table:
+    """Adds missing columns as nulls, orders columns and casts to `schema`."""
+    if table.schema.remove_metadata().equals(schema):
+        return table
+    return cast_to_schema(table, schema)
+
+
+def _existing(batch_files: list[str]) -> list[str]:
+    files = [f for f in sorted(batch_files) if f and os.path.exists(f)]
+    if not files:
+        raise ValueError("No valid batch files found to combine")
+    return files
+
+
+def combine_parquet(batch_files: list[str], final_path: str, compression: str = "snappy",
+                    remove_batches: bool = True, schema: pa.Schema | None = None) -> int:
+    """
+    Writes all batch files into one Parquet file, one row group per
+    batch, under the run's `schema` (or one unified from the batch
+    footers). Only one batch is in memory at a time. Returns the rows written.
+    """
+    files = _existing(batch_files)
+    schema = schema or unify_batch_schemas([read_batch_schema(f) for f in files])
+    with TableWriter(final_path, schema=schema, compression=parquet_compression(compression)) as writer:
+        for file in files:
+            writer.write_batch(_conform(read_batch_table(file), schema))
+            if remove_batches:
+                os.remove(file)  # Clean up batch file
+    return writer.rows_written
+
+
+def combine_feather(batch_files: list[str], final_path: str, compression: str = "lz4",
+                    remove_batches: bool = True, schema: pa.Schema | None = None) -> int:
+    """
+    Writes all batch files into one Arrow IPC (Feather v2) file, one
+    record batch per input batch. Batches already in the run's `schema`
+    are passed through as they are. Returns the rows written.
+    """
+    files = _existing(batch_files)
+    schema = schema or unify_batch_schemas([read_batch_schema(f) for f in files])
+    options = pa.ipc.IpcWriteOptions(compression=None if compression == "none" else feather_compression(compression))
+    rows_written = 0
+    tmp_path = f"{final_path}.tmp"
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, schema, options=options) as writer:
+        for file in files:
+            table = _conform(read_batch_table(file), schema)
+            writer.write_table(table)
+            rows_written += table.num_rows
+            if remove_batches:
+                os.remove(file)  # Clean up batch file
+    os.replace(tmp_path, final_path)
+    return rows_written
+
+
+def finalize_dataset(part_files: list[str], compression: str = "snappy", schema: pa.Schema | None = None) -> int:
+    """
+    Checks the part files a dataset directory was written as. Parts are
+    left untouched when their schemas already agree; only parts whose
+    inferred types differ from the unified schema are rewritten, so the
+    directory reads as one dataset. Returns the total row count.
+    """
+    files = _existing(part_files)
+    schemas = [read_batch_schema(f) for f in files]
+    schema = schema or unify_batch_schemas(schemas)
+    rows = 0
+    for file, part_schema in zip(files, schemas):
+        if part_schema.equals(schema):
+            if file.endswith(".parquet"):
+                rows += pq.ParquetFile(file).metadata.num_rows
+            else:
+                rows += read_batch_table(file).num_rows
+            continue
+        print(f"Rewriting {os.path.basename(file)} to the unified schema")
+        table = _conform(read_batch_table(file), schema)
+        tmp_path = f"{file}.tmp"
+        if file.endswith(".parquet"):
+            pq.write_table(table, tmp_path, compression=parquet_compression(compression))
+        else:
+            feather.write_feather(table, tmp_path, compression=feather_compression(compression))
+        os.replace(tmp_path, file)
+        rows += table.num_rows
+    return rows
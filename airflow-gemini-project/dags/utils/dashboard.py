@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+import requests
+import streamlit as st
+from utils.airflow_api import AirflowClient
+from utils.telemetry import STRAGGLER_FACTOR, batch_progress, load_records, run_ids, stragglers, summarize
+
+# Streamlit panels shared by the generator apps: the progress of a running
+# DAG and the telemetry dashboard of past runs. `unit` names what the DAG
+# counts as a batch in the texts ("batches", "partitions").
+
+POLL_INTERVAL_SECONDS = 5
+
+
+@st.fragment(run_every=POLL_INTERVAL_SECONDS)
+def monitor_dag_run(client: AirflowClient, task_ids: list[str], unit: str):
+    """
+    Polls the run in the background and redraws only this fragment, so
+    the rest of the page stays usable while the DAG is running.
+    """
+    dag_run_id = st.session_state.dag_run_id
+    try:
+        progress = client.progress(dag_run_id, task_ids)
+    except requests.exceptions.RequestException as e:
+        st.warning(f"Could not reach Airflow, retrying in {POLL_INTERVAL_SECONDS}s: {e}")
+        return
+
+    # The run's batch records know the planned total before Airflow expands every
+    # mapped task, and count the batches of a pool task as they finish
+    batches = batch_progress(load_records(client.dag_id, dag_run_id))
+    total = max(progress["total"], batches["planned"])
+    done = min(max(progress["done"], batches["done"]), total)
+    failed = max(progress["failed"], batches["failed"])
+    if total:
+        text = f"{done}/{total} {unit} finished"
+        if failed:
+            text += f" ({failed} failed)"
+        st.progress(done / total, text=text)
+    else:
+        st.progress(0, text=f"Waiting for Airflow to plan the {unit}...")
+    st.caption(f"DAG run `{dag_run_id}`: {progress['state']}")
+
+    if progress["state"] in ("success", "failed"):
+        st.session_state.monitoring_dag = False
+        st.session_state.dag_run_result = progress["state"]
+        st.rerun() # Full rerun: stops polling and refreshes the file sections
+
+
+def render_telemetry_panel(dag_id: str, unit: str):
+    """
+    Per-batch metrics written by the DAG tasks (utils.telemetry): run
+    totals, a histogram of batch wall times and the straggler batches.
+    """
+    records = load_records(dag_id)
+    if not records:
+        st.caption("No metrics yet. They are recorded under data/metrics by every generation run.")
+        return
+
+    run_id = st.selectbox("Run", options=run_ids(records), key=f"telemetry_run_{dag_id}")
+    records = [r for r in records if r.get("run_id") == run_id]
+    summary = summarize(records)
+    if not summary["batches"]:
+        st.info(f"No {unit} were generated in this run (all up to date or failed).")
+        return
+
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric(f"{unit.capitalize()} Generated", f"{summary['batches']}", delta=f"{summary['failed']} failed" if summary["failed"] else None, delta_color="inverse")
+    col2.metric("Rows / Second", f"{summary['rows_per_second'] or 0:,.0f}")
+    col3.metric("Median / Max Seconds", f"{summary['median_seconds']:.1f} / {summary['max_seconds']:.1f}")
+    if summary["peak_rss_bytes"] is not None:
+        col4.metric("Peak RSS per Batch", f"{summary['peak_rss_bytes'] / 1e6:,.0f} MB",
+                    help=f"Process peak: {summary['process_peak_rss_bytes'] / 1e6:,.0f} MB")
+    else:
+        col4.metric("Process Peak RSS", f"{summary['process_peak_rss_bytes'] / 1e6:,.0f} MB",
+                    help="Peak of the worker process, which may span several batches")
+    st.caption(f"{summary['rows']:,} rows, {summary['bytes_written'] / 1e6:,.1f} MB written, "
+               f"{summary['api_calls']} API calls, {summary['api_retries']} retries, "
+               f"{summary['elapsed_seconds']:.0f}s from first start to last finish")
+
+    timed = pd.DataFrame([r for r in records if r.get("status") == "success"])
+    counts, edges = np.histogram(timed["wall_seconds"], bins=min(20, max(1, len(timed))))
+    st.markdown(f"**Wall time per {unit[:-1]} (seconds)**")
+    st.bar_chart(pd.DataFrame({unit: counts}, index=[f"{left:.1f}-{right:.1f}" for left, right in zip(edges[:-1], edges[1:])]))
+
+    slow = stragglers(records)
+    if slow:
+        st.markdown(f"**Stragglers** (over {STRAGGLER_FACTOR:g}x the median wall time)")
+        st.dataframe(
+            pd.DataFrame(slow)[["batch_id", "task", "rows", "wall_seconds", "rows_per_second", "peak_rss_bytes", "process_peak_rss_bytes", "api_calls", "api_retries"]],
+            hide_index=True
+        )
+    else:
+        st.caption(f"No stragglers: every {unit[:-1]} finished within {STRAGGLER_FACTOR:g}x the median wall time.")
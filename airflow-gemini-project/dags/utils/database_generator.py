@@ -3,6 +3,12 @@ from faker import Faker
 import datetime
 import random
 import os
+import numpy as np
+from utils.table_writer import TableWriter
+from utils.key_pool import KeyPool
+from utils.distributions import make_distribution
+from utils.vectorized import random_ints, random_datetimes
+from utils.seeding import batch_seed
 
 # DO NOT import uuid
 
@@ -13,117 +19,130 @@ BATCH_SIZE = 100000
 # 2. Initialize Faker
 fake = Faker()
 
-def main():
-    """
-    Main function to generate and save a multi-table dataset with PK/FK relationships.
-    """
-    # Ensure the output directory exists
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    print(f"Output directory '{OUTPUT_DIR}' is ready.")
-
-    # Define date ranges for data generation
-    two_years_ago = datetime.datetime.now() - datetime.timedelta(days=2 * 365)
-    one_year_ago = datetime.datetime.now() - datetime.timedelta(days=365)
-    now = datetime.datetime.now()
-
-    # --- GENERATE DIMENSION TABLES FIRST ---
-    # The generation order is stores -> products -> customers to follow the "fewer rows first" rule.
-    # All dimension tables must be generated before the fact table (sales) that depends on them.
-
-    # Table: stores (Small table, no batching needed)
-    print("\nGenerating 'stores' table...")
-    stores_rows = 1000
-    stores_data = []
-    store_id_list = []
-    for i in range(1, stores_rows + 1):
-        store_id = f"S{i:03d}"
-        store_id_list.append(store_id)
-        stores_data.append({
-            "store_id": store_id,
+# 3. Row counts from the schema. Primary keys are derived from the row
+# number, so any table (or row range of a table) can be generated on its
+# own and foreign keys only need the referenced table's row count.
+TABLE_ROWS = {
+    "stores": 1000,
+    "products": 900000,
+    "customers": 1000000,
+    "sales": 700000,
+}
+
+# 4. Key pools: each table's PKs as an integer range plus its pattern.
+# FKs are sampled from these in bulk and rendered to strings per batch.
+KEY_POOLS = {
+    "stores": KeyPool.sequential(TABLE_ROWS["stores"], "S{:03d}"),
+    "products": KeyPool.sequential(TABLE_ROWS["products"], "PROD{}", start=10001),
+    "customers": KeyPool.sequential(TABLE_ROWS["customers"], "CUST-{:04d}"),
+}
+
+# 5. Skewed FK distributions from the schema's "fk_distributions".
+# Built once here; FKs without an entry are sampled uniformly.
+FK_DISTRIBUTIONS = {
+    "sales.customer_id": make_distribution({"type": "zipf", "s": 1.1}, len(KEY_POOLS["customers"])),
+}
+
+# Define date ranges for data generation, relative to a fixed date so
+# seeded runs are reproducible
+now = datetime.datetime(2025, 1, 1)
+two_years_ago = now - datetime.timedelta(days=2 * 365)
+one_year_ago = now - datetime.timedelta(days=365)
+
+
+def stores_rows(start, stop, rng):
+    rows = []
+    for i in range(start + 1, stop + 1):
+        rows.append({
+            "store_id": f"S{i:03d}",
             "store_name": fake.company(),
             "city": fake.city(),
             "state": fake.state_abbr(),
         })
-    stores_df = pd.DataFrame(stores_data)
-    stores_df.to_parquet(os.path.join(OUTPUT_DIR, 'stores.parquet'), index=False)
-    print(f"-> Saved 'stores.parquet' with {len(stores_df)} rows.")
-
-    # Table: products (Large table, requires batching)
-    print("\nGenerating 'products' table (batched)...")
-    products_rows = 900000
-    product_id_list = []
-    product_dfs = []
-    product_batch_data = []
-    for i in range(1, products_rows + 1):
-        product_id = f"PROD{i+10000}" # Start from 10001
-        product_id_list.append(product_id)
-        product_batch_data.append({
-            "product_id": product_id,
+    return rows
+
+
+def products_rows(start, stop, rng):
+    rows = []
+    for i in range(start + 1, stop + 1):
+        rows.append({
+            "product_id": f"PROD{i+10000}", # Start from 10001
             "product_name": fake.catch_phrase(),
             "category": fake.bs(),
             "unit_price": round(random.uniform(5.0, 150.0), 2),
         })
-        if i % BATCH_SIZE == 0 or i == products_rows:
-            print(f"  ...processing batch ending at row {i}")
-            product_dfs.append(pd.DataFrame(product_batch_data))
-            product_batch_data = []
-
-    products_df = pd.concat(product_dfs, ignore_index=True)
-    products_df.to_parquet(os.path.join(OUTPUT_DIR, 'products.parquet'), index=False)
-    print(f"-> Saved 'products.parquet' with {len(products_df)} rows.")
-
-    # Table: customers (Large table, requires batching)
-    print("\nGenerating 'customers' table (batched)...")
-    customers_rows = 1000000
-    customer_id_list = []
-    customer_dfs = []
-    customer_batch_data = []
-    for i in range(1, customers_rows + 1):
-        customer_id = f"CUST-{i:04d}"
-        customer_id_list.append(customer_id)
-        customer_batch_data.append({
-            "customer_id": customer_id,
+    return rows
+
+
+def customers_rows(start, stop, rng):
+    rows = []
+    for i in range(start + 1, stop + 1):
+        rows.append({
+            "customer_id": f"CUST-{i:04d}",
             "customer_name": fake.name(),
             "email_address": fake.email(),
             "signup_date": fake.date_time_between(start_date=two_years_ago, end_date=now),
         })
-        if i % BATCH_SIZE == 0 or i == customers_rows:
-            print(f"  ...processing batch ending at row {i}")
-            customer_dfs.append(pd.DataFrame(customer_batch_data))
-            customer_batch_data = []
-
-    customers_df = pd.concat(customer_dfs, ignore_index=True)
-    customers_df.to_parquet(os.path.join(OUTPUT_DIR, 'customers.parquet'), index=False)
-    print(f"-> Saved 'customers.parquet' with {len(customers_df)} rows.")
-
-    # --- GENERATE FACT TABLE LAST ---
-    # This table uses the primary key lists generated from the dimension tables.
-
-    # Table: sales (Large table, requires batching)
-    print("\nGenerating 'sales' table (batched)...")
-    sales_rows = 700000
-    sales_dfs = []
-    sales_batch_data = []
-    for i in range(1, sales_rows + 1):
-        sales_batch_data.append({
-            "sale_id": f"SALE-{i:07d}",
-            "customer_id": random.choice(customer_id_list),
-            "product_id": random.choice(product_id_list),
-            "store_id": random.choice(store_id_list),
-            "quantity_sold": random.randint(1, 5),
-            "transaction_date": fake.date_time_between(start_date=one_year_ago, end_date=now),
-        })
-        if i % BATCH_SIZE == 0 or i == sales_rows:
-            print(f"  ...processing batch ending at row {i}")
-            sales_dfs.append(pd.DataFrame(sales_batch_data))
-            sales_batch_data = []
-            
-    sales_df = pd.concat(sales_dfs, ignore_index=True)
-    sales_df.to_parquet(os.path.join(OUTPUT_DIR, 'sales.parquet'), index=False)
-    print(f"-> Saved 'sales.parquet' with {len(sales_df)} rows.")
+    return rows
+
+
+def sales_rows(start, stop, rng):
+    n = stop - start
+    return {
+        "sale_id": KeyPool.sequential(TABLE_ROWS["sales"], "SALE-{:07d}").render(np.arange(start, stop)),
+        "customer_id": KEY_POOLS["customers"].sample_keys(rng, n, FK_DISTRIBUTIONS["sales.customer_id"]),
+        "product_id": KEY_POOLS["products"].sample_keys(rng, n),
+        "store_id": KEY_POOLS["stores"].sample_keys(rng, n),
+        "quantity_sold": random_ints(rng, 1, 5, n),
+        "transaction_date": random_datetimes(rng, one_year_ago, now, n),
+    }
+
+
+ROW_BUILDERS = {
+    "stores": stores_rows,
+    "products": products_rows,
+    "customers": customers_rows,
+    "sales": sales_rows,
+}
+
+
+def generate_table(table_name, start, stop, seed=None):
+    """
+    Yields batches (DataFrames or dicts of columns) for rows [start, stop)
+    of one table. Row i (0-based) gets sequence number i + 1 for its primary key.
+    Each batch is seeded from (seed, table_name, batch_start).
+    """
+    build_rows = ROW_BUILDERS[table_name]
+    for batch_start in range(start, stop, BATCH_SIZE):
+        batch_stop = min(batch_start + BATCH_SIZE, stop)
+        print(f"  ...processing {table_name} rows {batch_start + 1}-{batch_stop}")
+        shard_seed = batch_seed(seed, table_name, batch_start)
+        fake.seed_instance(shard_seed)
+        random.seed(shard_seed)
+        batch = build_rows(batch_start, batch_stop, np.random.default_rng(shard_seed))
+        yield batch if isinstance(batch, dict) else pd.DataFrame(batch)
+
+
+def main(seed=None):
+    """
+    Main function to generate and save a multi-table dataset with PK/FK relationships.
+    """
+    # Ensure the output directory exists
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    print(f"Output directory '{OUTPUT_DIR}' is ready.")
+
+    # The generation order is stores -> products -> customers -> sales to follow the "fewer rows first" rule.
+    # Each table is streamed batch by batch into <table>/part-00000.parquet.
+    for table_name, total_rows in TABLE_ROWS.items():
+        print(f"\nGenerating '{table_name}' table...")
+        output_path = os.path.join(OUTPUT_DIR, table_name, "part-00000.parquet")
+        with TableWriter(output_path) as writer:
+            for batch in generate_table(table_name, 0, total_rows, seed=seed):
+                writer.write_batch(batch)
+        print(f"-> Saved '{table_name}' with {writer.rows_written} rows.")
 
     print("\nAll data generation complete.")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
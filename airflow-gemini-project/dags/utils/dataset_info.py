@@ -0,0 +1,66 @@
+import glob
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+from utils.typed_schema import type_name
+
+# Dataset inspection from Parquet footers. Row counts, row groups, column
+# types and sizes are all stored in each file's footer, so inspecting a
+# dataset reads a few KB per file no matter how many rows it holds.
+# Previews read only the first record batch of the first file.
+
+PREVIEW_ROWS = 100
+
+
+def table_files(table_path: str) -> list[str]:
+    """The Parquet files of a table: the file itself, or a table directory's parts."""
+    if os.path.isdir(table_path):
+        return sorted(glob.glob(os.path.join(table_path, "*.parquet")))
+    return [table_path]
+
+
+def file_stats(path: str) -> dict:
+    """Row count, row groups, columns and sizes of one Parquet file, from its footer."""
+    metadata = pq.read_metadata(path)
+    schema = metadata.schema.to_arrow_schema()
+    return {
+        "path": path,
+        "rows": metadata.num_rows,
+        "row_groups": metadata.num_row_groups,
+        "columns": [{"name": field.name, "type": type_name(field.type)} for field in schema],
+        "bytes": os.path.getsize(path),
+        "uncompressed_bytes": sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups)),
+    }
+
+
+def dataset_stats(paths: list[str]) -> dict:
+    """
+    Exact totals over Parquet files and/or table directories: per-file
+    stats, total rows and bytes, and the column types of the first file.
+    """
+    files = [f for path in paths for f in table_files(path)]
+    stats = [file_stats(f) for f in files]
+    return {
+        "files": stats,
+        "rows": sum(s["rows"] for s in stats),
+        "bytes": sum(s["bytes"] for s in stats),
+        "uncompressed_bytes": sum(s["uncompressed_bytes"] for s in stats),
+        "columns": stats[0]["columns"] if stats else [],
+    }
+
+
+def preview(path: str, rows: int = PREVIEW_ROWS) -> pa.Table:
+    """
+    The first `rows` rows of a Parquet file or table directory. Only the
+    first row group of the first file is decoded.
+    """
+    files = table_files(path)
+    if not files:
+        return pa.table({})
+    parquet_file = pq.ParquetFile(files[0])
+    if parquet_file.metadata.num_row_groups == 0:
+        return parquet_file.schema_arrow.empty_table()
+    batch = next(parquet_file.iter_batches(batch_size=rows, row_groups=[0]), None)
+    if batch is None:
+        return parquet_file.schema_arrow.empty_table()
+    return pa.Table.from_batches([batch])
@@ -0,0 +1,79 @@
+import numpy as np
+
+# Skewed foreign-key distributions. A distribution is configured per FK in
+# the app2.py table definition as a small dict, e.g.
+#   {"type": "zipf", "s": 1.2}
+#   {"type": "pareto", "alpha": 1.16}
+#   {"type": "weights", "weights": [5, 1, 1, 3]}
+# and turned into a WeightedSampler once per module. Building one is a
+# single cumulative sum, so it is cheap even over millions of keys.
+
+DISTRIBUTION_TYPES = ["uniform", "zipf", "pareto", "weights"]
+# Explicit weights are typed in by hand, one per referenced row, so they
+# are only offered for small tables
+MAX_EXPLICIT_WEIGHTS = 1_000
+
+
+class WeightedSampler:
+    """
+    Inverse-CDF sampling over a fixed set of weights.
+
+    Building the sampler is one vectorized cumulative sum; each batch of
+    draws is one uniform array and a `searchsorted` over the CDF
+    (O(log n) per draw), with no Python loop anywhere.
+    """
+
+    def __init__(self, weights):
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.ndim != 1 or len(weights) == 0:
+            raise ValueError("Weights must be a non-empty 1-D sequence.")
+        if np.any(weights < 0) or not np.isfinite(weights).all() or weights.sum() <= 0:
+            raise ValueError("Weights must be finite, non-negative and not all zero.")
+
+        self.size = len(weights)
+        self.cdf = np.cumsum(weights)
+        self.cdf /= self.cdf[-1]
+
+    def sample(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        """Draws `n` positions in [0, size) according to the weights."""
+        positions = np.searchsorted(self.cdf, rng.random(n), side="right")
+        # Guards against cdf[-1] rounding just below a draw
+        return np.minimum(positions, self.size - 1)
+
+
+def zipf_weights(size: int, s: float = 1.1) -> np.ndarray:
+    """Weight of the k-th key is 1 / k**s: a few keys get most of the draws."""
+    return 1.0 / np.arange(1, size + 1, dtype=np.float64) ** s
+
+
+def pareto_weights(size: int, alpha: float = 1.16) -> np.ndarray:
+    """
+    Weights follow the Pareto quantile function over the keys, ranked from
+    most to least popular. alpha=1.16 gives the classic 80/20 split.
+    """
+    quantiles = (np.arange(size, dtype=np.float64) + 0.5) / size
+    return quantiles ** (-1.0 / alpha)
+
+
+def make_distribution(spec: dict | None, size: int) -> WeightedSampler | None:
+    """
+    Builds the sampler for one FK over a key pool of `size` keys.
+    Returns None for uniform sampling, which callers handle with a plain
+    `rng.integers` draw.
+    """
+    kind = (spec or {}).get("type", "uniform")
+    if kind == "uniform":
+        return None
+    if kind == "zipf":
+        return WeightedSampler(zipf_weights(size, float(spec.get("s", 1.1))))
+    if kind == "pareto":
+        return WeightedSampler(pareto_weights(size, float(spec.get("alpha", 1.16))))
+    if kind == "weights":
+        weights = spec.get("weights") or []
+        if size > MAX_EXPLICIT_WEIGHTS:
+            raise ValueError(f"Explicit weights are limited to tables of {MAX_EXPLICIT_WEIGHTS} rows, "
+                             f"this one has {size}. Use zipf or pareto instead.")
+        if len(weights) != size:
+            raise ValueError(f"Expected {size} weights (one per referenced key), got {len(weights)}.")
+        return WeightedSampler(weights)
+    raise ValueError(f"Unknown distribution type '{kind}'. Expected one of {DISTRIBUTION_TYPES}.")
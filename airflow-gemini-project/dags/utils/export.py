@@ -0,0 +1,182 @@
+import os
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from utils.combine import read_batch_schema, unify_batch_schemas
+from utils.dataset_info import table_files
+from utils.manifest import Manifest, content_hash
+from utils.typed_schema import cast_to_schema
+
+# Download artifacts built from generated Parquet files. Exports stream
+# record batches from one file at a time through an Arrow CSV writer into
+# a compressed stream, so memory stays bounded by one record batch no
+# matter how many rows the dataset has. Each export is recorded in the
+# manifest of its own directory together with a fingerprint of its source
+# files; the UI only offers an export whose fingerprint is still current.
+# Multi-table exports (one CSV per table) are built the same way into a
+# ZIP on disk.
+
+EXPORT_BATCH_ROWS = 64_000
+ZIP_MAX_WORKERS = 4
+ZIP_COPY_CHUNK_BYTES = 1 << 20
+
+
+def source_fingerprint(parquet_files: list[str]) -> str:
+    """
+    Hash of the source files' names, sizes and modification times:
+    cheap to compute on every page load, and it changes whenever a batch
+    is regenerated.
+    """
+    parts = []
+    for path in sorted(parquet_files):
+        stat = os.stat(path)
+        parts.append([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+    return content_hash(parts)
+
+
+def _temp_path(output_path: str) -> str:
+    """
+    A new, uniquely named file next to `output_path`, so concurrent
+    exports of the same file never write to the same temporary file.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(output_path)}.", suffix=".tmp",
+                                    dir=os.path.dirname(output_path) or ".")
+    os.close(fd)
+    os.chmod(tmp_path, 0o644)  # mkstemp creates 0600; the apps read exports as another process
+    return tmp_path
+
+
+def _write_csv(files: list[str], sink, schema: pa.Schema) -> int:
+    """
+    Streams the Parquet `files` into `sink` as one CSV with a single
+    header, one record batch at a time. Returns the number of rows.
+    """
+    rows = 0
+    with pa_csv.CSVWriter(sink, schema) as writer:
+        for path in files:
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=EXPORT_BATCH_ROWS):
+                table = pa.Table.from_batches([batch])
+                if not table.schema.remove_metadata().equals(schema):
+                    table = cast_to_schema(table, schema)
+                writer.write_table(table)
+                rows += table.num_rows
+    return rows
+
+
+def export_csv_gz(parquet_files: list[str], output_path: str, compression: str = "gzip") -> dict:
+    """
+    Streams `parquet_files` (in sorted order) into one compressed CSV
+    with a single header, then records it in the manifest next to
+    `output_path`. Returns the manifest entry.
+    """
+    files = sorted(parquet_files)
+    if not files:
+        raise ValueError("No Parquet files to export")
+
+    fingerprint = source_fingerprint(files)
+    schema = pq.read_schema(files[0]).remove_metadata()
+    output_dir = os.path.dirname(output_path) or "."
+    os.makedirs(output_dir, exist_ok=True)
+    tmp_path = _temp_path(output_path)
+    try:
+        with pa.CompressedOutputStream(tmp_path, compression) as sink:
+            rows = _write_csv(files, sink, schema)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, output_path)
+
+    manifest = Manifest(output_dir)
+    manifest.record_export(output_path, fingerprint, rows, source_files=len(files), columns=len(schema))
+    print(f"Exported {rows} rows from {len(files)} files to {output_path}")
+    return manifest.get(output_path)
+
+
+def current_export(output_path: str, parquet_files: list[str]) -> dict | None:
+    """
+    The manifest entry of `output_path` if it exists and was built from
+    exactly these source files; None if it is missing or outdated.
+    """
+    if not parquet_files:
+        return None
+    return _current_entry(output_path, source_fingerprint(parquet_files))
+
+
+def _current_entry(output_path: str, fingerprint: str) -> dict | None:
+    if not os.path.exists(output_path):
+        return None
+    entry = Manifest(os.path.dirname(output_path) or ".").get(output_path)
+    if entry is None or entry.get("source_fingerprint") != fingerprint:
+        return None
+    if os.path.getsize(output_path) != entry.get("bytes"):
+        return None
+    return entry
+
+
+# --- Multi-table ZIP ---
+
+def tables_fingerprint(tables: dict[str, str]) -> str:
+    """Fingerprint of {table name: table path}, covering every part file."""
+    return content_hash([[name, source_fingerprint(table_files(path))] for name, path in sorted(tables.items())])
+
+
+def _table_to_csv(name: str, table_path: str, csv_path: str) -> int:
+    files = table_files(table_path)
+    schema = unify_batch_schemas([read_batch_schema(f) for f in files])
+    with pa.OSFile(csv_path, "wb") as sink:
+        return _write_csv(files, sink, schema)
+
+
+def export_zip(tables: dict[str, str], output_path: str, max_workers: int = ZIP_MAX_WORKERS) -> dict:
+    """
+    Builds a ZIP with one `<name>.csv` per table on disk. Tables are
+    converted to CSV in parallel (Arrow writes them without holding the
+    GIL) into a temporary directory next to `output_path`, then each CSV
+    is deflated into the archive in chunks. Neither a table nor the
+    archive is ever held in memory. Returns the manifest entry.
+    """
+    if not tables:
+        raise ValueError("No tables to export")
+
+    fingerprint = tables_fingerprint(tables)
+    output_dir = os.path.dirname(output_path) or "."
+    os.makedirs(output_dir, exist_ok=True)
+    work_dir = tempfile.mkdtemp(prefix=".zip_export_", dir=output_dir)
+    tmp_path = _temp_path(output_path)
+    names = sorted(tables)
+    try:
+        csv_paths = {name: os.path.join(work_dir, f"{name}.csv") for name in names}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            rows = dict(zip(names, executor.map(
+                lambda name: _table_to_csv(name, tables[name], csv_paths[name]), names)))
+
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as zip_f:
+            for name in names:
+                with open(csv_paths[name], "rb") as src, zip_f.open(f"{name}.csv", "w", force_zip64=True) as dst:
+                    shutil.copyfileobj(src, dst, ZIP_COPY_CHUNK_BYTES)
+                os.remove(csv_paths[name])
+        os.replace(tmp_path, output_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    manifest = Manifest(output_dir)
+    manifest.record_export(output_path, fingerprint, sum(rows.values()), tables=rows)
+    print(f"Exported {len(names)} tables ({sum(rows.values())} rows) to {output_path}")
+    return manifest.get(output_path)
+
+
+def current_zip_export(output_path: str, tables: dict[str, str]) -> dict | None:
+    """
+    The manifest entry of the ZIP at `output_path` if it was built from
+    exactly these tables' current files; None if it is missing or outdated.
+    """
+    if not tables:
+        return None
+    return _current_entry(output_path, tables_fingerprint(tables))
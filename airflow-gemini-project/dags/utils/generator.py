@@ -1,18 +1,37 @@
 from faker import Faker
-from uuid import uuid4
-from datetime import datetime
+from datetime import datetime, timedelta
 import random
+import numpy as np
+from utils.vectorized import faker_pool, sample_joined, unique_emails, random_ints, random_datetimes, bulk_uuids
 
 fake = Faker()
 
+# Fixed reference date so seeded runs are reproducible (never use datetime.now())
+REFERENCE_DATE = datetime(2025, 1, 1)
+
 def generate_data():
     """
     Generates a single synthetic student record.
     """
     return {
-        'student_id': str(uuid4()),
+        'student_id': fake.uuid4(),
         'full_name': fake.name(),
-        'date_of_birth': fake.date_time_between(start_date='-18y', end_date='-5y'),
+        'date_of_birth': fake.date_time_between(start_date=REFERENCE_DATE - timedelta(days=18 * 365), end_date=REFERENCE_DATE - timedelta(days=5 * 365)),
         'grade_level': random.randint(1, 12),
         'student_email': fake.email()
-    }
\ No newline at end of file
+    }
+
+def generate_batch(n, seed, start=0):
+    """
+    Generates `n` synthetic student records as columns, for rows
+    `start` to `start + n` of the dataset.
+    """
+    rng = np.random.default_rng(seed)
+    fake.seed_instance(seed)
+    return {
+        'student_id': bulk_uuids(rng, n),
+        'full_name': sample_joined(rng, [faker_pool(fake, 'first_name'), faker_pool(fake, 'last_name')], n),
+        'date_of_birth': random_datetimes(rng, REFERENCE_DATE - timedelta(days=18 * 365), REFERENCE_DATE - timedelta(days=5 * 365), n),
+        'grade_level': random_ints(rng, 1, 12, n),
+        'student_email': unique_emails(rng, faker_pool(fake, 'email'), n, start)
+    }
@@ -0,0 +1,79 @@
+import re
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from utils.distributions import WeightedSampler
+
+# A "{}" / "{:04d}" placeholder with an optional literal prefix and suffix,
+# e.g. "CUST-{:04d}" or "PROD{}". These are rendered with Arrow compute
+# kernels; any other str.format pattern falls back to a Python loop.
+_SIMPLE_PATTERN = re.compile(r"^(?P<prefix>[^{}]*)\{(?::(?P<zero>0?)(?P<width>\d*)d?)?\}(?P<suffix>[^{}]*)$")
+
+
+class KeyPool:
+    """
+    The primary keys of one table, stored compactly.
+
+    Sequential keys are kept as an integer range plus a format pattern
+    (e.g. `KeyPool.sequential(1_000_000, "CUST-{:04d}")`) instead of a
+    list of a million strings. Arbitrary keys can be wrapped as an Arrow
+    string array with `KeyPool.from_values()`.
+
+    Foreign keys are sampled in bulk as integer positions into the pool
+    and only turned into key values by `render()`, right before a batch
+    is written. Pass an WeightedSampler (see utils.distributions) to sample
+    keys with a skewed distribution instead of uniformly.
+    """
+
+    def __init__(self, size: int, pattern: str | None = None, start: int = 1, values: pa.Array | None = None):
+        self.size = int(size)
+        self.pattern = pattern
+        self.start = int(start)
+        self.values = values
+        if self.size <= 0:
+            raise ValueError("A key pool needs at least one key.")
+
+    @classmethod
+    def sequential(cls, size: int, pattern: str | None = None, start: int = 1) -> "KeyPool":
+        """Keys `start .. start + size - 1`, optionally formatted with `pattern`."""
+        return cls(size, pattern=pattern, start=start)
+
+    @classmethod
+    def from_values(cls, values) -> "KeyPool":
+        """Wraps an explicit list/array of keys."""
+        values = values if isinstance(values, pa.Array) else pa.array(values)
+        return cls(len(values), values=values)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def sample(self, rng: np.random.Generator, n: int, distribution: WeightedSampler | None = None) -> np.ndarray:
+        """Draws `n` random positions into the pool (uniform unless a distribution is given)."""
+        if distribution is None:
+            return rng.integers(0, self.size, size=n)
+        if distribution.size != self.size:
+            raise ValueError(f"Distribution covers {distribution.size} keys, pool has {self.size}.")
+        return distribution.sample(rng, n)
+
+    def render(self, positions: np.ndarray) -> pa.Array:
+        """Turns pool positions into key values (Arrow strings or integers)."""
+        if self.values is not None:
+            return self.values.take(pa.array(positions))
+
+        numbers = np.asarray(positions, dtype=np.int64) + self.start
+        if self.pattern is None:
+            return pa.array(numbers)
+
+        match = _SIMPLE_PATTERN.match(self.pattern)
+        if match is None:
+            return pa.array([self.pattern.format(k) for k in numbers.tolist()], type=pa.string())
+
+        digits = pc.cast(pa.array(numbers), pa.string())
+        if match.group("width"):
+            padding = "0" if match.group("zero") else " "
+            digits = pc.utf8_lpad(digits, width=int(match.group("width")), padding=padding)
+        return pc.binary_join_element_wise(match.group("prefix"), digits, match.group("suffix"), "")
+
+    def sample_keys(self, rng: np.random.Generator, n: int, distribution: WeightedSampler | None = None) -> pa.Array:
+        """Samples `n` foreign key values in one vectorized step."""
+        return self.render(self.sample(rng, n, distribution))
@@ -0,0 +1,129 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import time
+
+# A manifest lives next to the generated files and records, per file, what
+# produced it: the hash of the generator code/definition, the seed, the
+# row count and a checksum of the file itself. A file whose recorded inputs
+# match the current ones (and whose checksum still matches) does not need
+# to be generated again. Exports built from other files record a
+# fingerprint of their sources instead (record_export).
+
+MANIFEST_FILE_NAME = "_manifest.json"
+
+
+def content_hash(*parts) -> str:
+    """sha256 over strings/bytes/JSON-serializable parts, in order."""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        elif not isinstance(part, bytes):
+            part = json.dumps(part, sort_keys=True, default=str).encode("utf-8")
+        digest.update(hashlib.sha256(part).digest())
+    return digest.hexdigest()
+
+
+def file_checksum(path: str, chunk_size: int = 1 << 20) -> str:
+    """sha256 of a file's contents, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def module_source_hash(module) -> str:
+    """Hash of the source file a module was loaded from."""
+    with open(module.__file__, "rb") as f:
+        return content_hash(f.read())
+
+
+class Manifest:
+    """
+    JSON manifest of generated files in `directory`, keyed by path
+    relative to it. Updates take an exclusive file lock so concurrent
+    mapped tasks on the same machine can record their files safely.
+    """
+
+    def __init__(self, directory: str, file_name: str = MANIFEST_FILE_NAME):
+        self.directory = directory
+        self.path = os.path.join(directory, file_name)
+        self._lock_path = f"{self.path}.lock"
+
+    def _key(self, file_path: str) -> str:
+        return os.path.relpath(file_path, self.directory)
+
+    @contextlib.contextmanager
+    def _locked(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._lock_path, "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def load(self) -> dict:
+        """Returns all entries ({relative_path: entry})."""
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            # A broken manifest only means everything gets regenerated
+            return {}
+
+    def _save(self, entries: dict):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+    def get(self, file_path: str) -> dict | None:
+        return self.load().get(self._key(file_path))
+
+    def is_current(self, file_path: str, code_hash: str, seed, rows: int) -> bool:
+        """
+        True if `file_path` exists, was recorded with the same inputs, and
+        its contents still match the recorded checksum.
+        """
+        entry = self.get(file_path)
+        if entry is None or not os.path.exists(file_path):
+            return False
+        if (entry.get("code_hash"), entry.get("seed"), entry.get("rows")) != (code_hash, seed, rows):
+            return False
+        return file_checksum(file_path) == entry.get("checksum")
+
+    def record(self, file_path: str, code_hash: str, seed, rows: int, **extra):
+        """Adds or replaces the entry for a freshly written file."""
+        self._record(file_path, {"code_hash": code_hash, "seed": seed, "rows": rows, **extra})
+
+    def record_export(self, file_path: str, source_fingerprint: str, rows: int, **extra):
+        """
+        Adds or replaces the entry for a file built from other files (e.g.
+        a download export), keyed by a fingerprint of those source files.
+        """
+        self._record(file_path, {"source_fingerprint": source_fingerprint, "rows": rows, **extra})
+
+    def _record(self, file_path: str, fields: dict):
+        entry = {
+            **fields,
+            "checksum": file_checksum(file_path),
+            "bytes": os.path.getsize(file_path),
+            "written_at": time.time(),
+        }
+        with self._locked():
+            entries = self.load()
+            entries[self._key(file_path)] = entry
+            self._save(entries)
+
+    def forget(self, prefix: str = ""):
+        """Drops every entry whose relative path starts with `prefix`."""
+        with self._locked():
+            entries = {k: v for k, v in self.load().items() if not k.startswith(prefix)}
+            self._save(entries)
@@ -0,0 +1,62 @@
+import importlib.util
+import os
+import sys
+import time
+from utils.manifest import content_hash
+
+# Loads the AI-generated generator modules at most once per process for a
+# given file version. `importlib.reload()` re-executes the module's top-level
+# code (including the slow `Faker()` construction) on every call; here the
+# module is only executed again when the file saved from Streamlit actually
+# changed, checked by mtime first and by content hash second.
+
+_CACHE = {}  # path -> {"mtime_ns", "size", "hash", "module"}
+
+
+def load_module_from_file(path: str, module_name: str):
+    """
+    Returns the module for `path`, executing it only if this process has
+    not loaded the same file contents before. The module is registered in
+    sys.modules under `module_name`.
+    """
+    stat = os.stat(path)
+    cached = _CACHE.get(path)
+    if cached and (cached["mtime_ns"], cached["size"]) == (stat.st_mtime_ns, stat.st_size):
+        return cached["module"]
+
+    with open(path, "rb") as f:
+        source_hash = content_hash(f.read())
+    if cached and cached["hash"] == source_hash:
+        # Touched but not changed: keep the loaded module
+        cached.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        return cached["module"]
+
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except Exception:
+        sys.modules.pop(module_name, None)
+        raise
+
+    _CACHE[path] = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "hash": source_hash, "module": module}
+    return module
+
+
+def load_generator(module_name: str):
+    """
+    Loads an importable module (e.g. "utils.generator") through the cache
+    and logs how long it took, so task startup cost is visible in the logs.
+    """
+    start = time.perf_counter()
+    spec = importlib.util.find_spec(module_name)
+    if spec is None or spec.origin is None:
+        raise ImportError(f"Cannot find generator module '{module_name}'")
+
+    previous = _CACHE.get(spec.origin, {}).get("module")
+    module = load_module_from_file(spec.origin, module_name)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    state = "cache hit" if module is previous else "executed"
+    print(f"Loaded {module_name} in {elapsed_ms:.1f} ms ({state})")
+    return module
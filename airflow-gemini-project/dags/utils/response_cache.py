@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+import time
+from utils.manifest import content_hash
+
+# Disk cache for Gemini responses, shared by the Streamlit apps and the DAG
+# tasks. Entries are addressed by a hash of everything that determines the
+# answer (model, prompt, generation config, seed), so re-clicking "Generate
+# Code", retrying a failed batch or re-running a sample preview returns the
+# stored text instead of calling the API again.
+#
+# Callers pass `validate` so that only responses they can use are stored; a
+# stored response that no longer validates is deleted and fetched again.
+#
+# Set GEMINI_CACHE_DISABLED=1 (or pass bypass=True) to always call the API.
+
+log = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get("GEMINI_CACHE_DIR", "/opt/airflow/data/gemini_cache")
+CACHE_MAX_BYTES = int(os.environ.get("GEMINI_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+CACHE_TTL_SECONDS = int(os.environ.get("GEMINI_CACHE_TTL_SECONDS", 7 * 24 * 3600))
+EVICT_INTERVAL_SECONDS = int(os.environ.get("GEMINI_CACHE_EVICT_INTERVAL_SECONDS", 600))
+EVICT_AFTER_FRACTION = 0.05  # Also evict once a process has written this share of max_bytes
+
+
+def cache_disabled() -> bool:
+    return os.environ.get("GEMINI_CACHE_DISABLED", "").lower() in ("1", "true", "yes")
+
+
+class ResponseCache:
+    """
+    One JSON file per response under `directory`, sharded by the first
+    two hex digits of the key. Entries older than `ttl_seconds` are
+    ignored and deleted; when the cache grows past `max_bytes`, the
+    least recently used entries are evicted.
+
+    Eviction walks the whole cache, so put() only runs it when the last
+    eviction (by any process, see the .last_evict marker) is older than
+    `evict_interval` seconds, or when this process has written more than
+    EVICT_AFTER_FRACTION of max_bytes since its last eviction.
+    """
+
+    _written_since_evict: dict[str, int] = {}  # Bytes per directory, shared by instances of a process
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES,
+                 ttl_seconds: int = CACHE_TTL_SECONDS, evict_interval: int = EVICT_INTERVAL_SECONDS):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.evict_interval = evict_interval
+
+    @staticmethod
+    def key(model: str, prompt: str, generation_config: dict | None = None, seed=None) -> str:
+        return content_hash(model, prompt, generation_config or {}, seed)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def get(self, key: str) -> str | None:
+        """Returns the cached text, or None if missing or expired."""
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+        if time.time() - entry.get("created", 0) > self.ttl_seconds:
+            self._remove(path)
+            return None
+        os.utime(path)  # mark as recently used
+        return entry.get("text")
+
+    def put(self, key: str, text: str, **metadata):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"created": time.time(), "text": text, **metadata}, f)
+            size = f.tell()
+        os.replace(tmp_path, path)
+        written = self._written_since_evict.get(self.directory, 0) + size
+        self._written_since_evict[self.directory] = written
+        if self._eviction_due(written):
+            self.evict()
+
+    def delete(self, key: str):
+        self._remove(self._path(key))
+
+    def _marker_path(self) -> str:
+        return os.path.join(self.directory, ".last_evict")
+
+    def _eviction_due(self, written: int) -> bool:
+        if written > self.max_bytes * EVICT_AFTER_FRACTION:
+            return True
+        try:
+            return time.time() - os.stat(self._marker_path()).st_mtime > self.evict_interval
+        except OSError:
+            return True  # Never evicted
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def evict(self):
+        """Drops expired entries, then the least recently used ones until under max_bytes."""
+        entries = []
+        now = time.time()
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".json"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if now - stat.st_mtime > self.ttl_seconds:
+                    self._remove(path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+        self._written_since_evict[self.directory] = 0
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._marker_path(), "w"):
+            pass
+
+
+def _usable(text: str | None, validate) -> bool:
+    """True if `text` is non-empty and passes `validate` (False or an exception means it does not)."""
+    if not text:
+        return False
+    if validate is None:
+        return True
+    try:
+        return bool(validate(text))
+    except Exception as e:
+        log.info(f"Gemini response failed validation: {e}")
+        return False
+
+
+def _get_valid(cache: ResponseCache, key: str, validate) -> str | None:
+    """Cached text that still validates; an entry that does not is deleted."""
+    text = cache.get(key)
+    if text is not None and not _usable(text, validate):
+        log.warning(f"Dropping cached Gemini response {key[:12]} that failed validation")
+        cache.delete(key)
+        return None
+    return text
+
+
+def _store(cache: ResponseCache, key: str, text: str, model: str):
+    try:
+        cache.put(key, text, model=model)
+    except OSError as e:
+        # A read-only or full disk must not fail the generation itself
+        log.warning(f"Could not store Gemini response in cache: {e}")
+
+
+def cached_generate(call, model: str, prompt: str, generation_config: dict | None = None, seed=None,
+                    bypass: bool = False, cache: ResponseCache | None = None, validate=None) -> str:
+    """
+    Returns the cached response for (model, prompt, generation_config,
+    seed), or runs `call()` and stores its text if `validate(text)`
+    accepts it. Hits and misses are logged with their timings.
+    """
+    if bypass or cache_disabled():
+        return call()
+
+    cache = cache or ResponseCache()
+    key = cache.key(model, prompt, generation_config, seed)
+    start = time.perf_counter()
+    text = _get_valid(cache, key, validate)
+    if text is not None:
+        log.info(f"Gemini cache hit {key[:12]} ({model}) in {(time.perf_counter() - start) * 1000:.1f} ms")
+        return text
+
+    text = call()
+    log.info(f"Gemini cache miss {key[:12]} ({model}), API call took {time.perf_counter() - start:.1f} s")
+    if _usable(text, validate):
+        _store(cache, key, text, model)
+    return text
+
+
+def cached_generate_many(call_many, model: str, prompts: list[str], generation_config: dict | None = None,
+                         seeds: list | None = None, bypass: bool = False,
+                         cache: ResponseCache | None = None, validate=None) -> list[str]:
+    """
+    Like cached_generate for a list of prompts: cached responses are
+    returned directly and only the misses are sent, together, through
+    `call_many(prompts)`. Results are in prompt order.
+    """
+    seeds = seeds if seeds is not None else [None] * len(prompts)
+    if bypass or cache_disabled():
+        return list(call_many(prompts))
+
+    cache = cache or ResponseCache()
+    keys = [cache.key(model, prompt, generation_config, seed) for prompt, seed in zip(prompts, seeds)]
+    texts = [_get_valid(cache, key, validate) for key in keys]
+    missing = [i for i, text in enumerate(texts) if text is None]
+    log.info(f"Gemini cache: {len(prompts) - len(missing)} hits, {len(missing)} misses ({model})")
+    if not missing:
+        return texts
+
+    for i, text in zip(missing, call_many([prompts[i] for i in missing])):
+        texts[i] = text
+        if _usable(text, validate):
+            _store(cache, keys[i], text, model)
+    return texts
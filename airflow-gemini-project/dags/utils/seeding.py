@@ -0,0 +1,50 @@
+import random
+import zlib
+import numpy as np
+
+# Deterministic, shardable seeding. A run has one `seed` (from the DAG run
+# conf); every (table, batch_id) shard gets its own independent stream
+# derived from it with NumPy's SeedSequence, so any shard can be
+# regenerated on its own, in any order, and produce the same rows.
+
+
+def stream_key(name: str) -> int:
+    """Stable integer for a table/stream name (hash() is salted per process)."""
+    return zlib.crc32(name.encode("utf-8"))
+
+
+def resolve_run_seed(conf: dict | None, run_id: str) -> int:
+    """
+    The run-level seed: `conf["seed"]` if given, otherwise derived from the
+    run_id so that task retries within one run still reproduce their rows.
+    """
+    conf = conf or {}
+    if conf.get("seed") is not None:
+        return int(conf["seed"])
+    return stream_key(run_id)
+
+
+def batch_seed_sequence(run_seed: int | None, table: str, batch_id: int) -> np.random.SeedSequence:
+    """
+    The SeedSequence for one shard; equivalent to a `spawn()` child keyed
+    by (table, batch_id). A None run_seed draws fresh OS entropy.
+    """
+    return np.random.SeedSequence(run_seed, spawn_key=(stream_key(table), int(batch_id)))
+
+
+def batch_seed(run_seed: int | None, table: str, batch_id: int) -> int:
+    """A 63-bit integer seed for one shard, usable by NumPy, Faker and `random`."""
+    state = batch_seed_sequence(run_seed, table, batch_id).generate_state(2, dtype=np.uint32)
+    return (int(state[0]) << 31) ^ int(state[1])
+
+
+def seed_module(module, seed: int):
+    """
+    Seeds the global state used by per-row generator code: `random`,
+    NumPy's legacy global generator and the module's `fake` instance.
+    """
+    random.seed(seed)
+    np.random.seed(seed % 2**32)
+    fake = getattr(module, "fake", None)
+    if fake is not None:
+        fake.seed_instance(seed)
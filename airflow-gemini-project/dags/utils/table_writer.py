@@ -0,0 +1,89 @@
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+from utils.vectorized import to_arrow_table
+
+
+class TableWriter:
+    """
+    Streams one table into a single Parquet file, one row group per batch.
+
+    The schema is fixed by the first batch (or passed in explicitly) and
+    every later batch is cast to it, so memory stays bounded by one batch
+    no matter how many rows the table has. The file is written under a
+    temporary name and only renamed into place once it is closed cleanly.
+
+    Usage:
+        with TableWriter(os.path.join(OUTPUT_DIR, "sales.parquet")) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+    """
+
+    def __init__(self, path: str, schema: pa.Schema | None = None, compression: str = "snappy"):
+        self.path = path
+        self.schema = schema
+        self.compression = compression
+        self.rows_written = 0
+        self._tmp_path = f"{path}.tmp"
+        self._writer = None
+        self._closed = False
+
+    def write_batch(self, batch) -> int:
+        """
+        Appends a batch (DataFrame, dict of columns or Arrow table) as a
+        new row group. Returns the number of rows written.
+        """
+        if self._closed:
+            raise ValueError(f"{self.path} is already closed")
+        table = to_arrow_table(batch)
+        if self.schema is None:
+            self.schema = table.schema.remove_metadata()
+        table = table.select(self.schema.names).cast(self.schema)
+
+        if self._writer is None:
+            self._open()
+
+        self._writer.write_table(table, row_group_size=max(table.num_rows, 1))
+        self.rows_written += table.num_rows
+        return table.num_rows
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._writer = pq.ParquetWriter(self._tmp_path, self.schema, compression=self.compression)
+
+    def close(self):
+        """
+        Finalizes the Parquet footer and moves the file into place. Closing
+        again (e.g. an explicit close() inside a `with` block) does nothing.
+        """
+        if self._closed:
+            return
+        if self._writer is None:
+            if self.schema is None:
+                raise ValueError(f"No batches were written to {self.path}")
+            # Still produce a valid (empty) file with the declared schema
+            self._open()
+        self._writer.close()
+        self._writer = None
+        os.replace(self._tmp_path, self.path)
+        self._closed = True
+
+    def abort(self):
+        """Discards a partially written file."""
+        if self._closed:
+            return
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if os.path.exists(self._tmp_path):
+            os.remove(self._tmp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
@@ -0,0 +1,246 @@
+import contextlib
+import fcntl
+import json
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+from collections import Counter
+
+# Per-batch metrics written by the generation tasks and read by the
+# Streamlit dashboards. Each finished batch (or partition) appends one JSON
+# line to <METRICS_DIR>/<dag_id>.jsonl with its row count, wall time,
+# rows/sec, peak RSS, bytes written and the API calls/retries made while it
+# ran. Lines are appended under a file lock, so concurrent tasks on the same
+# machine can share a file.
+#
+# Memory is recorded twice: peak_rss_bytes is the peak of the batch itself
+# (the process high-water mark is reset when a batch starts; None where
+# that is not supported), process_peak_rss_bytes the peak of the whole
+# process so far, which for a pool worker covers all its earlier batches.
+#
+# API calls and retries are counted where they happen (count("api_calls"))
+# and attributed to the batch that is being tracked in that process.
+#
+# The planning task of a run also appends a "planned" record with the number
+# of batches per task, so the apps can show progress for batches that run
+# inside one task (pool mode) or in tasks Airflow has not expanded yet.
+
+METRICS_DIR = os.environ.get("GENERATION_METRICS_DIR", "/opt/airflow/data/metrics")
+STRAGGLER_FACTOR = 2.0  # A batch this many times slower than the median is a straggler
+FINISHED_STATUSES = ("success", "up_to_date")
+
+_counters = Counter()
+_counters_lock = threading.Lock()
+_process_peak = 0  # Survives reset_peak_rss(), which also lowers ru_maxrss
+
+
+def count(name: str, n: int = 1):
+    """Adds `n` to a process-wide counter (e.g. "api_calls", "api_retries")."""
+    with _counters_lock:
+        _counters[name] += n
+
+
+def counters() -> dict:
+    with _counters_lock:
+        return dict(_counters)
+
+
+def process_peak_rss_bytes() -> int:
+    """High-water mark of this process's resident memory over its lifetime."""
+    global _process_peak
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    _process_peak = max(_process_peak, peak if sys.platform == "darwin" else peak * 1024)
+    return _process_peak
+
+
+def reset_peak_rss() -> bool:
+    """
+    Resets the high-water mark reported by peak_rss_bytes() (Linux 4.0+).
+    Returns False where that is not supported.
+    """
+    process_peak_rss_bytes()  # Keep the lifetime peak before it is reset
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes() -> int | None:
+    """Resident memory high-water mark since the last reset_peak_rss() (VmHWM), or None."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def metrics_path(dag_id: str, metrics_dir: str = METRICS_DIR) -> str:
+    return os.path.join(metrics_dir, f"{dag_id}.jsonl")
+
+
+def append_record(dag_id: str, record: dict, metrics_dir: str = METRICS_DIR):
+    os.makedirs(metrics_dir, exist_ok=True)
+    line = json.dumps(record, default=str) + "\n"
+    with open(metrics_path(dag_id, metrics_dir), "a", encoding="utf-8") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.write(line)
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+@contextlib.contextmanager
+def track(dag_id: str, task: str, batch_id, run_id: str | None = None, metrics_dir: str = METRICS_DIR, **fields):
+    """
+    Measures the block and appends its record when it exits. The block
+    fills in the yielded dict: "rows" and "output_path" (bytes written are
+    taken from it), or "status" (e.g. "up_to_date"). Failures are recorded
+    with status "failed" and re-raised. Telemetry errors never fail a task.
+    """
+    metrics = {"rows": 0, "status": "success", **fields}
+    peak_is_per_batch = reset_peak_rss()
+    before = counters()
+    start = time.perf_counter()
+    started_at = time.time()
+    try:
+        yield metrics
+    except Exception as e:
+        metrics["status"] = "failed"
+        metrics["error"] = f"{e.__class__.__name__}: {e}"
+        raise
+    finally:
+        wall_seconds = time.perf_counter() - start
+        after = counters()
+        output_path = metrics.pop("output_path", None)
+        record = {
+            "dag_id": dag_id,
+            "run_id": run_id,
+            "task": task,
+            "batch_id": batch_id,
+            "started_at": started_at,
+            "wall_seconds": round(wall_seconds, 3),
+            "rows_per_second": round(metrics["rows"] / wall_seconds, 1) if wall_seconds > 0 else None,
+            "peak_rss_bytes": peak_rss_bytes() if peak_is_per_batch else None,
+            "process_peak_rss_bytes": process_peak_rss_bytes(),
+            "bytes_written": _size(output_path),
+            "api_calls": after.get("api_calls", 0) - before.get("api_calls", 0),
+            "api_retries": after.get("api_retries", 0) - before.get("api_retries", 0),
+            "pid": os.getpid(),
+            **metrics,
+        }
+        try:
+            append_record(dag_id, record, metrics_dir)
+        except OSError as e:
+            print(f"Could not write metrics for batch {batch_id}: {e}")
+
+
+def record_plan(dag_id: str, run_id: str, planned: dict[str, int], metrics_dir: str = METRICS_DIR):
+    """Records how many batches each task of a run will process ({task_id: batches})."""
+    record = {"dag_id": dag_id, "run_id": run_id, "task": None, "batch_id": None, "status": "planned",
+              "planned": planned, "started_at": time.time()}
+    try:
+        append_record(dag_id, record, metrics_dir)
+    except OSError as e:
+        print(f"Could not write the batch plan of run {run_id}: {e}")
+
+
+def batch_progress(records: list[dict]) -> dict:
+    """
+    Progress of one run from its records: planned, finished and failed
+    batches of the tasks in its plan. A batch counts once, however often
+    it was retried; a failure that was retried successfully is not counted.
+    """
+    planned = {}
+    for record in records:
+        if record.get("status") == "planned":
+            planned.update(record.get("planned", {}))
+    done, failed = set(), set()
+    for record in records:
+        if record.get("task") not in planned:
+            continue
+        key = (record["task"], record.get("batch_id"))
+        if record.get("status") in FINISHED_STATUSES:
+            done.add(key)
+        elif record.get("status") == "failed":
+            failed.add(key)
+    return {"planned": sum(planned.values()), "done": len(done), "failed": len(failed - done)}
+
+
+def _size(path: str | None) -> int:
+    """Bytes of a file, or of all files under a directory; 0 if missing."""
+    if not path or not os.path.exists(path):
+        return 0
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path)
+
+
+def load_records(dag_id: str, run_id: str | None = None, metrics_dir: str = METRICS_DIR) -> list[dict]:
+    """All records of a DAG (optionally one run), skipping unreadable lines."""
+    path = metrics_path(dag_id, metrics_dir)
+    if not os.path.exists(path):
+        return []
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if run_id is None or record.get("run_id") == run_id:
+                records.append(record)
+    return records
+
+
+def run_ids(records: list[dict]) -> list[str]:
+    """Run ids, most recently started first."""
+    latest = {}
+    for record in records:
+        latest[record.get("run_id")] = max(latest.get(record.get("run_id"), 0), record.get("started_at", 0))
+    return [run_id for run_id, _ in sorted(latest.items(), key=lambda item: item[1], reverse=True) if run_id]
+
+
+def stragglers(records: list[dict], factor: float = STRAGGLER_FACTOR) -> list[dict]:
+    """
+    Generated batches whose wall time exceeds `factor` times the median,
+    slowest first. Up-to-date and failed batches are not compared.
+    """
+    timed = [r for r in records if r.get("status") == "success"]
+    if len(timed) < 2:
+        return []
+    median = statistics.median(r["wall_seconds"] for r in timed)
+    slow = [r for r in timed if r["wall_seconds"] > factor * median]
+    return sorted(slow, key=lambda r: r["wall_seconds"], reverse=True)
+
+
+def summarize(records: list[dict]) -> dict:
+    """Totals over generated batches: rows, wall time, throughput, memory, API usage."""
+    done = [r for r in records if r.get("status") == "success"]
+    if not done:
+        return {"batches": 0}
+    wall = [r["wall_seconds"] for r in done]
+    span = max(r["started_at"] + r["wall_seconds"] for r in done) - min(r["started_at"] for r in done)
+    rows = sum(r["rows"] for r in done)
+    return {
+        "batches": len(done),
+        "failed": sum(1 for r in records if r.get("status") == "failed"),
+        "rows": rows,
+        "median_seconds": statistics.median(wall),
+        "max_seconds": max(wall),
+        "elapsed_seconds": span,
+        "rows_per_second": rows / span if span > 0 else None,
+        "peak_rss_bytes": max((r["peak_rss_bytes"] for r in done if r["peak_rss_bytes"] is not None), default=None),
+        "process_peak_rss_bytes": max(r["process_peak_rss_bytes"] for r in done),
+        "bytes_written": sum(r["bytes_written"] for r in done),
+        "api_calls": sum(r["api_calls"] for r in done),
+        "api_retries": sum(r["api_retries"] for r in done),
+    }
@@ -0,0 +1,206 @@
+import json
+import re
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+# The typed schema of a synthetic_data_generator run: column names plus
+# Arrow types, resolved once in prepare_batches and passed to every task
+# through XCom as JSON ([{"name": ..., "type": ...}]). Each batch is cast
+# to it as soon as it is produced, so all batches agree on their types and
+# combining them never has to re-infer or widen anything.
+#
+# Values that do not fit the schema are not silently nulled: cast_to_schema
+# either moves their rows to the caller's rejects or fails the batch.
+
+TYPES = {
+    "string": pa.string(),
+    "int64": pa.int64(),
+    "float64": pa.float64(),
+    "bool": pa.bool_(),
+    "date32": pa.date32(),
+    "timestamp[us]": pa.timestamp("us"),
+}
+# Column spec kinds (utils/column_spec.py) to schema types
+KIND_TYPES = {
+    "int": "int64",
+    "float": "float64",
+    "bool": "bool",
+    "date": "date32",
+    "datetime": "timestamp[us]",
+}
+# Columns whose values are identifiers and stay text even if they look numeric
+IDENTIFIER_COLUMN_PATTERN = re.compile(r"(^id$|_id$|^id_|uuid|code|zip|postal|phone|sku|account|iban|isbn|ssn)",
+                                       re.IGNORECASE)
+LEADING_ZERO_PATTERN = re.compile(r"^[+-]?0\d")
+NUMBER_PATTERN = re.compile(r"^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$")
+# One field of a sample: quoted (group 1) or bare (group 2), then its delimiter
+_SAMPLE_FIELD = re.compile(r'[ \t\r]*(?:"((?:[^"]|"")*)"|([^,\n]*?))[ \t\r]*(,|\n|$)')
+
+
+def parse_columns_from_prompt(prompt: str) -> list[str]:
+    """
+    Extracts explicit column names from a prompt such as
+    "... with columns: user_id (UUID), first_name, email".
+    """
+    m = re.search(r"columns?\s*:\s*(.+)", prompt, flags=re.IGNORECASE)
+    if not m:
+        return []
+    cols = []
+    for part in m.group(1).split(','):
+        name = re.sub(r"\(.*?\)", "", part).strip()
+        name = re.sub(r"\s+", "_", name)
+        name = name.strip(' "\'')
+        if name:
+            cols.append(name)
+    return cols
+
+
+def type_name(data_type: pa.DataType) -> str:
+    """The schema type a column of `data_type` is stored as."""
+    if pa.types.is_boolean(data_type):
+        return "bool"
+    if pa.types.is_integer(data_type):
+        return "int64"
+    if pa.types.is_floating(data_type) or pa.types.is_decimal(data_type):
+        return "float64"
+    if pa.types.is_date(data_type):
+        return "date32"
+    if pa.types.is_timestamp(data_type):
+        return "timestamp[us]"
+    return "string"
+
+
+def schema_to_json(schema: pa.Schema) -> list[dict]:
+    return [{"name": field.name, "type": type_name(field.type)} for field in schema]
+
+
+def schema_from_json(columns: list[dict]) -> pa.Schema:
+    return pa.schema([pa.field(column["name"], TYPES[column["type"]]) for column in columns])
+
+
+def string_schema(names: list[str]) -> list[dict]:
+    """Schema JSON for columns whose types are unknown."""
+    return [{"name": name, "type": "string"} for name in names]
+
+
+def _sample_rows(csv_text: str) -> list[list[tuple[str, bool]]]:
+    """Rows of (value, was_quoted) fields of a small CSV sample."""
+    text = csv_text.strip()
+    rows, row, pos = [], [], 0
+    while True:
+        m = _SAMPLE_FIELD.match(text, pos)
+        quoted = m.group(1) is not None
+        row.append((m.group(1).replace('""', '"') if quoted else m.group(2).strip(), quoted))
+        pos = m.end()
+        if m.group(3) != ",":
+            rows.append(row)
+            row = []
+            if not m.group(3):
+                return rows
+
+
+def _infer_type(name: str, fields: list[tuple[str, bool]]) -> str:
+    """
+    Schema type of one sample column. Quoted values, leading zeros and
+    identifier-like names stay strings; numbers become float64, since a
+    few sample rows cannot show that later values have no decimals.
+    """
+    values = [value for value, _ in fields if value != ""]
+    if not values or any(quoted for _, quoted in fields) or IDENTIFIER_COLUMN_PATTERN.search(name):
+        return "string"
+    if any(LEADING_ZERO_PATTERN.match(value) for value in values):
+        return "string"
+    if all(value.lower() in ("true", "false") for value in values):
+        return "bool"
+    if all(NUMBER_PATTERN.match(value) for value in values):
+        return "float64"
+    for candidate in ("date32", "timestamp[us]"):
+        try:
+            pa.array(values).cast(TYPES[candidate])
+            return candidate
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+            pass
+    return "string"
+
+
+def schema_from_csv_sample(csv_text: str, names: list[str] | None = None) -> list[dict]:
+    """
+    Schema JSON from a sample's raw CSV text (header + rows), which still
+    shows which fields the model quoted. With `names`, the sample's
+    columns are renamed to them positionally (the sample header may
+    differ from the names the batches are asked for).
+    """
+    header, *rows = _sample_rows(csv_text)
+    header = [value for value, _ in header]
+    rows = [row for row in rows if len(row) == len(header)]
+    columns = [{"name": name, "type": _infer_type(name, [row[i] for row in rows])} for i, name in enumerate(header)]
+    if names and len(names) == len(columns):
+        for column, name in zip(columns, names):
+            column["name"] = name
+    elif names:
+        by_name = {column["name"]: column["type"] for column in columns}
+        columns = [{"name": name, "type": by_name.get(name, "string")} for name in names]
+    return columns
+
+
+def schema_from_column_spec(spec: list[dict]) -> list[dict]:
+    return [{"name": column["name"], "type": KIND_TYPES.get(column["kind"], "string")} for column in spec]
+
+
+def _cast_column(column: pa.ChunkedArray, data_type: pa.DataType) -> tuple[pa.ChunkedArray, list[int]]:
+    """
+    Casts one column, treating empty strings as nulls. Returns the cast
+    column and the positions of values that could not be converted (e.g.
+    "N/A" in a number column), which are null in the result.
+    """
+    if pa.types.is_string(column.type):
+        column = pc.if_else(pc.equal(column, ""), pa.scalar(None, column.type), column)
+    try:
+        return column.cast(data_type), []
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        pass
+    values, failed = [], []
+    for i, value in enumerate(column.to_pylist()):
+        try:
+            values.append(pa.scalar(value).cast(data_type).as_py() if value is not None else None)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+            values.append(None)
+            failed.append(i)
+    return pa.chunked_array([pa.array(values, data_type)]), failed
+
+
+def cast_to_schema(table: pa.Table, schema: pa.Schema, rejects: list | None = None) -> pa.Table:
+    """
+    Conforms a batch to the run's schema: missing columns are added as
+    nulls, extra columns dropped, order fixed and every column cast.
+    Rows with values that cannot be converted are removed and appended to
+    `rejects` ({"row": None, "reason", "text"}); without a `rejects` list
+    they raise ValueError instead.
+    """
+    columns = []
+    failed_rows = {}
+    for field in schema:
+        if field.name in table.column_names:
+            column = table[field.name]
+            if column.type != field.type:
+                column, failed = _cast_column(column, field.type)
+                for i in failed:
+                    failed_rows.setdefault(
+                        i, f"column '{field.name}': {table[field.name][i].as_py()!r} is not {field.type}")
+        else:
+            column = pa.chunked_array([pa.nulls(table.num_rows, field.type)])
+        columns.append(column)
+    result = pa.Table.from_arrays(columns, schema=schema)
+    if not failed_rows:
+        return result
+
+    if rejects is None:
+        raise ValueError(f"{len(failed_rows)} rows do not fit the schema, "
+                         f"first: {failed_rows[min(failed_rows)]}")
+    positions = sorted(failed_rows)
+    for i, row in zip(positions, table.take(positions).to_pylist()):
+        rejects.append({"row": None, "reason": failed_rows[i], "text": json.dumps(row, default=str)})
+    keep = np.ones(table.num_rows, dtype=bool)
+    keep[positions] = False
+    return result.filter(pa.array(keep))
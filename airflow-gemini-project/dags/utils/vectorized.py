@@ -0,0 +1,106 @@
+import numpy as np
+import pyarrow as pa
+import pandas as pd
+
+# Helpers for the optional `generate_batch(n, seed, start)` contract of the
+# AI-generated generator module. Instead of calling Faker once per row,
+# a batch pre-draws a small pool of Faker values and samples it with NumPy,
+# so the per-row cost is a few array operations instead of Python calls.
+# A pool only holds DEFAULT_POOL_SIZE values: fields that must be unique
+# add the row number (unique_emails), and names join several pools.
+
+DEFAULT_POOL_SIZE = 1000
+
+
+def faker_pool(fake, provider: str, size: int = DEFAULT_POOL_SIZE, **kwargs) -> np.ndarray:
+    """
+    Pre-draws `size` values from a Faker provider method (e.g. "name").
+    Raises AttributeError if the provider does not exist on `fake`.
+    """
+    method = getattr(fake, provider)
+    return np.array([method(**kwargs) for _ in range(size)], dtype=object)
+
+
+def sample_pool(rng: np.random.Generator, pool: np.ndarray, n: int) -> np.ndarray:
+    """Samples `n` values (with replacement) from a pre-drawn pool."""
+    return pool[rng.integers(0, len(pool), size=n)]
+
+
+def sample_joined(rng: np.random.Generator, pools: list[np.ndarray], n: int, sep: str = " ") -> np.ndarray:
+    """
+    Joins independent samples of several pools, e.g. first and last names:
+    two pools of 1000 values give a million combinations instead of 1000.
+    """
+    joined = sample_pool(rng, pools[0], n).astype(str)
+    for pool in pools[1:]:
+        joined = np.char.add(np.char.add(joined, sep), sample_pool(rng, pool, n).astype(str))
+    return joined
+
+
+def unique_emails(rng: np.random.Generator, pool: np.ndarray, n: int, start: int = 0) -> np.ndarray:
+    """
+    Samples `n` emails from a pool and makes each unique by adding its
+    global row number (`start` + position) to the local part:
+    jsmith@example.org -> jsmith.1042@example.org.
+    """
+    local, _, domain = np.char.partition(sample_pool(rng, pool, n).astype(str), "@").T
+    numbers = np.arange(start, start + n).astype(str)
+    return np.char.add(np.char.add(np.char.add(np.char.add(local, "."), numbers), "@"), domain)
+
+
+def random_ints(rng: np.random.Generator, low: int, high: int, n: int) -> np.ndarray:
+    """Random integers in [low, high], inclusive like `random.randint`."""
+    return rng.integers(low, high + 1, size=n)
+
+
+def random_floats(rng: np.random.Generator, low: float, high: float, n: int, decimals: int | None = None) -> np.ndarray:
+    """Random floats in [low, high), like `random.uniform`."""
+    values = rng.uniform(low, high, size=n)
+    if decimals is not None:
+        values = np.round(values, decimals)
+    return values
+
+
+def random_datetimes(rng: np.random.Generator, start, end, n: int) -> np.ndarray:
+    """
+    Random timestamps between `start` and `end` (datetime objects),
+    like `fake.date_time_between()`. Returns datetime64[us] values.
+    """
+    start_us = np.datetime64(start, "us").astype(np.int64)
+    end_us = np.datetime64(end, "us").astype(np.int64)
+    return rng.integers(start_us, end_us, size=n).astype("datetime64[us]")
+
+
+def bulk_uuids(rng: np.random.Generator, n: int) -> np.ndarray:
+    """
+    Generates `n` random version-4 UUID strings in one vectorized pass.
+    """
+    raw = np.frombuffer(rng.bytes(16 * n), dtype=np.uint8).reshape(n, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40  # version 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+    hex_chars = np.frombuffer(raw.tobytes().hex().encode("ascii"), dtype="S1").reshape(n, 32)
+    with_dashes = np.insert(hex_chars, [8, 12, 16, 20], b"-", axis=1)
+    return np.ascontiguousarray(with_dashes).view("S36").ravel().astype(str)
+
+
+def to_arrow_table(batch) -> pa.Table:
+    """
+    Normalizes whatever `generate_batch()` returned into a pyarrow Table.
+    Accepts a pyarrow Table/RecordBatch, a pandas DataFrame, a dict of
+    equally long columns (Arrow arrays, NumPy arrays or lists) or a list
+    of row dicts as returned by repeated `generate_data()` calls.
+    """
+    if isinstance(batch, pa.Table):
+        return batch
+    if isinstance(batch, pa.RecordBatch):
+        return pa.Table.from_batches([batch])
+    if isinstance(batch, pd.DataFrame):
+        return pa.Table.from_pandas(batch, preserve_index=False)
+    if isinstance(batch, dict):
+        return pa.table({
+            name: values if isinstance(values, (pa.Array, pa.ChunkedArray)) else pa.array(values)
+            for name, values in batch.items()
+        })
+    if isinstance(batch, list):
+        return pa.Table.from_pandas(pd.DataFrame(batch), preserve_index=False)
+    raise TypeError(f"generate_batch() returned unsupported type: {type(batch).__name__}")
@@ -0,0 +1,92 @@
+# /scripts/benchmark_worker.py
+#
+# Offline throughput benchmark for synthetic_data_generator's LLM engine.
+# Runs the same steps as the DAG (batches through GeminiWorker, at most
+# `--concurrency` at a time like MAX_ACTIVE_TASKS, then the combine step)
+# against the deterministic stub backend, and reports rows/sec and calls/sec.
+#
+#   python scripts/benchmark_worker.py --rows 100000 --rows-per-request 200 --delay 0.5
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from gemini_worker import GeminiWorker, StubBackend
+from utils.combine import combine_feather, combine_parquet, stream_combine_csv, stream_combine_json
+from utils.typed_schema import schema_from_json
+
+COLUMNS = ["user_id", "first_name", "last_name", "email", "country", "age"]
+PROMPT = f"Generate user data with columns: {', '.join(COLUMNS)}"
+
+
+def run_benchmark(rows: int, batch_size: int, rows_per_request: int, delay: float, concurrency: int,
+                  output_format: str, max_rows: int | None = None) -> dict:
+    schema = schema_from_json([{"name": c, "type": "int64" if c == "age" else "string"} for c in COLUMNS])
+    work_dir = tempfile.mkdtemp(prefix="worker_bench_")
+    batches = [
+        {"batch_id": i, "rows": min(batch_size, rows - start),
+         "output_path": os.path.join(work_dir, f"batch_{i:04d}.{output_format}")}
+        for i, start in enumerate(range(0, rows, batch_size))
+    ]
+
+    def _run(batch):
+        worker = GeminiWorker(StubBackend(delay=delay, max_rows=max_rows))
+        worker.generate_and_save(PROMPT, output_format, batch["rows"], batch["output_path"],
+                                 rows_per_request=rows_per_request, seed=batch["batch_id"], schema=schema)
+        return worker.calls
+
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            calls = sum(executor.map(_run, batches))
+        generate_seconds = time.perf_counter() - start
+
+        final_path = os.path.join(work_dir, f"final_output.{output_format}")
+        combine = {
+            "csv": lambda files: stream_combine_csv(files, final_path, schema=schema),
+            "json": lambda files: stream_combine_json(files, final_path),
+            "parquet": lambda files: combine_parquet(files, final_path, schema=schema),
+            "feather": lambda files: combine_feather(files, final_path, schema=schema),
+        }[output_format]
+        combine_start = time.perf_counter()
+        combined_rows = combine([b["output_path"] for b in batches])
+        combine_seconds = time.perf_counter() - combine_start
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    total_seconds = generate_seconds + combine_seconds
+    return {
+        "rows": combined_rows,
+        "batches": len(batches),
+        "calls": calls,
+        "generate_seconds": round(generate_seconds, 3),
+        "combine_seconds": round(combine_seconds, 3),
+        "rows_per_second": round(combined_rows / total_seconds, 1),
+        "calls_per_second": round(calls / generate_seconds, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline throughput benchmark for GeminiWorker")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=1_000)
+    parser.add_argument("--rows-per-request", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.5, help="Simulated seconds per API call")
+    parser.add_argument("--concurrency", type=int, default=5, help="Parallel batches (MAX_ACTIVE_TASKS in the DAG)")
+    parser.add_argument("--format", default="parquet", choices=["csv", "json", "parquet", "feather"])
+    parser.add_argument("--max-rows", type=int, default=None, help="Cap rows per response to simulate truncation")
+    args = parser.parse_args()
+
+    result = run_benchmark(args.rows, args.batch_size, args.rows_per_request, args.delay,
+                           args.concurrency, args.format, args.max_rows)
+    for key, value in result.items():
+        print(f"{key:>18}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# /scripts/gemini_worker.py
+
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+import pyarrow as pa
+
+# Outside Airflow (e.g. the benchmark), make the dags folder importable
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dags"))
+from datagenerate.async_client import GeminiSession
+from datagenerate.your_utils_file import GENERATION_CONFIG, MODEL_NAME, call_gemini_text, generate_csv_rows
+from utils.combine import write_table_batch
+from utils.response_cache import cached_generate_many
+
+# "async" keeps many requests of a batch in flight, "gemini" sends them one
+# at a time through the SDK; set GEMINI_WORKER_BACKEND=stub to run the
+# pipeline without the Gemini API
+DEFAULT_BACKEND = os.environ.get("GEMINI_WORKER_BACKEND", "async")
+DEFAULT_STUB_DELAY = float(os.environ.get("GEMINI_STUB_DELAY", "0"))
+NUMERIC_COLUMN_PATTERN = re.compile(r"(age|count|qty|quantity|price|amount|salary|score|total|year)", re.IGNORECASE)
+
+
+class GeminiBackend:
+    """Sends prompts to Gemini through call_gemini_text (retries + response cache)."""
+
+    name = "gemini"
+
+    def generate(self, prompt: str, seed=None, validate=None) -> str:
+        return call_gemini_text(prompt, seed=seed, validate=validate)
+
+
+class AsyncGeminiBackend:
+    """
+    Sends all chunks of a request round concurrently through one
+    GeminiSession (pooled connections, RPM/TPM pacing, backoff on 429)
+    that lives until close(), so later rounds reuse the connections and
+    the learned rate. Responses share the disk cache with
+    call_gemini_text.
+    """
+
+    name = "async"
+
+    def __init__(self, **client_kwargs):
+        self.client_kwargs = {"model": MODEL_NAME, **client_kwargs}
+        self._session = None
+
+    def generate(self, prompt: str, seed=None, validate=None) -> str:
+        return self.generate_many([prompt], [seed], validate)[0]
+
+    def generate_many(self, prompts: list[str], seeds: list | None = None, validate=None) -> list[str]:
+        return cached_generate_many(
+            self._send, self.client_kwargs["model"], prompts, GENERATION_CONFIG, seeds=seeds, validate=validate,
+        )
+
+    def _send(self, prompts: list[str]) -> list[str]:
+        """
+        Texts in prompt order. A prompt that failed gives an empty text,
+        which generate_csv_rows requests again; if all of them failed, the
+        first error is raised.
+        """
+        if self._session is None:
+            self._session = GeminiSession(**self.client_kwargs)
+        results = self._session.generate_many(prompts)
+        failures = [result for result in results if isinstance(result, Exception)]
+        if failures and len(failures) == len(results):
+            raise failures[0]
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                print(f"[{self.name}] prompt {i} of {len(prompts)} failed: {result.__class__.__name__}: {result}")
+        return ["" if isinstance(result, Exception) else result for result in results]
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+
+class StubBackend:
+    """
+    Deterministic offline backend. Answers the worker's row prompts with
+    synthetic CSV rows for the requested columns after `delay` seconds,
+    so the pipeline can be run and benchmarked without API calls. The
+    same (prompt, seed) always gives the same text. `max_rows` caps the
+    rows per response to simulate truncation.
+    """
+
+    name = "stub"
+
+    def __init__(self, delay: float = DEFAULT_STUB_DELAY, max_rows: int | None = None):
+        self.delay = delay
+        self.max_rows = max_rows
+
+    def generate(self, prompt: str, seed=None, validate=None) -> str:
+        count = re.search(r"EXACTLY (\d+)", prompt)
+        columns = re.search(r"these columns, in this order:\s*\n\s*(.+)", prompt)
+        if not count or not columns:
+            raise ValueError("StubBackend only answers row prompts (see build_rows_prompt)")
+        num_rows = int(count.group(1))
+        if self.max_rows is not None:
+            num_rows = min(num_rows, self.max_rows)
+        names = [name.strip() for name in columns.group(1).split(",")]
+
+        digest = hashlib.sha256(json.dumps([prompt, seed], default=str).encode("utf-8")).digest()
+        rng = np.random.default_rng(int.from_bytes(digest[:8], "little"))
+        values = rng.integers(0, 100_000, size=(num_rows, len(names)))
+        lines = []
+        for row in values:
+            fields = [
+                str(value) if NUMERIC_COLUMN_PATTERN.search(name) else f'"{name}_{value}"'
+                for name, value in zip(names, row)
+            ]
+            lines.append(",".join(fields))
+
+        if self.delay:
+            time.sleep(self.delay)
+        return "\n".join(lines)
+
+
+def make_backend(name: str = DEFAULT_BACKEND, **kwargs):
+    """Returns a backend by name ("async", "gemini" or "stub")."""
+    backends = {"async": AsyncGeminiBackend, "gemini": GeminiBackend, "stub": StubBackend}
+    if name not in backends:
+        raise ValueError(f"Unknown worker backend '{name}', expected one of {sorted(backends)}")
+    return backends[name](**kwargs)
+
+
+class GeminiWorker:
+    """
+    Generates one batch of rows through a backend and saves it.
+
+    The backend only has to turn a prompt into text with
+    `generate(prompt, seed, validate)`, where `validate` decides what may
+    be cached. Backends that also have `generate_many(prompts, seeds,
+    validate)` get all chunks of a round at once. Requesting rows in
+    chunks, keeping the well-formed rows of each response and
+    re-requesting only the missing remainder is done by
+    `generate_csv_rows`. Counters for calls and timings are kept so
+    callers can report throughput.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or make_backend()
+        self.calls = 0
+        self.rows = 0
+        self.seconds = 0.0
+
+    def close(self):
+        """Releases the backend's connections (if it keeps any)."""
+        if hasattr(self.backend, "close"):
+            self.backend.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def _call(self, prompt: str, seed=None, validate=None) -> str:
+        self.calls += 1
+        return self.backend.generate(prompt, seed=seed, validate=validate)
+
+    def _call_many(self, prompts: list[str], seeds: list, validate=None) -> list[str]:
+        self.calls += len(prompts)
+        return self.backend.generate_many(prompts, seeds, validate=validate)
+
+    def generate_and_save(self, user_prompt: str, output_format: str, row_count: int, output_path: str,
+                          columns: list[str] | None = None, rows_per_request: int | None = None, seed=None,
+                          schema: pa.Schema | None = None, compression: str = "snappy",
+                          rejects_path: str | None = None) -> int:
+        """
+        Generates `row_count` rows with the given columns and writes them
+        to `output_path` in `output_format` (csv batches are header-less).
+        With a `schema`, columns and types come from it. Rejected rows are
+        written to `rejects_path` (default `<output_path>.rejects.jsonl`).
+        Returns the number of rows written.
+        """
+        columns = list(schema.names) if schema is not None else columns
+        if not columns:
+            raise ValueError("GeminiWorker needs the column names (from the prompt, the probe or the schema)")
+
+        start = time.perf_counter()
+        rejects = []
+        # Rows that do not fit the schema are rejected and requested again
+        table = generate_csv_rows(user_prompt, columns, row_count, rows_per_request=rows_per_request,
+                                  seed=seed, rejects=rejects, call_text=self._call,
+                                  call_many=self._call_many if hasattr(self.backend, "generate_many") else None,
+                                  schema=schema)
+        write_table_batch(table, output_path, output_format, compression)
+
+        if rejects:
+            with open(rejects_path or f"{output_path}.rejects.jsonl", "w", encoding="utf-8") as f:
+                for reject in rejects:
+                    f.write(json.dumps(reject, default=str) + "\n")
+
+        elapsed = time.perf_counter() - start
+        self.rows += table.num_rows
+        self.seconds += elapsed
+        print(f"[{self.backend.name}] {table.num_rows} rows in {elapsed:.2f}s "
+              f"({table.num_rows / max(elapsed, 1e-9):.0f} rows/s, {self.calls} calls so far, "
+              f"{len(rejects)} rejects) -> {output_path}")
+        return table.num_rows